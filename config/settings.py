@@ -33,6 +33,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "mailing.middleware.RequestTimingMiddleware",
+    "mailing.middleware.MetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -40,6 +42,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "mailing.middleware.ProfilingMiddleware",
 ]
 
 ROOT_URLCONF = "config.urls"
@@ -152,13 +155,23 @@ EMAIL_HOST_PASSWORD = os.getenv("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", EMAIL_HOST_USER)
 
 
+# Логи пишутся через очередь: у логгеров остаётся QueueHandler, а обработчики ниже работают в фоновом
+# потоке (mailing.log_handlers.configure_logging). LOG_QUEUE=False возвращает синхронную запись.
+LOGGING_CONFIG = "mailing.log_handlers.configure_logging"
+LOG_QUEUE = env_bool("LOG_QUEUE", True)
+# Доля успешных отправок, которые пишутся в лог построчно; итоги по рассылке пишутся при каждой записи пачки.
+LOG_SUCCESS_SAMPLE_RATE = float(os.getenv("LOG_SUCCESS_SAMPLE_RATE", 0.01))
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
     "formatters": {
         "verbose": {
             "format": "%(levelname)s %(asctime)s %(name)s %(message)s",
-        }
+        },
+        "json": {
+            "()": "mailing.log_handlers.JsonFormatter",
+        },
     },
     "handlers": {
         "console": {
@@ -167,7 +180,7 @@ LOGGING = {
         },
         "file": {
             "class": "logging.handlers.RotatingFileHandler",
-            "formatter": "verbose",
+            "formatter": "json",
             "filename": str(LOG_DIR / "app.log"),
             "maxBytes": 5 * 1024 * 1024,
             "backupCount": 5,
@@ -186,3 +199,50 @@ LOGGING = {
         },
     },
 }
+
+# Рассылки: одно SMTP-соединение обслуживает до MAILING_MESSAGES_PER_CONNECTION писем,
+# получатели обрабатываются пачками по MAILING_SEND_BATCH_SIZE.
+MAILING_MESSAGES_PER_CONNECTION = int(os.getenv("MAILING_MESSAGES_PER_CONNECTION", 500))
+MAILING_SEND_BATCH_SIZE = int(os.getenv("MAILING_SEND_BATCH_SIZE", 100))
+# Записи MailingLog сбрасываются в БД пачками: каждые MAILING_LOG_FLUSH_SIZE строк
+# или каждые MAILING_LOG_FLUSH_INTERVAL секунд.
+MAILING_LOG_FLUSH_SIZE = int(os.getenv("MAILING_LOG_FLUSH_SIZE", 500))
+MAILING_LOG_FLUSH_INTERVAL = float(os.getenv("MAILING_LOG_FLUSH_INTERVAL", 5))
+# Количество потоков отправки в run_mailing; у каждого потока своё SMTP-соединение.
+MAILING_WORKERS = int(os.getenv("MAILING_WORKERS", 1))
+# Движок отправки: "sync" (SMTP-соединения Django, при MAILING_WORKERS > 1 — пул потоков)
+# или "async" (asyncio + aiosmtplib, до MAILING_ASYNC_CONCURRENCY писем одновременно).
+MAILING_SEND_ENGINE = os.getenv("MAILING_SEND_ENGINE", "sync")
+MAILING_ASYNC_CONCURRENCY = int(os.getenv("MAILING_ASYNC_CONCURRENCY", 100))
+# send_mailings --processes N: рассылки крупнее MAILING_SHARD_SIZE клиентов делятся на шарды по диапазонам id.
+MAILING_SHARD_SIZE = int(os.getenv("MAILING_SHARD_SIZE", 10000))
+# Очередь отправки (OutboxMessage): send_mailings ставит рассылки в очередь, если MAILING_USE_OUTBOX,
+# воркеры mailing_worker забирают письма пачками; зависшие дольше MAILING_OUTBOX_LEASE секунд забираются повторно.
+MAILING_USE_OUTBOX = env_bool("MAILING_USE_OUTBOX", False)
+MAILING_OUTBOX_BATCH_SIZE = int(os.getenv("MAILING_OUTBOX_BATCH_SIZE", 100))
+MAILING_OUTBOX_LEASE = int(os.getenv("MAILING_OUTBOX_LEASE", 300))
+# Счётчики прогресса отправки рассылок хранятся в кеше MAILING_PROGRESS_TTL секунд.
+MAILING_PROGRESS_TTL = int(os.getenv("MAILING_PROGRESS_TTL", 24 * 60 * 60))
+# Адрес сайта для абсолютных ссылок в письмах ({{ unsubscribe_url }}).
+SITE_URL = os.getenv("SITE_URL", "http://127.0.0.1:8000")
+
+# Замер запросов (mailing.middleware.RequestTimingMiddleware): заголовок Server-Timing и запись в лог
+# запросов дольше REQUEST_SLOW_MS миллисекунд с REQUEST_SLOW_TOP_SQL самыми медленными SQL.
+REQUEST_TIMING = env_bool("REQUEST_TIMING", False)
+REQUEST_SLOW_MS = float(os.getenv("REQUEST_SLOW_MS", 500))
+REQUEST_SLOW_TOP_SQL = int(os.getenv("REQUEST_SLOW_TOP_SQL", 5))
+
+# Профилирование запроса по требованию (mailing.middleware.ProfilingMiddleware): staff-пользователь
+# получает отчёт cProfile и tracemalloc вместо ответа, добавив ?profile=1 или заголовок X-Profile: 1.
+# Выключено по умолчанию: профилирование замедляет весь процесс, включайте только на время разбора.
+REQUEST_PROFILING = env_bool("REQUEST_PROFILING", False)
+
+# Метрики Prometheus (/metrics): наблюдения копятся в процессе и раз в METRICS_FLUSH_INTERVAL секунд
+# складываются в кеше. Если задан METRICS_TOKEN, эндпоинт требует заголовок "Authorization: Bearer <токен>",
+# без токена отвечает только на запросы с localhost или при DEBUG.
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 10))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Время жизни кеша статистики (главная, список рассылок, отчёты), секунд. Записи сбрасываются при изменении
+# рассылок, клиентов и логов владельца (mailing/cache_versions.py), поэтому срок может быть большим.
+STATS_CACHE_TIMEOUT = int(os.getenv("STATS_CACHE_TIMEOUT", 6 * 60 * 60))
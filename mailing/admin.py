@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Client, Mailing, MailingLog, Message
+from .models import Client, Mailing, MailingLog, Message, OutboxMessage
 
 
 @admin.register(Client)
@@ -39,3 +39,10 @@ class MailingAdmin(admin.ModelAdmin):
 class MailingLogAdmin(admin.ModelAdmin):
     list_display = ("attempt_time", "status", "server_response", "mailing")
     list_filter = ("status",)
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("mailing", "client", "status", "attempts", "locked_by", "locked_at")
+    list_filter = ("status",)
+    raw_id_fields = ("mailing", "client")
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class MailingConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "mailing"
+
+    def ready(self):
+        from .cache_versions import connect_signals
+        from .metrics import SMTP_SEND_SECONDS
+        from .transport import add_send_observer
+
+        add_send_observer(SMTP_SEND_SECONDS.observe)
+        connect_signals()
@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .log_buffer import MailingLogBuffer
+from .mime import PreparedMessage
+from .models import Mailing
+from .recipients import Recipient, aiter_recipient_chunks
+from .transport import observe_send
+
+try:
+    import aiosmtplib
+except ImportError:  # aiosmtplib нужен только для MAILING_SEND_ENGINE=async
+    aiosmtplib = None
+
+logger = logging.getLogger("mailing")
+
+
+class _Session:
+    def __init__(self):
+        self.client = None
+        self.messages = 0
+
+
+class AsyncConnectionPool:
+    """
+    Пул SMTP-сессий aiosmtplib.
+
+    Сессии открываются лениво, не более size одновременно. Как и ManagedConnection, сессия
+    переоткрывается после max_messages писем, а при обрыве соединения письмо отправляется повторно.
+    """
+
+    def __init__(self, size: int, max_messages: int | None = None, max_reconnects: int = 1):
+        self.size = size
+        self.max_messages = max_messages or settings.MAILING_MESSAGES_PER_CONNECTION
+        self.max_reconnects = max_reconnects
+        self.connections_opened = 0
+        self.messages_sent = 0
+        self._idle: asyncio.Queue[_Session] = asyncio.Queue()
+        self._sessions: list[_Session] = []
+
+    async def _acquire(self) -> _Session:
+        if not self._idle.empty() or len(self._sessions) >= self.size:
+            return await self._idle.get()
+
+        session = _Session()
+        self._sessions.append(session)
+        return session
+
+    async def _open(self, session: _Session) -> None:
+        session.client = aiosmtplib.SMTP(
+            hostname=settings.EMAIL_HOST,
+            port=settings.EMAIL_PORT,
+            username=settings.EMAIL_HOST_USER or None,
+            password=settings.EMAIL_HOST_PASSWORD or None,
+            use_tls=settings.EMAIL_USE_SSL,
+            start_tls=settings.EMAIL_USE_TLS,
+            timeout=getattr(settings, "EMAIL_TIMEOUT", None) or 60,
+        )
+        await session.client.connect()
+        session.messages = 0
+        self.connections_opened += 1
+
+    async def _close(self, session: _Session) -> None:
+        client, session.client = session.client, None
+
+        if client is None or not client.is_connected:
+            return
+
+        try:
+            await client.quit()
+        except Exception as exc:
+            logger.warning("Ошибка при закрытии SMTP-соединения: %s", exc)
+            client.close()
+
+    async def send(self, from_email: str, recipients: list[str], payload: bytes) -> str:
+        """Отправляет готовое письмо через свободную сессию. Возвращает ответ сервера."""
+        session = await self._acquire()
+        started = time.perf_counter()
+        try:
+            attempt = 0
+            while True:
+                if session.client is None or not session.client.is_connected:
+                    await self._open(session)
+                try:
+                    _errors, response = await session.client.sendmail(from_email, recipients, payload)
+                except (aiosmtplib.SMTPServerDisconnected, ConnectionError) as exc:
+                    await self._close(session)
+                    if attempt >= self.max_reconnects:
+                        raise
+                    attempt += 1
+                    logger.warning("SMTP-соединение разорвано (%s), переподключение", exc)
+                    continue
+                break
+
+            session.messages += 1
+            self.messages_sent += 1
+
+            if session.messages >= self.max_messages:
+                await self._close(session)
+
+            return response
+        finally:
+            observe_send(time.perf_counter() - started)
+            self._idle.put_nowait(session)
+
+    async def close(self) -> None:
+        await asyncio.gather(*(self._close(session) for session in self._sessions))
+
+    def stats(self) -> dict:
+        return {
+            "connections": self.connections_opened,
+            "messages_per_connection": (
+                round(self.messages_sent / self.connections_opened, 1) if self.connections_opened else 0
+            ),
+        }
+
+
+async def adeliver(
+    mailing: Mailing,
+    prepared: PreparedMessage,
+    log_buffer: MailingLogBuffer,
+    client_range: tuple[int | None, int | None] | None = None,
+) -> tuple[int, int, dict]:
+    """
+    Асинхронная отправка рассылки: до MAILING_ASYNC_CONCURRENCY писем одновременно в полёте.
+
+    Письмо собирается один раз (prepared), получатели читаются через асинхронный ORM,
+    попытки пишутся в log_buffer через sync_to_async.
+    Возвращает (успешно, ошибок, статистика соединений).
+    """
+    if aiosmtplib is None:
+        raise ImproperlyConfigured("Для MAILING_SEND_ENGINE=async требуется пакет aiosmtplib.")
+
+    concurrency = settings.MAILING_ASYNC_CONCURRENCY
+    pool = AsyncConnectionPool(concurrency)
+    semaphore = asyncio.Semaphore(concurrency)
+    counts = {"success": 0, "failed": 0}
+    tasks: set[asyncio.Task] = set()
+
+    async def deliver_one(recipient: Recipient) -> None:
+        client_id = recipient[0]
+        try:
+            envelope = prepared.envelope(recipient)
+            response = await pool.send(envelope.from_email, envelope.recipients, envelope.payload)
+        except Exception as exc:
+            counts["failed"] += 1
+            logger.error(
+                "Ошибка при отправке письма: mailing_id=%s, client_id=%s, error=%s",
+                mailing.id,
+                client_id,
+                str(exc),
+                exc_info=exc,
+                extra={"mailing_id": mailing.id, "client_id": client_id, "status": "failed"},
+            )
+            await log_buffer.aadd(mailing.id, client_id, "failed", str(exc))
+        else:
+            counts["success"] += 1
+            await log_buffer.aadd(mailing.id, client_id, "success", response or "OK")
+        finally:
+            semaphore.release()
+
+    try:
+        async for chunk in aiter_recipient_chunks(mailing.id, client_range):
+            for recipient in chunk:
+                await semaphore.acquire()
+                task = asyncio.create_task(deliver_one(recipient))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await pool.close()
+        await log_buffer.aflush()
+
+    return counts["success"], counts["failed"], pool.stats()
@@ -0,0 +1,219 @@
+import sys
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage
+from django.db import connection, transaction
+from django.template import Context, Template
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone
+
+from users.models import User
+
+from .mime import PreparedMessage
+from .models import Client, Mailing, Message
+from .personalization import CompiledTemplate, MessagePlan, unsubscribe_url
+from .services import run_mailing
+from .smtp_sink import SmtpSink
+from .transport import add_send_observer, remove_send_observer
+
+try:
+    import resource
+except ImportError:  # нет на Windows
+    resource = None
+
+
+def _per_message(func, messages: int) -> float:
+    """Процессорное время на одно письмо в микросекундах."""
+    started = time.process_time()
+    for index in range(messages):
+        func(index)
+    return (time.process_time() - started) / messages * 1_000_000
+
+
+def _recipient(index: int) -> tuple[int, str, str]:
+    return index, f"client{index}@example.com", f"Клиент {index}"
+
+
+def _body(body_size: int, line: str) -> str:
+    return (line * (body_size // len(line) + 1))[:body_size]
+
+
+def bench_mime(messages: int = 2000, body_size: int = 20_000, **options) -> dict:
+    """
+    Сравнивает сборку MIME-письма для каждого получателя (как в send_mail)
+    со сборкой один раз через PreparedMessage и подстановкой только заголовков To и Message-ID.
+    """
+    subject = "Ежемесячная рассылка: новости и предложения"
+    body = _body(body_size, "Здравствуйте! Это тестовое письмо рассылки.\n")
+    from_email = settings.DEFAULT_FROM_EMAIL
+
+    def per_recipient(index: int) -> bytes:
+        message = EmailMessage(subject, body, from_email, [f"client{index}@example.com"])
+        return message.message().as_bytes(linesep="\r\n")
+
+    prepared = PreparedMessage(MessagePlan(CompiledTemplate(subject), CompiledTemplate(body)), from_email)
+
+    def prepared_once(index: int) -> bytes:
+        return prepared.envelope(_recipient(index)).payload
+
+    before = _per_message(per_recipient, messages)
+    after = _per_message(prepared_once, messages)
+
+    return {
+        "messages": messages,
+        "body_size": body_size,
+        "per_recipient_us": round(before, 1),
+        "prepared_us": round(after, 1),
+        "speedup": round(before / after, 1) if after else 0,
+    }
+
+
+def bench_render(messages: int = 2000, body_size: int = 20_000, **options) -> dict:
+    """
+    Время подстановки полей клиента на одного получателя: шаблонизатор Django
+    (шаблон скомпилирован заранее) против плана подстановок CompiledTemplate.
+    Отдельно замеряется полная сборка персонализированного письма через PreparedMessage.
+    """
+    body = "Здравствуйте, {{ client.name }}!\n" + _body(body_size, "Новости и предложения этого месяца.\n")
+    body += "Письмо отправлено на {{ client.email }}. Отписаться: {{ unsubscribe_url }}\n"
+    template = Template(body)
+    compiled = CompiledTemplate(body)
+
+    def django_template(index: int) -> str:
+        client_id, email, name = _recipient(index)
+        context = {
+            "client": {"id": client_id, "email": email, "name": name},
+            "unsubscribe_url": unsubscribe_url(index),
+        }
+        return template.render(Context(context, autoescape=False))
+
+    def compiled_plan(index: int) -> str:
+        return compiled.render(_recipient(index))
+
+    prepared = PreparedMessage(
+        MessagePlan(CompiledTemplate("Новости для {{ client.name }}"), compiled), settings.DEFAULT_FROM_EMAIL
+    )
+
+    def prepared_envelope(index: int) -> bytes:
+        return prepared.envelope(_recipient(index)).payload
+
+    before = _per_message(django_template, messages)
+    after = _per_message(compiled_plan, messages)
+
+    return {
+        "messages": messages,
+        "body_size": body_size,
+        "django_template_us": round(before, 1),
+        "compiled_us": round(after, 1),
+        "speedup": round(before / after, 1) if after else 0,
+        "personalized_envelope_us": round(_per_message(prepared_envelope, messages), 1),
+    }
+
+
+def _percentile(values: list[float], percent: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+def _peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss — килобайты в Linux и байты в macOS.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _seed_mailing(clients: int, body_size: int) -> Mailing:
+    """Создаёт владельца, сообщение и рассылку на clients получателей, доступную для отправки прямо сейчас."""
+    tag = uuid.uuid4().hex[:8]
+    owner = User.objects.create(email=f"bench-{tag}@bench.test")
+    message = Message.objects.create(
+        subject="Бенчмарк отправки",
+        body="Здравствуйте, {{ client.name }}!\n" + _body(body_size, "Новости и предложения этого месяца.\n"),
+        owner=owner,
+    )
+    now = timezone.now()
+    mailing = Mailing.objects.create(
+        start_time=now - timedelta(minutes=1), end_time=now + timedelta(hours=1), owner=owner, message=message
+    )
+    created = Client.objects.bulk_create(
+        Client(email=f"bench-{tag}-{index}@bench.test", name=f"Клиент {index}", comment="", owner=owner)
+        for index in range(clients)
+    )
+    Mailing.clients.through.objects.bulk_create(
+        Mailing.clients.through(mailing_id=mailing.pk, client_id=client.pk) for client in created
+    )
+    return mailing
+
+
+def bench_send(
+    messages: int = 2000,
+    body_size: int = 2000,
+    engine: str | None = None,
+    workers: int | None = None,
+    latency: float = 0.0,
+    failure_rate: float = 0.0,
+    **options,
+) -> dict:
+    """
+    Полный путь отправки run_mailing на messages получателей через локальный SmtpSink
+    с задержкой latency (мс) и долей отказов failure_rate. Данные создаются в транзакции
+    и откатываются после замера, поэтому база не меняется.
+    """
+    latencies: list[float] = []
+    observer = latencies.append
+
+    with SmtpSink(latency=latency / 1000, failure_rate=failure_rate, seed=0) as sink:
+        with override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST=sink.host,
+            EMAIL_PORT=sink.port,
+            EMAIL_HOST_USER="",
+            EMAIL_HOST_PASSWORD="",
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+        ):
+            with transaction.atomic():
+                mailing = _seed_mailing(messages, body_size)
+
+                add_send_observer(observer)
+                try:
+                    with CaptureQueriesContext(connection) as queries:
+                        started = time.perf_counter()
+                        result = run_mailing(mailing, workers=workers, engine=engine)
+                        elapsed = time.perf_counter() - started
+                finally:
+                    remove_send_observer(observer)
+
+                transaction.set_rollback(True)
+
+    return {
+        "messages": messages,
+        "body_size": body_size,
+        "engine": result["engine"],
+        "workers": result["workers"],
+        "latency_ms": latency,
+        "failure_rate": failure_rate,
+        "success": result["success"],
+        "failed": result["failed"],
+        "seconds": round(elapsed, 3),
+        "messages_per_second": round(messages / elapsed, 1) if elapsed else 0,
+        "latency_p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "latency_p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+        "queries": len(queries),
+        "queries_per_message": round(len(queries) / messages, 3) if messages else 0,
+        "connections": result["connections"],
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+SUITES = {
+    "mime": bench_mime,
+    "render": bench_render,
+    "send": bench_send,
+}
@@ -0,0 +1,96 @@
+import time
+from collections.abc import Iterable
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+# Поколения данных: счётчик на владельца и общий счётчик. Ключи кеша статистики содержат номер поколения,
+# поэтому изменение данных делает старые записи недостижимыми, и кеш живёт часами без устаревших цифр.
+_GLOBAL_KEY = "cachever:all"
+
+
+def _owner_key(owner_id: int) -> str:
+    return f"cachever:owner:{owner_id}"
+
+
+def _seed() -> int:
+    # Счётчик, вытесненный из кеша, начинается заново с текущего времени, а не с нуля,
+    # чтобы новое поколение не совпало с номером записей, оставшихся от старого.
+    return time.time_ns() // 1000
+
+
+def current(owner_id: int | None = None) -> int:
+    """Текущее поколение данных владельца owner_id или, при owner_id=None, данных всех пользователей."""
+    key = _GLOBAL_KEY if owner_id is None else _owner_key(owner_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _seed(), None)
+        version = cache.get(key)
+    return version
+
+
+def _incr(key: str) -> None:
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, _seed(), None):
+            cache.incr(key)
+
+
+def bump(owner_ids: Iterable[int]) -> None:
+    """
+    Начинает новое поколение данных указанных владельцев и общее поколение. Внутри транзакции
+    счётчики увеличиваются после фиксации, иначе параллельный запрос закешировал бы под новым
+    поколением ещё старые данные.
+    """
+    keys = [_owner_key(owner_id) for owner_id in set(owner_ids) if owner_id is not None]
+    keys.append(_GLOBAL_KEY)
+
+    def run():
+        for key in keys:
+            _incr(key)
+
+    transaction.on_commit(run)
+
+
+def bump_mailings(mailing_ids: Iterable[int]) -> None:
+    """bump() для владельцев рассылок mailing_ids (один запрос к БД)."""
+    from .models import Mailing
+
+    mailing_ids = set(mailing_ids)
+    if mailing_ids:
+        bump(Mailing.objects.filter(pk__in=mailing_ids).values_list("owner_id", flat=True).distinct())
+
+
+def _owner_changed(sender, instance, **kwargs):
+    bump([instance.owner_id])
+
+
+def _log_changed(sender, instance, **kwargs):
+    bump_mailings([instance.mailing_id])
+
+
+def _clients_changed(sender, instance, action, **kwargs):
+    # instance - рассылка (mailing.clients.add) или клиент (client.mailing_set.add); владелец есть у обоих.
+    if action in ("post_add", "post_remove", "post_clear"):
+        bump([instance.owner_id])
+
+
+def connect_signals() -> None:
+    """
+    Подписывает сброс поколений на изменения Mailing, Client и MailingLog. Массовые записи без сигналов
+    (bulk_create логов, UPDATE статусов, сводки) вызывают bump() сами.
+
+    На удаление MailingLog подписки нет: логи удаляются каскадом вместе с рассылкой или клиентом,
+    а обработчик post_delete заставил бы Django загружать в память все логи удаляемой рассылки
+    вместо одного DELETE.
+    """
+    from .models import Client, Mailing, MailingLog
+
+    for model in (Mailing, Client):
+        post_save.connect(_owner_changed, sender=model, dispatch_uid=f"cache_versions_{model.__name__}_save")
+        post_delete.connect(_owner_changed, sender=model, dispatch_uid=f"cache_versions_{model.__name__}_delete")
+
+    post_save.connect(_log_changed, sender=MailingLog, dispatch_uid="cache_versions_MailingLog_save")
+    m2m_changed.connect(_clients_changed, sender=Mailing.clients.through, dispatch_uid="cache_versions_clients")
@@ -0,0 +1,94 @@
+from collections.abc import Iterable
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Mailing, MailingLog, MailingStats
+
+
+def record_attempts(rows: Iterable[MailingLog]) -> None:
+    """
+    Прибавляет пачку записанных попыток к MailingStats: недостающие строки создаются одним
+    bulk_create(ignore_conflicts=True), затем по одному UPDATE с F-выражениями на рассылку пачки,
+    поэтому параллельные процессы отправки не теряют приращения друг друга.
+    """
+    totals: dict[int, tuple[int, int, datetime]] = {}
+    for row in rows:
+        success, failed, last_time = totals.get(row.mailing_id, (0, 0, row.attempt_time))
+        ok = row.status == "success"
+        totals[row.mailing_id] = (success + ok, failed + (not ok), max(last_time, row.attempt_time))
+
+    if not totals:
+        return
+
+    # Строки блокируются в порядке mailing_id: параллельные сбросы пачек с несколькими рассылками
+    # (воркеры mailing_worker) берут блокировки в одном порядке и не попадают во взаимную блокировку.
+    ordered = sorted(totals.items())
+
+    with transaction.atomic():
+        MailingStats.objects.bulk_create(
+            [MailingStats(mailing_id=mailing_id) for mailing_id, _totals in ordered],
+            ignore_conflicts=True,
+        )
+        for mailing_id, (success, failed, last_time) in ordered:
+            MailingStats.objects.filter(mailing_id=mailing_id).update(
+                attempts=F("attempts") + success + failed,
+                success=F("success") + success,
+                failed=F("failed") + failed,
+                last_attempt_time=_latest(last_time),
+            )
+
+
+def _latest(value: datetime):
+    # GREATEST возвращает NULL, если один из аргументов NULL (SQLite, MySQL), поэтому пустое значение заменяется.
+    return Greatest(Coalesce(F("last_attempt_time"), Value(value)), Value(value))
+
+
+def rebuild_stats(batch_size: int = 1000) -> int:
+    """
+    Пересчитывает MailingStats по всем MailingLog одним агрегатом по mailing_id и заменяет таблицу
+    в одной транзакции. Возвращает количество рассылок с попытками.
+    Во время пересчёта отправку лучше приостановить: попытки, записанные параллельно, могут не попасть в итог.
+    """
+    aggregated = (
+        MailingLog.objects.values("mailing_id")
+        .annotate(
+            attempts=Count("id"),
+            success=Count("id", filter=Q(status="success")),
+            last_attempt_time=Max("attempt_time"),
+        )
+        .order_by("mailing_id")
+    )
+
+    created = 0
+    with transaction.atomic():
+        MailingStats.objects.all().delete()
+
+        batch = []
+        for row in aggregated.iterator(chunk_size=batch_size):
+            batch.append(
+                MailingStats(
+                    mailing_id=row["mailing_id"],
+                    attempts=row["attempts"],
+                    success=row["success"],
+                    failed=row["attempts"] - row["success"],
+                    last_attempt_time=row["last_attempt_time"],
+                )
+            )
+            if len(batch) >= batch_size:
+                created += len(MailingStats.objects.bulk_create(batch))
+                batch = []
+
+        created += len(MailingStats.objects.bulk_create(batch))
+
+    return created
+
+
+def mailing_counts(mailing: Mailing) -> dict[str, int]:
+    """Итоги попыток рассылки для страниц рассылки: total, success, failed (нули, если попыток не было)."""
+    stats = getattr(mailing, "delivery_stats", None)
+    if stats is None:
+        return {"total": 0, "success": 0, "failed": 0}
+    return {"total": stats.attempts, "success": stats.success, "failed": stats.failed}
@@ -83,5 +83,5 @@ class MailingForm(forms.ModelForm):
             # Показываем только сообщения текущего пользователя
             self.fields["message"].queryset = Message.objects.filter(owner=user)
 
-            # Показываем только клиентов текущего пользователя
-            self.fields["clients"].queryset = Client.objects.filter(owner=user)
+            # Показываем только клиентов текущего пользователя, кроме отписавшихся
+            self.fields["clients"].queryset = Client.objects.filter(owner=user, unsubscribed_at__isnull=True)
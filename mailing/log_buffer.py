@@ -0,0 +1,131 @@
+import logging
+import random
+import time
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .cache_versions import bump_mailings
+from .delivery_stats import record_attempts
+from .metrics import LOG_BATCH_SIZE, MESSAGES_FAILED, MESSAGES_SENT
+from .models import MailingLog
+from .progress import record_progress
+
+logger = logging.getLogger("mailing")
+
+
+class MailingLogBuffer:
+    """
+    Буфер записей MailingLog на время прогона рассылки.
+
+    Попытки копятся в памяти и сбрасываются в БД одним bulk_create каждые flush_size записей
+    или каждые flush_interval секунд; при сбросе в той же транзакции обновляются счётчики MailingStats,
+    а затем счётчики прогресса рассылок.
+    При использовании как контекстного менеджера последний сброс выполняется при выходе из блока,
+    в том числе при исключении.
+    """
+
+    def __init__(self, flush_size: int | None = None, flush_interval: float | None = None):
+        self.flush_size = flush_size or settings.MAILING_LOG_FLUSH_SIZE
+        self.flush_interval = flush_interval if flush_interval is not None else settings.MAILING_LOG_FLUSH_INTERVAL
+        self.written = 0
+        self._pending: list[MailingLog] = []
+        self._last_flush = time.monotonic()
+
+    def add(self, mailing_id: int, client_id: int | None, status: str, server_response: str) -> None:
+        self._append(mailing_id, client_id, status, server_response)
+
+        if self._should_flush():
+            self.flush()
+
+    async def aadd(self, mailing_id: int, client_id: int | None, status: str, server_response: str) -> None:
+        """Асинхронный вариант add для движка отправки на asyncio."""
+        self._append(mailing_id, client_id, status, server_response)
+
+        if self._should_flush():
+            await self.aflush()
+
+    def flush(self) -> int:
+        """Записывает накопленные попытки в БД. Возвращает количество записанных строк."""
+        return self._write(self._take())
+
+    async def aflush(self) -> int:
+        # Забираем накопленные строки в event loop, а пишем в БД через sync_to_async,
+        # чтобы параллельные корутины не теряли добавленные во время записи попытки.
+        return await sync_to_async(self._write)(self._take())
+
+    def _append(self, mailing_id: int, client_id: int | None, status: str, server_response: str) -> None:
+        self._pending.append(
+            MailingLog(
+                mailing_id=mailing_id,
+                client_id=client_id,
+                status=status,
+                server_response=server_response,
+                attempt_time=timezone.now(),
+            )
+        )
+
+    def _should_flush(self) -> bool:
+        return len(self._pending) >= self.flush_size or time.monotonic() - self._last_flush >= self.flush_interval
+
+    def _take(self) -> list[MailingLog]:
+        self._last_flush = time.monotonic()
+        rows, self._pending = self._pending, []
+        return rows
+
+    def _write(self, rows: list[MailingLog]) -> int:
+        if not rows:
+            return 0
+
+        with transaction.atomic():
+            MailingLog.objects.bulk_create(rows, batch_size=self.flush_size)
+            record_attempts(rows)
+            bump_mailings({row.mailing_id for row in rows})
+        self.written += len(rows)
+
+        # Успешные отправки пишутся в лог выборочно (LOG_SUCCESS_SAMPLE_RATE), чтобы объём логов
+        # не рос вместе с числом получателей; итоги пачки по каждой рассылке пишутся всегда.
+        sample_rate = settings.LOG_SUCCESS_SAMPLE_RATE
+        counts = Counter()
+        for row in rows:
+            counts[row.mailing_id, row.status] += 1
+            if row.status == "success" and sample_rate and random.random() < sample_rate:
+                logger.info(
+                    "Письмо успешно отправлено: mailing_id=%s, client_id=%s",
+                    row.mailing_id,
+                    row.client_id,
+                    extra={
+                        "mailing_id": row.mailing_id,
+                        "client_id": row.client_id,
+                        "status": row.status,
+                        "sample_rate": sample_rate,
+                    },
+                )
+
+        for mailing_id in {mailing_id for mailing_id, _status in counts}:
+            sent, failed = counts[mailing_id, "success"], counts[mailing_id, "failed"]
+            record_progress(mailing_id, sent=sent, failed=failed)
+            logger.info(
+                "Рассылка id=%s: записано попыток %s, успешно %s, ошибок %s",
+                mailing_id,
+                sent + failed,
+                sent,
+                failed,
+                extra={"mailing_id": mailing_id, "sent": sent, "failed": failed},
+            )
+
+        sent = sum(count for (_mailing_id, status), count in counts.items() if status == "success")
+        MESSAGES_SENT.inc(sent)
+        MESSAGES_FAILED.inc(len(rows) - sent)
+        LOG_BATCH_SIZE.observe(len(rows))
+
+        return len(rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.flush()
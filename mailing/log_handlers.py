@@ -0,0 +1,121 @@
+import atexit
+import copy
+import json
+import logging
+import logging.config
+import os
+import queue
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
+
+from django.conf import settings
+
+# Атрибуты, которые есть у любой LogRecord; всё остальное передано через extra и попадает в JSON отдельными полями.
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName"}
+
+# Обработчики, перенесённые в фоновые потоки: QueueHandler -> список исходных обработчиков.
+_targets: dict[QueueHandler, list[logging.Handler]] = {}
+_listeners: list[QueueListener] = []
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Одна JSON-строка на запись: время, уровень, логгер, сообщение и поля из extra
+    (mailing_id, client_id, status и т.п.), по которым логи удобно фильтровать без разбора текста.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created).astimezone().isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        data.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            data["stack_info"] = self.formatStack(record.stack_info)
+
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class BackgroundQueueHandler(QueueHandler):
+    """
+    QueueHandler, который оставляет форматирование обработчикам в фоновом потоке.
+
+    В вызывающем потоке только подставляются аргументы сообщения: они могут измениться позже или
+    обращаться к БД, а соединения Django привязаны к потоку. Трейсбек и итоговая строка
+    (текст или JSON) собираются уже в потоке QueueListener.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _start_listener(queue_handler: QueueHandler) -> None:
+    listener = QueueListener(queue_handler.queue, *_targets[queue_handler], respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+
+
+def _restart_after_fork() -> None:
+    # Поток QueueListener не переживает fork (например, gunicorn --preload): в дочернем процессе
+    # создаём новые очереди и потоки, иначе записи копились бы в очереди без читателя.
+    _listeners.clear()
+    for queue_handler in _targets:
+        queue_handler.queue = queue.SimpleQueue()
+        _start_listener(queue_handler)
+
+
+def stop_queue_logging() -> None:
+    """Дописывает оставшиеся в очередях записи и останавливает фоновые потоки."""
+    for listener in _listeners:
+        listener.stop()
+    _listeners.clear()
+
+
+def start_queue_logging(logger_names) -> None:
+    """
+    Переносит обработчики указанных логгеров в фоновые потоки: у логгера остаётся один
+    BackgroundQueueHandler, а запись на диск и в консоль выполняет QueueListener.
+    Логгеры с одинаковым набором обработчиков делят одну очередь.
+    """
+    handlers_by_set: dict[tuple[logging.Handler, ...], QueueHandler] = {}
+
+    for name in logger_names:
+        logger = logging.getLogger(name)
+        handlers = tuple(handler for handler in logger.handlers if not isinstance(handler, QueueHandler))
+        if not handlers:
+            continue
+
+        queue_handler = handlers_by_set.get(handlers)
+        if queue_handler is None:
+            queue_handler = handlers_by_set[handlers] = BackgroundQueueHandler(queue.SimpleQueue())
+            _targets[queue_handler] = list(handlers)
+            _start_listener(queue_handler)
+
+        for handler in handlers:
+            logger.removeHandler(handler)
+        logger.addHandler(queue_handler)
+
+
+def configure_logging(logging_settings: dict) -> None:
+    """
+    LOGGING_CONFIG: dictConfig из settings.LOGGING, затем при LOG_QUEUE перенос обработчиков
+    настроенных логгеров в фоновые потоки, чтобы запись логов не задерживала отправку писем.
+    """
+    stop_queue_logging()
+    _targets.clear()
+    logging.config.dictConfig(logging_settings)
+
+    if getattr(settings, "LOG_QUEUE", False):
+        start_queue_logging(logging_settings.get("loggers", {}))
+
+
+atexit.register(stop_queue_logging)
+os.register_at_fork(after_in_child=_restart_after_fork)
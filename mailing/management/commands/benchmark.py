@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from mailing.benchmarks import SUITES
+from mailing.services import SEND_ENGINES
+
+
+class Command(BaseCommand):
+    help = "Запускает микробенчмарки отправки рассылок и выводит результаты."
+
+    def add_arguments(self, parser):
+        parser.add_argument("suite", choices=sorted(SUITES), help="Набор замеров.")
+        parser.add_argument("--messages", type=int, default=2000, help="Количество писем в замере.")
+        parser.add_argument("--body-size", type=int, default=2000, help="Размер тела письма в символах.")
+        parser.add_argument("--engine", choices=SEND_ENGINES, help="send: движок отправки (по умолчанию из настроек).")
+        parser.add_argument("--workers", type=int, help="send: потоков отправки для движка sync.")
+        parser.add_argument("--latency", type=float, default=0, help="send: задержка SMTP-сервера на письмо, мс.")
+        parser.add_argument("--failure-rate", type=float, default=0, help="send: доля отклоняемых писем (0..1).")
+        parser.add_argument("--json", action="store_true", help="Вывести результат в формате JSON.")
+
+    def handle(self, *args, **options):
+        result = SUITES[options["suite"]](**options)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(result, ensure_ascii=False))
+            return
+
+        self.stdout.write(self.style.SUCCESS(f"Бенчмарк {options['suite']}:"))
+        for key, value in result.items():
+            self.stdout.write(f"  {key}: {value}")
@@ -15,5 +15,7 @@ class Command(BaseCommand):
         User.objects.all().delete()
         call_command("loaddata", "users_test.json")
         call_command("loaddata", "mailing_test.json")
+        call_command("rebuild_mailing_stats")
+        call_command("rollup_mailing_logs", rebuild=True)
 
         self.stdout.write(self.style.SUCCESS("Successfully loaded data from fixture"))
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from mailing.scale_data import ScaleDataGenerator, supports_bulk_ids
+
+
+class Command(BaseCommand):
+    help = (
+        "Создаёт объёмные тестовые данные (пользователи, клиенты, рассылки, логи) для воспроизведения "
+        "нагрузки как в продакшене. Существующие данные не удаляются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000, help="Количество пользователей.")
+        parser.add_argument("--clients", type=int, default=100_000, help="Количество клиентов.")
+        parser.add_argument(
+            "--messages",
+            type=int,
+            default=None,
+            help="Количество сообщений (по умолчанию — половина количества рассылок).",
+        )
+        parser.add_argument("--mailings", type=int, default=10_000, help="Количество рассылок.")
+        parser.add_argument("--recipients", type=int, default=100, help="Среднее число получателей рассылки.")
+        parser.add_argument("--logs", type=int, default=1_000_000, help="Количество записей MailingLog.")
+        parser.add_argument("--batch-size", type=int, default=10_000, help="Строк в одном bulk_create.")
+        parser.add_argument("--seed", type=int, default=42, help="Зерно генератора случайных чисел.")
+
+    def handle(self, *args, **options):
+        if not supports_bulk_ids():
+            raise CommandError("База данных не возвращает id строк из bulk_create; нужен PostgreSQL или SQLite 3.35+.")
+        if options["users"] < 2 or options["clients"] < 1:
+            raise CommandError("Нужно хотя бы 2 пользователя и 1 клиент.")
+
+        generator = ScaleDataGenerator(options["seed"], options["batch_size"], self.stdout.write)
+        if generator.already_generated():
+            raise CommandError(
+                f"Данные с --seed {options['seed']} уже созданы в этой базе. Укажите другое зерно или чистую базу."
+            )
+
+        result = generator.generate(
+            users=options["users"],
+            clients=options["clients"],
+            messages=options["messages"] or max(1, options["mailings"] // 2),
+            mailings=options["mailings"],
+            recipients=options["recipients"],
+            logs=options["logs"],
+        )
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                "Готово: пользователей {users}, клиентов {clients}, сообщений {messages}, рассылок {mailings}, "
+                "получателей {recipients}, логов {logs}. Пароль пользователей: scale-password.".format(**result)
+            )
+        )
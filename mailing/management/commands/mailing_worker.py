@@ -0,0 +1,89 @@
+import logging
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from mailing.outbox import claim_batch, default_worker_id, process_batch
+from mailing.transport import ManagedConnection, ThreadedSender
+
+logger = logging.getLogger("mailing")
+
+
+class Command(BaseCommand):
+    help = (
+        "Воркер очереди отправки: забирает письма из OutboxMessage пачками (SELECT ... FOR UPDATE SKIP LOCKED), "
+        "отправляет их и пишет MailingLog. Можно запускать несколько воркеров на разных хостах."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=None,
+            help="Сколько писем забирать за раз (по умолчанию MAILING_OUTBOX_BATCH_SIZE).",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Количество потоков отправки (по умолчанию MAILING_WORKERS).",
+        )
+        parser.add_argument(
+            "--idle-sleep",
+            type=float,
+            default=5,
+            help="Пауза в секундах, если очередь пуста.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Обработать очередь до конца и завершиться.",
+        )
+
+    def handle(self, *args, **options):
+        worker_id = default_worker_id()
+        workers = options["workers"] or settings.MAILING_WORKERS
+        stop = threading.Event()
+
+        def request_stop(signum, frame):
+            logger.info("Воркер %s получил сигнал %s, завершение после текущей пачки", worker_id, signum)
+            stop.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        logger.info("Старт воркера очереди отправки %s", worker_id)
+        totals = {"total": 0, "success": 0, "failed": 0, "skipped": 0}
+
+        with ThreadedSender(workers) if workers > 1 else ManagedConnection() as transport:
+            while not stop.is_set():
+                rows = claim_batch(worker_id, options["batch_size"])
+
+                if not rows:
+                    if options["once"]:
+                        break
+                    stop.wait(options["idle_sleep"])
+                    continue
+
+                result = process_batch(rows, transport)
+                for key in totals:
+                    totals[key] += result[key]
+
+                logger.info(
+                    "Воркер %s: пачка %s писем, успешно %s, ошибок %s, пропущено %s",
+                    worker_id,
+                    result["total"],
+                    result["success"],
+                    result["failed"],
+                    result["skipped"],
+                )
+
+        logger.info("Воркер %s остановлен", worker_id)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Обработано писем: {totals['total']}, успешно {totals['success']}, ошибок {totals['failed']}, "
+                f"пропущено {totals['skipped']}."
+            )
+        )
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from mailing.delivery_stats import rebuild_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Пересчитывает MailingStats (попытки, успешные, ошибки, время последней попытки) по всем MailingLog. "
+        "Нужна после миграции для заполнения таблицы и после ручного удаления логов."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Строк MailingStats в одном bulk_create.")
+
+    def handle(self, *args, **options):
+        created = rebuild_stats(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"Статистика пересчитана: рассылок с попытками {created}."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from mailing.rollups import rebuild_rollups, rollup_logs
+
+
+class Command(BaseCommand):
+    help = (
+        "Добавляет в почасовые и посуточные сводки попыток (DeliveryRollup) только логи, появившиеся "
+        "после сохранённой отметки. Запускается по cron, например раз в несколько минут."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--settle",
+            type=int,
+            default=60,
+            help="Секунд до учёта свежих логов, пока завершаются транзакции отправки; 0 - учесть всё сразу.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=10000, help="Диапазон id логов в одной транзакции.")
+        parser.add_argument("--rebuild", action="store_true", help="Удалить сводки и учесть все логи заново.")
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            processed = rebuild_rollups(chunk_size=options["chunk_size"])
+        else:
+            processed = rollup_logs(settle=options["settle"], chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Сводки обновлены: учтено логов {processed}."))
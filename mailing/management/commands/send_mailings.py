@@ -1,10 +1,17 @@
 import logging
+import signal
 
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 
 from mailing.models import Mailing
+from mailing.outbox import enqueue_mailing
+from mailing.profiling import Profiler
+from mailing.scheduler import MailingScheduler
 from mailing.services import run_mailing
+from mailing.sharding import run_sharded
+from mailing.status_sweeper import sweep_statuses
 
 logger = logging.getLogger("mailing")
 
@@ -12,15 +19,69 @@ logger = logging.getLogger("mailing")
 class Command(BaseCommand):
     help = "Запускает все рассылки, чей временной интервал включает текущее время."
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Количество потоков отправки на одну рассылку (по умолчанию MAILING_WORKERS).",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help=(
+                "Количество процессов. При N > 1 рассылки распределяются по пулу процессов, "
+                "а крупные рассылки делятся на шарды по MAILING_SHARD_SIZE клиентов."
+            ),
+        )
+        parser.add_argument(
+            "--outbox",
+            action="store_true",
+            help=(
+                "Не отправлять сразу, а поставить рассылки в очередь для mailing_worker "
+                "(по умолчанию MAILING_USE_OUTBOX)."
+            ),
+        )
+        parser.add_argument(
+            "--daemon",
+            action="store_true",
+            help=(
+                "Работать постоянно: запускать каждую рассылку в момент её start_time и завершать в end_time "
+                "вместо разового запуска по cron. Останавливается по SIGTERM."
+            ),
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=30,
+            help="Как часто (в секундах) демон подтягивает новые и изменённые рассылки.",
+        )
+        parser.add_argument(
+            "--profile",
+            action="store_true",
+            help=(
+                "Профилировать каждый запуск run_mailing (cProfile и tracemalloc) и сохранять в LOG_DIR "
+                "файл .prof и отчёт о выделениях памяти. Не действует вместе с --processes и --outbox."
+            ),
+        )
+
     def handle(self, *args, **options):
+        if options["profile"] and (options["processes"] > 1 or options["outbox"] or settings.MAILING_USE_OUTBOX):
+            self.stdout.write(self.style.WARNING("--profile работает только при отправке в текущем процессе."))
+
+        if options["daemon"]:
+            self._run_daemon(options)
+            return
+
         logger.info("Старт выполнения management-команды send_mailings")
+        sweep_statuses()
         now = timezone.now()
 
         mailings = (
             Mailing.objects.filter(start_time__lte=now, end_time__gte=now)
             .exclude(status="finished")
             .select_related("message")
-            .prefetch_related("clients")
         )
 
         mailings_count = mailings.count()
@@ -30,36 +91,105 @@ class Command(BaseCommand):
             self.stdout.write(self.style.WARNING("Нет рассылок, доступных для отправки."))
             return
 
+        processed, errors = self._dispatch(list(mailings), options)
+
+        logger.info(
+            "Итоги выполнения send_mailings: обработано %s, ошибок %s",
+            processed,
+            errors,
+        )
+
+    def _run_daemon(self, options) -> None:
+        """Режим --daemon: планировщик запускает рассылки в момент start_time и завершает их в end_time."""
+        scheduler = MailingScheduler(
+            on_start=lambda mailing: self._dispatch([mailing], options),
+            on_finish=lambda mailing: sweep_statuses(),
+            poll_interval=options["poll_interval"],
+            on_poll=sweep_statuses,
+        )
+
+        def request_stop(signum, frame):
+            logger.info("send_mailings --daemon получил сигнал %s, остановка", signum)
+            scheduler.stop()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        logger.info("Старт send_mailings в режиме демона, опрос изменений раз в %s с", options["poll_interval"])
+        scheduler.run_forever()
+        logger.info("send_mailings --daemon остановлен")
+
+    def _dispatch(self, mailings: list[Mailing], options) -> tuple[int, int]:
+        """Запускает рассылки выбранным способом. Возвращает (обработано, ошибок)."""
         processed = 0
         errors = 0
 
-        for mailing in mailings:
-            processed += 1
-            mailing.update_status()
-
-            try:
-                result = run_mailing(mailing)
-            except Exception as exc:  # pragma: no cover - защита от неожиданных сбоев
-                self.stdout.write(self.style.ERROR(f"Рассылка #{mailing.pk} завершилась с ошибкой исполнения: {exc}"))
-                errors += 1
-                continue
-
-            if result.get("ok"):
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        (
-                            f"Рассылка #{mailing.pk} отправлена: всего {result['total']}, "
-                            f"успешно {result['success']}, ошибок {result['failed']}."
+        if options["outbox"] or settings.MAILING_USE_OUTBOX:
+            for mailing in mailings:
+                processed += 1
+                result = enqueue_mailing(mailing)
+
+                if result["ok"]:
+                    self.stdout.write(
+                        self.style.SUCCESS(
+                            f"Рассылка #{mailing.pk} поставлена в очередь: {result['total']} получателей."
                         )
                     )
-                )
-            else:
-                error_message = result.get("error", "Неизвестная ошибка")
-                self.stdout.write(self.style.ERROR(f"Рассылка #{mailing.pk} не запущена: {error_message}"))
-                errors += 1
+                else:
+                    self.stdout.write(self.style.ERROR(f"Рассылка #{mailing.pk} не запущена: {result['error']}"))
+                    errors += 1
+        elif options["processes"] > 1:
+            results = run_sharded([mailing.pk for mailing in mailings], options["processes"], options["workers"])
 
-        logger.info(
-            "Итоги выполнения send_mailings: обработано %s, ошибок %s",
-            processed,
-            errors,
+            for mailing_pk, result in results.items():
+                processed += 1
+                if not self._report(mailing_pk, result):
+                    errors += 1
+        else:
+            for mailing in mailings:
+                processed += 1
+
+                try:
+                    result = self._run(mailing, options)
+                except Exception as exc:  # pragma: no cover - защита от неожиданных сбоев
+                    result = exc
+
+                if not self._report(mailing.pk, result):
+                    errors += 1
+
+        return processed, errors
+
+    def _run(self, mailing: Mailing, options) -> dict:
+        """run_mailing, при --profile — под профайлером с сохранением отчёта в LOG_DIR."""
+        if not options["profile"]:
+            return run_mailing(mailing, workers=options["workers"])
+
+        profiler = Profiler()
+        try:
+            with profiler:
+                return run_mailing(mailing, workers=options["workers"])
+        finally:
+            prof_path, alloc_path = profiler.dump(settings.LOG_DIR, f"send_mailings-{mailing.pk}")
+            logger.info("Профиль рассылки id=%s: %s, %s", mailing.pk, prof_path, alloc_path)
+            self.stdout.write(f"Профиль рассылки #{mailing.pk}: {prof_path}, выделения памяти: {alloc_path}")
+
+    def _report(self, mailing_pk: int, result: dict | Exception) -> bool:
+        """Выводит итог по рассылке. Возвращает False, если рассылка не выполнена."""
+        if isinstance(result, Exception):
+            self.stdout.write(self.style.ERROR(f"Рассылка #{mailing_pk} завершилась с ошибкой исполнения: {result}"))
+            return False
+
+        if not result.get("ok"):
+            error_message = result.get("error", "Неизвестная ошибка")
+            self.stdout.write(self.style.ERROR(f"Рассылка #{mailing_pk} не запущена: {error_message}"))
+            return False
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                (
+                    f"Рассылка #{mailing_pk} отправлена: всего {result['total']}, "
+                    f"успешно {result['success']}, ошибок {result['failed']}."
+                )
+            )
         )
+        return True
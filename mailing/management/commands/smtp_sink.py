@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from mailing.smtp_sink import SmtpSink
+
+
+class Command(BaseCommand):
+    help = "Запускает локальный SMTP-сервер, который принимает и отбрасывает письма (для проверки отправки)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=1025)
+        parser.add_argument("--latency", type=float, default=0, help="Задержка ответа на письмо, мс.")
+        parser.add_argument("--failure-rate", type=float, default=0, help="Доля отклоняемых писем (0..1).")
+
+    def handle(self, *args, **options):
+        with SmtpSink(
+            options["host"], options["port"], latency=options["latency"] / 1000, failure_rate=options["failure_rate"]
+        ) as sink:
+            self.stdout.write(
+                self.style.SUCCESS(f"SMTP-заглушка слушает {sink.host}:{sink.port}. Ctrl+C для остановки.")
+            )
+            try:
+                while True:
+                    time.sleep(1)
+            except KeyboardInterrupt:
+                pass
+
+        self.stdout.write(f"Принято писем: {sink.messages_received}, отклонено: {sink.messages_rejected}")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from mailing.status_sweeper import sweep_statuses
+
+
+class Command(BaseCommand):
+    help = (
+        "Переводит статусы всех наступивших рассылок двумя UPDATE: created -> started и -> finished. "
+        "Запускается по cron; в режиме send_mailings --daemon выполняется при каждом опросе."
+    )
+
+    def handle(self, *args, **options):
+        transitions = sweep_statuses()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Статусы обновлены: запущено {transitions['started']}, завершено {transitions['finished']}."
+            )
+        )
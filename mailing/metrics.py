@@ -0,0 +1,229 @@
+import atexit
+import hashlib
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger("mailing")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Значения хранятся в кеше целыми числами (cache.incr), дробные — в миллионных долях.
+_SCALE = 1_000_000
+# Как часто процесс перепроверяет, что его наборы меток записаны в общий список.
+_LABELS_REFRESH = 300
+
+
+def _incr(key: str, delta: int) -> None:
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, None):
+            cache.incr(key, delta)
+
+
+class Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        registry.register(self)
+
+    def _labels(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def fields(self) -> list[str]:
+        return ["value"]
+
+    def samples(self, labels: tuple[str, ...], values: dict[str, float]) -> list[str]:
+        return [f"{self.name}{self.format_labels(labels)} {_number(values['value'])}"]
+
+    def format_labels(self, labels: tuple[str, ...], **extra: str) -> str:
+        pairs = [*zip(self.labelnames, labels), *extra.items()]
+        if not pairs:
+            return ""
+        escaped = (value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _name, value in pairs)
+        return "{" + ",".join(f'{name}="{value}"' for (name, _value), value in zip(pairs, escaped)) + "}"
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        registry.add(self, self._labels(labels), "value", amount)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        registry.set(self, self._labels(labels), value)
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        registry.add(self, self._labels(labels), "value", amount)
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        registry.add(self, self._labels(labels), "value", -amount)
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._labels(labels)
+        # Попадание в первую корзину с границей le >= value; за последней границей — корзина +Inf.
+        registry.add(self, key, f"bucket{bisect_left(self.buckets, value)}", 1)
+        registry.add(self, key, "sum", value)
+        registry.add(self, key, "count", 1)
+
+    def fields(self) -> list[str]:
+        return [f"bucket{index}" for index in range(len(self.buckets) + 1)] + ["sum", "count"]
+
+    def samples(self, labels: tuple[str, ...], values: dict[str, float]) -> list[str]:
+        lines = []
+        cumulative = 0.0
+        for index, bound in enumerate((*self.buckets, "+Inf")):
+            cumulative += values[f"bucket{index}"]
+            le = bound if isinstance(bound, str) else _number(bound)
+            lines.append(f"{self.name}_bucket{self.format_labels(labels, le=le)} {_number(cumulative)}")
+        lines.append(f"{self.name}_sum{self.format_labels(labels)} {_number(values['sum'])}")
+        lines.append(f"{self.name}_count{self.format_labels(labels)} {_number(values['count'])}")
+        return lines
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricsRegistry:
+    """
+    Реестр метрик процесса.
+
+    Наблюдения копятся в памяти и раз в METRICS_FLUSH_INTERVAL секунд прибавляются к значениям в кеше
+    (cache.incr), поэтому веб-процессы, send_mailings и воркеры очереди складываются в общие значения.
+    Для нескольких процессов нужен общий кеш (Redis); с LocMemCache каждый процесс видит только себя.
+    """
+
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+        self._pending: dict[tuple[str, tuple, str], float] = defaultdict(float)
+        self._gauges: dict[tuple[str, tuple], float] = {}
+        self._registered: dict[tuple[str, tuple], float] = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def register(self, metric: Metric) -> None:
+        self.metrics[metric.name] = metric
+
+    def add(self, metric: Metric, labels: tuple, field: str, amount: float) -> None:
+        with self._lock:
+            self._pending[metric.name, labels, field] += amount
+        self._maybe_flush()
+
+    def set(self, metric: Metric, labels: tuple, value: float) -> None:
+        with self._lock:
+            self._gauges[metric.name, labels] = value
+        self._maybe_flush()
+
+    def _maybe_flush(self) -> None:
+        if time.monotonic() - self._last_flush >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        """Переносит накопленные наблюдения в кеш. Ошибки кеша не должны мешать отправке, поэтому только логируются."""
+        with self._lock:
+            pending, self._pending = self._pending, defaultdict(float)
+            gauges, self._gauges = self._gauges, {}
+            self._last_flush = time.monotonic()
+
+        try:
+            for (name, labels), value in gauges.items():
+                cache.set(self._key(name, labels, "value"), round(value * _SCALE), None)
+                self._register_labels(name, labels)
+
+            for (name, labels, field), amount in pending.items():
+                _incr(self._key(name, labels, field), round(amount * _SCALE))
+                self._register_labels(name, labels)
+        except Exception as exc:
+            logger.warning("Не удалось записать метрики в кеш: %s", exc)
+
+    @staticmethod
+    def _key(name: str, labels: tuple, field: str) -> str:
+        digest = hashlib.md5(repr(labels).encode(), usedforsecurity=False).hexdigest()
+        return f"metrics:{name}:{digest}:{field}"
+
+    def _register_labels(self, name: str, labels: tuple) -> None:
+        """Добавляет набор меток в общий список метрики, чтобы экспозиция знала, какие ключи читать."""
+        checked = self._registered.get((name, labels))
+        if checked is not None and time.monotonic() - checked < _LABELS_REFRESH:
+            return
+
+        known = cache.get(f"metrics:{name}:labels") or []
+        if labels not in known:
+            cache.set(f"metrics:{name}:labels", [*known, labels], None)
+        self._registered[name, labels] = time.monotonic()
+
+    def render(self) -> str:
+        """Значения всех метрик в текстовом формате Prometheus."""
+        self.flush()
+        lines = []
+
+        for metric in self.metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+
+            label_sets = [()] if not metric.labelnames else cache.get(f"metrics:{metric.name}:labels") or []
+            for labels in sorted(map(tuple, label_sets)):
+                keys = {field: self._key(metric.name, labels, field) for field in metric.fields()}
+                stored = cache.get_many(keys.values())
+                values = {field: stored.get(key, 0) / _SCALE for field, key in keys.items()}
+                lines.extend(metric.samples(labels, values))
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+atexit.register(registry.flush)
+
+
+MESSAGES_SENT = Counter("mailing_messages_sent_total", "Успешно отправленные письма.")
+MESSAGES_FAILED = Counter("mailing_messages_failed_total", "Письма, которые не удалось отправить.")
+SMTP_SEND_SECONDS = Histogram("mailing_smtp_send_seconds", "Время SMTP-отправки одного письма, секунды.")
+RUN_SECONDS = Histogram(
+    "mailing_run_seconds",
+    "Длительность run_mailing, секунды.",
+    labelnames=("engine",),
+    buckets=(1, 5, 15, 60, 300, 900, 3600, 14400),
+)
+STATUS_TRANSITIONS = Counter(
+    "mailing_status_transitions_total",
+    "Переходы статусов рассылок, выполненные sweep_statuses.",
+    labelnames=("status",),
+)
+RUNS_IN_PROGRESS = Gauge("mailing_runs_in_progress", "Рассылки, отправляемые прямо сейчас.")
+LOG_BATCH_SIZE = Histogram(
+    "mailing_log_batch_size",
+    "Количество строк MailingLog в одной записи в БД.",
+    buckets=(1, 10, 50, 100, 250, 500, 1000, 5000),
+)
+CACHE_REQUESTS = Counter(
+    "mailing_cache_requests_total",
+    "Обращения к кешам страниц статистики.",
+    labelnames=("cache", "result"),
+)
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds",
+    "Время обработки HTTP-запроса, секунды.",
+    labelnames=("view", "method"),
+)
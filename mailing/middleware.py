@@ -0,0 +1,218 @@
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+
+from .metrics import REQUEST_SECONDS
+from .profiling import Profiler, ProfilerBusy
+
+logger = logging.getLogger("mailing.requests")
+
+# Списки параметров IN (%s, %s, ...) разной длины и числовые литералы сводятся к одному отпечатку запроса.
+_IN_LIST_RE = re.compile(r"IN \((?:%s, )*%s\)")
+_NUMBER_RE = re.compile(r"\b\d+\b")
+
+
+def sql_fingerprint(sql: str) -> str:
+    return _NUMBER_RE.sub("N", _IN_LIST_RE.sub("IN (...)", sql))
+
+
+class RequestTimings:
+    """Замеры одного запроса: SQL-запросы с длительностями и границы фаз view и render."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started: float | None = None
+        self.view_finished: float | None = None
+        self.render_finished: float | None = None
+        self.finished: float | None = None
+        self.queries: list[tuple[str, float]] = []
+
+    def execute(self, execute, sql, params, many, context):
+        """Обёртка для connection.execute_wrapper: измеряет время каждого SQL-запроса."""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, time.perf_counter() - started))
+
+    def rendered(self, response) -> None:
+        self.render_finished = time.perf_counter()
+
+    def finish(self) -> None:
+        self.finished = time.perf_counter()
+        if self.view_finished is None:
+            # Ответ не TemplateResponse: шаблон (если есть) рендерится внутри view.
+            self.view_finished = self.finished
+
+    @staticmethod
+    def _ms(start: float | None, end: float | None) -> float:
+        return round((end - start) * 1000, 1) if start is not None and end is not None else 0.0
+
+    @property
+    def total_ms(self) -> float:
+        return self._ms(self.started, self.finished)
+
+    @property
+    def view_ms(self) -> float:
+        return self._ms(self.view_started, self.view_finished)
+
+    @property
+    def render_ms(self) -> float:
+        return self._ms(self.view_finished, self.render_finished)
+
+    @property
+    def db_ms(self) -> float:
+        return round(sum(duration for _sql, duration in self.queries) * 1000, 1)
+
+    def server_timing(self) -> str:
+        return (
+            f'db;desc="{len(self.queries)} queries";dur={self.db_ms}, view;dur={self.view_ms}, '
+            f"render;dur={self.render_ms}, total;dur={self.total_ms}"
+        )
+
+    def slow_record(self, request, response, top: int) -> dict:
+        slowest = sorted(self.queries, key=lambda query: query[1], reverse=True)[:top]
+        fingerprints = Counter(sql_fingerprint(sql) for sql, _duration in self.queries)
+        match = getattr(request, "resolver_match", None)
+
+        return {
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "total_ms": self.total_ms,
+            "view_ms": self.view_ms,
+            "render_ms": self.render_ms,
+            "db_ms": self.db_ms,
+            "queries": len(self.queries),
+            "top_sql": [{"sql": sql, "ms": round(duration * 1000, 1)} for sql, duration in slowest],
+            "duplicates": [
+                {"fingerprint": fingerprint, "count": count}
+                for fingerprint, count in fingerprints.most_common(top)
+                if count > 1
+            ],
+        }
+
+
+class RequestTimingMiddleware:
+    """
+    Замер времени запроса по фазам: SQL (через connection.execute_wrapper), view и рендеринг шаблона.
+
+    Включается настройкой REQUEST_TIMING. Добавляет заголовок Server-Timing (db, view, render, total);
+    запросы дольше REQUEST_SLOW_MS пишутся в лог mailing.requests одной записью, в поля которой
+    (extra) попадают фазы, самые медленные SQL и повторяющиеся запросы (признак N+1).
+    Фаза render измеряется для TemplateResponse (generic views); у остальных ответов она входит во view.
+    Middleware должен стоять первым в MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_TIMING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timings = request.timings = RequestTimings()
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timings.execute))
+            response = self.get_response(request)
+
+        timings.finish()
+        response["Server-Timing"] = timings.server_timing()
+
+        if timings.total_ms >= settings.REQUEST_SLOW_MS:
+            record = timings.slow_record(request, response, settings.REQUEST_SLOW_TOP_SQL)
+            # Поля записи передаются через extra: JsonFormatter пишет их отдельными ключами JSON.
+            logger.warning(
+                "Медленный запрос: %s %s, %s мс",
+                record["method"],
+                record["path"],
+                record["total_ms"],
+                extra=record,
+            )
+
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.timings.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        request.timings.view_finished = time.perf_counter()
+        response.add_post_render_callback(request.timings.rendered)
+        return response
+
+
+class MetricsMiddleware:
+    """Время обработки запросов по имени URL-маршрута для метрики http_request_duration_seconds."""
+
+    methods = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        response = self.get_response(request)
+
+        match = getattr(request, "resolver_match", None)
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            view=match.view_name if match else "unresolved",
+            method=request.method if request.method in self.methods else "other",
+        )
+        return response
+
+
+class ProfilingMiddleware:
+    """
+    Профилирование одного запроса по требованию: cProfile и tracemalloc вокруг view.
+
+    Включается настройкой REQUEST_PROFILING и срабатывает только для staff-пользователей, передавших
+    параметр ?profile=<режим> или заголовок X-Profile: <режим>. Вместо ответа view возвращается отчёт:
+    режим prof — файл .prof для snakeviz, режим с ключом сортировки pstats (tottime, calls, ...) —
+    текстовый отчёт с этой сортировкой, любое другое значение — текстовый отчёт по cumulative.
+    Middleware должен стоять после AuthenticationMiddleware.
+    """
+
+    sort_keys = {"cumulative", "tottime", "calls", "ncalls", "time", "filename", "name"}
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = request.GET.get("profile") or request.headers.get("X-Profile")
+        user = getattr(request, "user", None)
+        if not mode or user is None or not user.is_staff:
+            return self.get_response(request)
+
+        try:
+            with Profiler() as profiler:
+                response = self.get_response(request)
+        except ProfilerBusy:
+            response = self.get_response(request)
+            response["X-Profile"] = "busy"
+            return response
+
+        logger.info("Профилирование запроса %s %s пользователем id=%s", request.method, request.path, user.pk)
+
+        if mode == "prof":
+            report = HttpResponse(profiler.dump_bytes(), content_type="application/octet-stream")
+            report["Content-Disposition"] = 'attachment; filename="request.prof"'
+            return report
+
+        sort = mode if mode in self.sort_keys else "cumulative"
+        header = f"{request.method} {request.get_full_path()} -> {response.status_code}\n\n"
+        return HttpResponse(
+            header + profiler.stats(sort) + "\n" + profiler.allocations(),
+            content_type="text/plain; charset=utf-8",
+        )
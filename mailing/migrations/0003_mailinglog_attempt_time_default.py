@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:22
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0002_initial"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="mailinglog",
+            name="attempt_time",
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
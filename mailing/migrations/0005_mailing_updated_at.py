@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0004_outboxmessage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="mailing",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, db_index=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0005_mailing_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MailingStats",
+            fields=[
+                (
+                    "mailing",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="delivery_stats",
+                        serialize=False,
+                        to="mailing.mailing",
+                    ),
+                ),
+                ("attempts", models.PositiveIntegerField(default=0)),
+                ("success", models.PositiveIntegerField(default=0)),
+                ("failed", models.PositiveIntegerField(default=0)),
+                ("last_attempt_time", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name": "Статистика рассылки",
+                "verbose_name_plural": "Статистика рассылок",
+            },
+        ),
+    ]
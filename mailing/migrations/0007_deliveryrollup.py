@@ -0,0 +1,71 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0006_mailingstats"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RollupWatermark",
+            fields=[
+                ("name", models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ("last_id", models.BigIntegerField(default=0)),
+                ("seen_id", models.BigIntegerField(default=0)),
+                ("seen_at", models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                "verbose_name": "Отметка обработки логов",
+                "verbose_name_plural": "Отметки обработки логов",
+            },
+        ),
+        migrations.CreateModel(
+            name="DeliveryRollup",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("period", models.CharField(choices=[("hour", "Час"), ("day", "Сутки")], max_length=4)),
+                ("bucket", models.DateTimeField(verbose_name="Начало интервала")),
+                (
+                    "status",
+                    models.CharField(choices=[("success", "Успешно"), ("failed", "Не успешно")], max_length=255),
+                ),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "mailing",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="delivery_rollups",
+                        to="mailing.mailing",
+                    ),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="delivery_rollups",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Сводка попыток за интервал",
+                "verbose_name_plural": "Сводки попыток за интервалы",
+                "indexes": [
+                    models.Index(fields=["period", "owner", "bucket"], name="rollup_owner_bucket_idx"),
+                    models.Index(fields=["period", "bucket"], name="rollup_bucket_idx"),
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("period", "owner", "mailing", "bucket", "status"), name="rollup_unique_bucket"
+                    )
+                ],
+            },
+        ),
+    ]
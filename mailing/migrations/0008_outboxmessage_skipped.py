@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0007_deliveryrollup"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="outboxmessage",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("pending", "В очереди"),
+                    ("processing", "Отправляется"),
+                    ("sent", "Отправлено"),
+                    ("failed", "Ошибка"),
+                    ("skipped", "Пропущено"),
+                ],
+                default="pending",
+                max_length=20,
+            ),
+        ),
+    ]
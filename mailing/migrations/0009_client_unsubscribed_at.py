@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mailing", "0008_outboxmessage_skipped"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="client",
+            name="unsubscribed_at",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="Отписан"),
+        ),
+    ]
@@ -0,0 +1,148 @@
+import re
+from collections.abc import Callable
+from email.utils import formatdate
+from functools import lru_cache
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.mail import EmailMessage, forbid_multi_line_headers, make_msgid
+from django.core.mail.message import RFC5322_EMAIL_LINE_LENGTH_LIMIT, sanitize_address
+from django.core.mail.utils import DNS_NAME
+from django.utils.module_loading import import_string
+
+from .personalization import MessagePlan, message_plan
+from .recipients import Recipient
+
+# CRLF и одиночные CR в теле приводятся к LF, затем все переводы строк записываются как CRLF (как в email.generator).
+_LINE_BREAK_RE = re.compile(rb"\r\n|\r")
+
+
+class Envelope(NamedTuple):
+    """Готовое к отправке письмо: адреса конверта SMTP и байты MIME-сообщения."""
+
+    from_email: str
+    recipients: list[str]
+    payload: bytes
+
+
+class PreparedMessage:
+    """
+    MIME-письмо рассылки, собранное и закодированное один раз.
+
+    Тема, тело и остальные заголовки кодируются при создании объекта (определение кодировки,
+    encoded-words в заголовках, Content-Transfer-Encoding тела). Для каждого получателя
+    к готовым байтам добавляются только заголовки To, Date и Message-ID.
+
+    Если в теме или теле есть подстановки (см. personalization), заново для получателя
+    собираются только они; письма с нестандартной кодировкой или строками длиннее 998 байт
+    после подстановки собираются целиком через EmailMessage.
+    """
+
+    def __init__(self, plan: MessagePlan, from_email: str | None):
+        message = EmailMessage(plan.subject.text, plan.body.text, from_email)
+        mime = message.message()
+        # Date и Message-ID добавляются к каждому письму: объект кешируется на весь процесс
+        # (send_mailings --daemon, mailing_worker), и время сборки устарело бы к следующему запуску.
+        del mime["Message-ID"]
+        del mime["Date"]
+
+        self.plan = plan
+        self.encoding = message.encoding or settings.DEFAULT_CHARSET
+        self.from_email = message.from_email
+        self.envelope_from = sanitize_address(message.from_email, self.encoding)
+        self._raw_body = self.encoding.lower().replace("_", "-") in ("utf-8", "utf8")
+
+        if not plan.subject.static:
+            del mime["Subject"]
+        if not plan.body.static:
+            del mime["Content-Transfer-Encoding"]
+
+        head, _separator, body_bytes = mime.as_bytes(linesep="\r\n").partition(b"\r\n\r\n")
+        self._head = head + b"\r\n"
+        self._body = body_bytes
+
+    def envelope(self, recipient: Recipient) -> Envelope:
+        """Возвращает письмо для одного получателя (client_id, email, name)."""
+        email = recipient[1]
+        to = [sanitize_address(email, self.encoding)]
+        headers = [
+            b"To: ",
+            self._header("To", email),
+            b"\r\nDate: ",
+            formatdate(localtime=settings.EMAIL_USE_LOCALTIME).encode(),
+            b"\r\nMessage-ID: ",
+            make_msgid(domain=DNS_NAME).encode(),
+        ]
+        body = self._body
+
+        if not self.plan.subject.static:
+            headers += (b"\r\nSubject: ", self._header("Subject", self.plan.subject.render(recipient)))
+
+        if not self.plan.body.static:
+            rendered = self.plan.body.render(recipient)
+            body = self._encode_body(rendered)
+            if body is None:
+                return Envelope(self.envelope_from, to, self._full_message(recipient, rendered))
+            headers += (b"\r\nContent-Transfer-Encoding: ", b"7bit" if body.isascii() else b"8bit")
+
+        return Envelope(self.envelope_from, to, b"".join((*headers, b"\r\n", self._head, b"\r\n", body)))
+
+    def _header(self, name: str, value: str) -> bytes:
+        _name, value = forbid_multi_line_headers(name, value, self.encoding)
+        return value.replace("\n", "\r\n").encode()
+
+    def _encode_body(self, text: str) -> bytes | None:
+        """Кодирует тело как 7bit/8bit UTF-8; None, если это невозможно и письмо нужно собрать целиком."""
+        if not self._raw_body:
+            return None
+
+        data = text.encode("utf-8", errors="surrogateescape")
+        if b"\r" in data:
+            data = _LINE_BREAK_RE.sub(b"\n", data)
+
+        lines = data.split(b"\n")
+        if max(map(len, lines)) > RFC5322_EMAIL_LINE_LENGTH_LIMIT:
+            return None
+
+        return b"\r\n".join(lines)
+
+    def _full_message(self, recipient: Recipient, body: str) -> bytes:
+        message = EmailMessage(self.plan.subject.render(recipient), body, self.from_email, [recipient[1]])
+        return message.message().as_bytes(linesep="\r\n")
+
+
+@lru_cache(maxsize=128)
+def _prepare(plan: MessagePlan, from_email: str | None) -> PreparedMessage:
+    return PreparedMessage(plan, from_email)
+
+
+def prepare_message(message, from_email: str | None) -> PreparedMessage:
+    """
+    Возвращает PreparedMessage для Message из кеша.
+    План подстановок кешируется по id и хешу содержимого, поэтому отредактированное сообщение собирается заново.
+    """
+    return _prepare(message_plan(message), from_email)
+
+
+def supports_raw_send() -> bool:
+    """Готовые байты можно отправлять только через SMTP-бэкенд; остальным бэкендам нужен EmailMessage."""
+    from django.core.mail.backends.smtp import EmailBackend
+
+    return issubclass(import_string(settings.EMAIL_BACKEND), EmailBackend)
+
+
+def message_builder(message, from_email: str | None) -> Callable[[Recipient], EmailMessage | Envelope]:
+    """
+    Возвращает функцию, которая по получателю (client_id, email, name) строит письмо для ManagedConnection.send:
+    Envelope из PreparedMessage для SMTP-бэкенда или обычный EmailMessage для остальных бэкендов.
+    """
+    if supports_raw_send():
+        return prepare_message(message, from_email).envelope
+
+    plan = message_plan(message)
+
+    def build(recipient: Recipient) -> EmailMessage:
+        subject, body = plan.render(recipient)
+        return EmailMessage(subject, body, from_email, [recipient[1]])
+
+    return build
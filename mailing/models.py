@@ -2,6 +2,7 @@ import logging
 
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import Case, CharField, Value, When
 from django.utils import timezone
 
 from users.models import User
@@ -23,6 +24,8 @@ class Client(models.Model):
         related_name="clients",
         verbose_name="Владелец клиента",
     )
+    # Время отписки по ссылке из письма: такой клиент не получает писем и не добавляется в новые рассылки.
+    unsubscribed_at = models.DateTimeField("Отписан", null=True, blank=True)
 
     def __str__(self):
         return self.name
@@ -60,9 +63,48 @@ class Message(models.Model):
         ]
 
 
+class MailingQuerySet(models.QuerySet):
+    def with_effective_status(self, now=None):
+        """
+        Аннотирует effective_status — статус по интервалу рассылки на момент now, вычисленный в SQL
+        (те же правила, что в Mailing.update_status). По нему можно фильтровать, считать и сортировать,
+        не загружая рассылки в Python и не дожидаясь записи нового статуса в БД.
+        """
+        now = now or timezone.now()
+        return self.annotate(
+            effective_status=Case(
+                When(start_time__gt=now, then=Value("created")),
+                When(end_time__gte=now, then=Value("started")),
+                default=Value("finished"),
+                output_field=CharField(),
+            )
+        )
+
+    def sweep_statuses(self, now=None) -> dict[str, int]:
+        """
+        Переводит статусы наступивших рассылок двумя UPDATE: created -> started для рассылок внутри
+        интервала и created/started -> finished для рассылок, чей интервал закончился.
+        Возвращает количество переведённых рассылок по новому статусу.
+        """
+        now = now or timezone.now()
+        started = self.filter(status="created", start_time__lte=now, end_time__gte=now).update(
+            status="started", updated_at=now
+        )
+        finished = self.filter(status__in=("created", "started"), end_time__lt=now).update(
+            status="finished", updated_at=now
+        )
+        return {"started": started, "finished": finished}
+
+
 class Mailing(models.Model):
     """Модель рассылки. Управляет временем отправки, статусом и связью с сообщениями и клиентами."""
 
+    STATUS_CHOICES = (
+        ("created", "Создана"),
+        ("started", "Запущена"),
+        ("finished", "Завершена"),
+    )
+
     start_time = models.DateTimeField("Дата и время начала отправки")
     end_time = models.DateTimeField("Дата и время окончания отправки")
     owner = models.ForeignKey(
@@ -74,18 +116,13 @@ class Mailing(models.Model):
         verbose_name="Владелец рассылки",
     )
 
-    status = models.CharField(
-        max_length=20,
-        choices=(
-            ("created", "Создана"),
-            ("started", "Запущена"),
-            ("finished", "Завершена"),
-        ),
-        default="created",
-    )
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="created")
 
     message = models.ForeignKey(Message, on_delete=models.CASCADE)
     clients = models.ManyToManyField(Client)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = MailingQuerySet.as_manager()
 
     def clean(self):
         """
@@ -102,22 +139,30 @@ class Mailing(models.Model):
             if self.start_time >= self.end_time:
                 raise ValidationError({"end_time": "Дата окончания рассылки должна быть позже даты начала."})
 
-    def update_status(self, save=True):
-        """Обновляет статус рассылки на основе текущего времени и интервала отправки."""
-        now = timezone.now()
+    def calculate_status(self, now=None) -> str:
+        """Статус рассылки по текущему времени и интервалу отправки."""
+        now = now or timezone.now()
 
         if now < self.start_time:
-            new_status = "created"
-        elif self.start_time <= now <= self.end_time:
-            new_status = "started"
-        else:
-            new_status = "finished"
+            return "created"
+        if self.start_time <= now <= self.end_time:
+            return "started"
+        return "finished"
+
+    def get_effective_status_display(self) -> str:
+        """Название статуса по effective_status из with_effective_status(), без аннотации — по текущему времени."""
+        status = getattr(self, "effective_status", None) or self.calculate_status()
+        return dict(self.STATUS_CHOICES)[status]
+
+    def update_status(self, save=True):
+        """Обновляет статус рассылки на основе текущего времени и интервала отправки."""
+        new_status = self.calculate_status()
 
         if new_status != self.status:
             old_status = self.status
             self.status = new_status
             if save:
-                self.save(update_fields=["status"])
+                self.save(update_fields=["status", "updated_at"])
             logger.info(
                 "Обновление статуса рассылки id=%s: %s → %s",
                 self.id,
@@ -140,7 +185,7 @@ class Mailing(models.Model):
 class MailingLog(models.Model):
     """Лог попыток отправки рассылки. Фиксирует статус и ответ сервера."""
 
-    attempt_time = models.DateTimeField(auto_now_add=True)
+    attempt_time = models.DateTimeField(default=timezone.now, editable=False)
     status = models.CharField(max_length=255, choices=(("success", "Успешно"), ("failed", "Не успешно")))
     server_response = models.TextField()
     mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE)
@@ -158,3 +203,125 @@ class MailingLog(models.Model):
     class Meta:
         verbose_name = "Попытка рассылки"
         verbose_name_plural = "Попытки рассылок"
+
+
+class MailingStats(models.Model):
+    """
+    Счётчики попыток отправки рассылки. Обновляются F-выражениями при каждой записи пачки MailingLog,
+    поэтому страницы статистики читают по строке на рассылку вместо подсчёта всех логов.
+    Пересчитываются из MailingLog командой rebuild_mailing_stats.
+    """
+
+    mailing = models.OneToOneField(
+        Mailing,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="delivery_stats",
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    success = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    last_attempt_time = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.mailing_id}: {self.success}/{self.attempts}"
+
+    class Meta:
+        verbose_name = "Статистика рассылки"
+        verbose_name_plural = "Статистика рассылок"
+
+
+class DeliveryRollup(models.Model):
+    """
+    Количество попыток отправки рассылки с данным статусом за час или сутки.
+    Заполняется командой rollup_mailing_logs по новым строкам MailingLog, поэтому отчёты
+    за длительный период читают по строке на интервал, а не логи.
+    """
+
+    PERIOD_CHOICES = (("hour", "Час"), ("day", "Сутки"))
+
+    period = models.CharField(max_length=4, choices=PERIOD_CHOICES)
+    bucket = models.DateTimeField("Начало интервала")
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name="delivery_rollups")
+    mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, related_name="delivery_rollups")
+    status = models.CharField(max_length=255, choices=(("success", "Успешно"), ("failed", "Не успешно")))
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.mailing_id} {self.period} {self.bucket:%Y-%m-%d %H:%M} {self.status}: {self.count}"
+
+    class Meta:
+        verbose_name = "Сводка попыток за интервал"
+        verbose_name_plural = "Сводки попыток за интервалы"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["period", "owner", "mailing", "bucket", "status"],
+                name="rollup_unique_bucket",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["period", "owner", "bucket"], name="rollup_owner_bucket_idx"),
+            models.Index(fields=["period", "bucket"], name="rollup_bucket_idx"),
+        ]
+
+
+class RollupWatermark(models.Model):
+    """
+    Докуда обработаны строки MailingLog для сводок: last_id — последний учтённый id.
+    seen_id и seen_at — максимальный id на момент предыдущего запуска; строки до seen_id
+    обрабатываются не раньше чем через settle секунд, когда транзакции с меньшими id уже завершены.
+    """
+
+    name = models.CharField(max_length=64, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+    seen_id = models.BigIntegerField(default=0)
+    seen_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.name}: {self.last_id}"
+
+    class Meta:
+        verbose_name = "Отметка обработки логов"
+        verbose_name_plural = "Отметки обработки логов"
+
+
+class OutboxMessage(models.Model):
+    """
+    Письмо в очереди отправки: одна строка на получателя запущенной рассылки.
+    Строки забирают воркеры mailing_worker через SELECT ... FOR UPDATE SKIP LOCKED.
+    """
+
+    mailing = models.ForeignKey(Mailing, on_delete=models.CASCADE, related_name="outbox")
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name="outbox")
+    status = models.CharField(
+        max_length=20,
+        choices=(
+            ("pending", "В очереди"),
+            ("processing", "Отправляется"),
+            ("sent", "Отправлено"),
+            ("failed", "Ошибка"),
+            ("skipped", "Пропущено"),
+        ),
+        default="pending",
+    )
+    attempts = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=255, blank=True)
+
+    def __str__(self):
+        return f"{self.mailing_id} → {self.client_id} ({self.get_status_display()})"
+
+    class Meta:
+        verbose_name = "Письмо в очереди"
+        verbose_name_plural = "Очередь отправки"
+        indexes = [
+            models.Index(fields=["status", "id"], name="outbox_status_id_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["mailing", "client"],
+                condition=models.Q(status__in=["pending", "processing"]),
+                name="outbox_unique_active_recipient",
+            ),
+        ]
@@ -0,0 +1,147 @@
+import logging
+import os
+import socket
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .log_buffer import MailingLogBuffer
+from .mime import message_builder
+from .models import Mailing, OutboxMessage
+from .progress import record_progress, start_progress
+from .recipients import count_recipients, iter_recipient_chunks
+from .services import check_mailing_window, record_outcome
+
+logger = logging.getLogger("mailing")
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def enqueue_mailing(mailing: Mailing) -> dict:
+    """
+    Ставит рассылку в очередь отправки: по строке OutboxMessage на каждого получателя.
+
+    Получатели, для которых в очереди уже есть неотправленное письмо этой рассылки, пропускаются,
+    поэтому повторный запуск не приводит к дублям.
+    """
+    error = check_mailing_window(mailing)
+    if error:
+        return {"ok": False, "error": error, "total": 0}
+
+    mailing.update_status()
+
+    total = count_recipients(mailing.id)
+    start_progress(mailing.id, total)
+
+    for chunk in iter_recipient_chunks(mailing.id):
+        OutboxMessage.objects.bulk_create(
+            [OutboxMessage(mailing_id=mailing.id, client_id=client_id) for client_id, *_ in chunk],
+            ignore_conflicts=True,
+        )
+
+    logger.info("Рассылка id=%s поставлена в очередь: %s получателей", mailing.id, total)
+    return {"ok": True, "error": "", "total": total}
+
+
+def claim_batch(worker_id: str, batch_size: int | None = None) -> list[OutboxMessage]:
+    """
+    Забирает пачку писем из очереди и помечает их как отправляемые этим воркером.
+
+    Строки блокируются через SELECT ... FOR UPDATE SKIP LOCKED, поэтому параллельные воркеры
+    получают непересекающиеся пачки. Письма, зависшие в статусе processing дольше
+    MAILING_OUTBOX_LEASE секунд (воркер упал), забираются повторно.
+    """
+    batch_size = batch_size or settings.MAILING_OUTBOX_BATCH_SIZE
+    now = timezone.now()
+    lease_expired = now - timedelta(seconds=settings.MAILING_OUTBOX_LEASE)
+
+    with transaction.atomic():
+        ids = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(Q(status="pending") | Q(status="processing", locked_at__lt=lease_expired))
+            .order_by("id")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return []
+
+        OutboxMessage.objects.filter(id__in=ids).update(
+            status="processing",
+            locked_at=now,
+            locked_by=worker_id,
+            attempts=F("attempts") + 1,
+        )
+
+    return list(OutboxMessage.objects.filter(id__in=ids).select_related("client", "mailing__message").order_by("id"))
+
+
+def _current_recipients(rows: list[OutboxMessage]) -> set[tuple[int, int]]:
+    # Пары (mailing_id, client_id) пачки, которые всё ещё есть среди получателей рассылки
+    # и не отписались: одним запросом.
+    return set(
+        Mailing.clients.through.objects.filter(
+            mailing_id__in={row.mailing_id for row in rows},
+            client_id__in={row.client_id for row in rows},
+            client__unsubscribed_at__isnull=True,
+        ).values_list("mailing_id", "client_id")
+    )
+
+
+def process_batch(rows: list[OutboxMessage], transport) -> dict:
+    """
+    Отправляет забранную пачку через transport (ManagedConnection или ThreadedSender),
+    пишет MailingLog и помечает строки очереди как sent или failed в одной транзакции.
+    Клиенты, которых после постановки в очередь убрали из рассылки или которые отписались,
+    пропускаются (skipped) без попытки отправки.
+    """
+    from_email = getattr(settings, "DEFAULT_FROM_EMAIL", None)
+    sent_ids: list[int] = []
+    failed_ids: list[int] = []
+    skipped_ids: list[int] = []
+    skipped_per_mailing = Counter()
+    recipients = _current_recipients(rows)
+    builders = {}
+
+    # Логи пачки пишутся одним bulk_create в той же транзакции, что и смена статусов в очереди.
+    with MailingLogBuffer(flush_size=len(rows) + 1, flush_interval=float("inf")) as log_buffer:
+        to_send = []
+        for row in rows:
+            if (row.mailing_id, row.client_id) not in recipients:
+                skipped_ids.append(row.id)
+                skipped_per_mailing[row.mailing_id] += 1
+            elif check_mailing_window(row.mailing):
+                log_buffer.add(row.mailing_id, row.client_id, "failed", "Окно рассылки завершилось до отправки")
+                failed_ids.append(row.id)
+            else:
+                to_send.append(row)
+
+        emails = []
+        for row in to_send:
+            # Письмо рассылки собирается один раз на пачку, для строки подставляется только получатель.
+            if row.mailing_id not in builders:
+                builders[row.mailing_id] = message_builder(row.mailing.message, from_email)
+            emails.append(builders[row.mailing_id]((row.client_id, row.client.email, row.client.name)))
+
+        for row, (sent, exc) in zip(to_send, transport.send_batch(emails)):
+            if record_outcome(log_buffer, row.mailing_id, row.client_id, sent, exc):
+                sent_ids.append(row.id)
+            else:
+                failed_ids.append(row.id)
+
+        with transaction.atomic():
+            log_buffer.flush()
+            OutboxMessage.objects.filter(id__in=sent_ids).update(status="sent", locked_at=None)
+            OutboxMessage.objects.filter(id__in=failed_ids).update(status="failed", locked_at=None)
+            OutboxMessage.objects.filter(id__in=skipped_ids).update(status="skipped", locked_at=None)
+
+    # Пропущенные письма тоже считаются обработанными, иначе прогресс рассылки не дойдёт до total.
+    for mailing_id, count in skipped_per_mailing.items():
+        record_progress(mailing_id, skipped=count)
+
+    return {"total": len(rows), "success": len(sent_ids), "failed": len(failed_ids), "skipped": len(skipped_ids)}
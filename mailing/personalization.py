@@ -0,0 +1,125 @@
+import hashlib
+import re
+from collections.abc import Callable
+from functools import lru_cache
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core import signing
+from django.urls import reverse
+
+from .recipients import Recipient
+
+PLACEHOLDER_RE = re.compile(r"\{\{\s*([\w.]+)\s*\}\}")
+
+UNSUBSCRIBE_SALT = "mailing.unsubscribe"
+
+# Кеш скомпилированных сообщений: ключ — (id сообщения, хеш темы и тела).
+_PLANS_LIMIT = 256
+_plans: dict[tuple[int, str], "MessagePlan"] = {}
+
+
+def unsubscribe_token(client_id: int) -> str:
+    return signing.Signer(salt=UNSUBSCRIBE_SALT).sign(str(client_id))
+
+
+def client_id_from_token(token: str) -> int:
+    """Возвращает id клиента из токена отписки. При подделанном токене выбрасывает signing.BadSignature."""
+    return int(signing.Signer(salt=UNSUBSCRIBE_SALT).unsign(token))
+
+
+@lru_cache(maxsize=1)
+def _unsubscribe_path() -> tuple[str, str]:
+    # reverse() на каждого получателя дороже всей остальной подстановки, поэтому путь разбирается один раз.
+    prefix, suffix = reverse("mailing:unsubscribe", args=["token"]).rsplit("token", 1)
+    return prefix, suffix
+
+
+def unsubscribe_url(client_id: int) -> str:
+    prefix, suffix = _unsubscribe_path()
+    return f"{settings.SITE_URL.rstrip('/')}{prefix}{unsubscribe_token(client_id)}{suffix}"
+
+
+# Поддерживаемые подстановки и способ получить значение из строки получателя (id, email, name).
+FIELDS: dict[str, Callable[[Recipient], str]] = {
+    "client.id": lambda recipient: str(recipient[0]),
+    "client.email": lambda recipient: recipient[1],
+    "client.name": lambda recipient: recipient[2],
+    "unsubscribe_url": lambda recipient: unsubscribe_url(recipient[0]),
+}
+
+
+class CompiledTemplate:
+    """
+    Текст с подстановками, разобранный один раз в план: чередование готовых кусков текста
+    и функций, достающих значение из строки получателя.
+    Неизвестные подстановки остаются в тексте как есть.
+    """
+
+    __slots__ = ("text", "_head", "_steps")
+
+    def __init__(self, text: str):
+        self.text = text
+        literals = []
+        getters = []
+        position = 0
+
+        for match in PLACEHOLDER_RE.finditer(text):
+            getter = FIELDS.get(match.group(1))
+            if getter is None:
+                continue
+            literals.append(text[position : match.start()])
+            getters.append(getter)
+            position = match.end()
+        literals.append(text[position:])
+
+        self._head = literals[0]
+        self._steps = tuple(zip(getters, literals[1:]))
+
+    @property
+    def static(self) -> bool:
+        return not self._steps
+
+    def render(self, recipient: Recipient) -> str:
+        if not self._steps:
+            return self.text
+
+        parts = [self._head]
+        for getter, literal in self._steps:
+            parts.append(getter(recipient))
+            parts.append(literal)
+        return "".join(parts)
+
+
+class MessagePlan(NamedTuple):
+    """Скомпилированные тема и тело сообщения."""
+
+    subject: CompiledTemplate
+    body: CompiledTemplate
+
+    @property
+    def static(self) -> bool:
+        return self.subject.static and self.body.static
+
+    def render(self, recipient: Recipient) -> tuple[str, str]:
+        return self.subject.render(recipient), self.body.render(recipient)
+
+
+def content_hash(subject: str, body: str) -> str:
+    return hashlib.blake2b(f"{subject}\0{body}".encode(), digest_size=16).hexdigest()
+
+
+def message_plan(message) -> MessagePlan:
+    """
+    Возвращает план подстановок для Message.
+    План кешируется по id и хешу содержимого, поэтому отредактированное сообщение компилируется заново.
+    """
+    key = (message.id, content_hash(message.subject, message.body))
+    plan = _plans.get(key)
+
+    if plan is None:
+        if len(_plans) >= _PLANS_LIMIT:
+            _plans.clear()
+        plan = _plans[key] = MessagePlan(CompiledTemplate(message.subject), CompiledTemplate(message.body))
+
+    return plan
@@ -0,0 +1,98 @@
+import cProfile
+import io
+import marshal
+import pstats
+import threading
+import tracemalloc
+from pathlib import Path
+
+from django.utils import timezone
+
+# cProfile и tracemalloc глобальны для процесса, поэтому одновременно работает только один профайлер.
+_active = threading.Lock()
+
+
+class ProfilerBusy(Exception):
+    """В процессе уже идёт профилирование."""
+
+
+class Profiler:
+    """
+    cProfile и снимки tracemalloc вокруг блока кода:
+
+        with Profiler() as profiler:
+            run_mailing(mailing)
+        profiler.dump(settings.LOG_DIR, "send_mailings-42")
+
+    cProfile видит только поток, в котором открыт блок (для потоков ThreadedSender — только
+    постановку писем в пул и запись логов); tracemalloc учитывает выделения памяти всех потоков.
+    """
+
+    def __init__(self, frames: int = 10):
+        self.frames = frames
+        self.profile = cProfile.Profile()
+        self._before: tracemalloc.Snapshot | None = None
+        self._after: tracemalloc.Snapshot | None = None
+        self._started_tracing = False
+
+    def __enter__(self) -> "Profiler":
+        if not _active.acquire(blocking=False):
+            raise ProfilerBusy("Профилирование уже запущено в этом процессе")
+
+        # Если трассировка уже включена (PYTHONTRACEMALLOC), её не выключаем по выходе.
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start(self.frames)
+        self._before = tracemalloc.take_snapshot()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profile.disable()
+        try:
+            self._after = tracemalloc.take_snapshot()
+            if self._started_tracing:
+                tracemalloc.stop()
+        finally:
+            _active.release()
+
+    def stats(self, sort: str = "cumulative", limit: int = 50) -> str:
+        """Самые затратные функции по pstats, отсортированные по sort."""
+        stream = io.StringIO()
+        pstats.Stats(self.profile, stream=stream).strip_dirs().sort_stats(sort).print_stats(limit)
+        return stream.getvalue()
+
+    def allocations(self, limit: int = 25) -> str:
+        """Строки кода, выделившие больше всего памяти за время блока (прирост между снимками)."""
+        filters = (
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        )
+        before = self._before.filter_traces(filters)
+        after = self._after.filter_traces(filters)
+        differences = after.compare_to(before, "lineno")
+
+        total = sum(difference.size_diff for difference in differences)
+        lines = [f"Прирост памяти: {total / 1024:.1f} КиБ, топ-{limit} строк по выделениям:"]
+        for index, difference in enumerate(differences[:limit], 1):
+            frame = difference.traceback[0]
+            lines.append(
+                f"{index:>3}. {frame.filename}:{frame.lineno}: {difference.size_diff / 1024:+.1f} КиБ "
+                f"({difference.count_diff:+} блоков), всего {difference.size / 1024:.1f} КиБ"
+            )
+        return "\n".join(lines) + "\n"
+
+    def dump_bytes(self) -> bytes:
+        """Статистика в формате .prof (marshal) для snakeviz, gprof2dot и pstats."""
+        self.profile.create_stats()
+        return marshal.dumps(self.profile.stats)
+
+    def dump(self, directory: Path, name: str) -> tuple[Path, Path]:
+        """Пишет <name>-<время>.prof и <name>-<время>-alloc.txt в directory. Возвращает пути к файлам."""
+        stem = f"{name}-{timezone.localtime():%Y%m%d-%H%M%S}"
+        prof_path = Path(directory) / f"{stem}.prof"
+        alloc_path = Path(directory) / f"{stem}-alloc.txt"
+
+        self.profile.dump_stats(prof_path)
+        alloc_path.write_text(self.allocations() + "\n" + self.stats(limit=30), encoding="utf-8")
+        return prof_path, alloc_path
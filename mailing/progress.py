@@ -0,0 +1,68 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+def _key(mailing_id: int, field: str) -> str:
+    return f"mailing:progress:{mailing_id}:{field}"
+
+
+def start_progress(mailing_id: int, total: int) -> None:
+    """Сбрасывает счётчики прогресса отправки рассылки перед новым запуском."""
+    cache.set_many(
+        {
+            _key(mailing_id, "total"): total,
+            _key(mailing_id, "sent"): 0,
+            _key(mailing_id, "failed"): 0,
+            _key(mailing_id, "skipped"): 0,
+            _key(mailing_id, "started_at"): time.time(),
+        },
+        settings.MAILING_PROGRESS_TTL,
+    )
+
+
+def record_progress(mailing_id: int, sent: int = 0, failed: int = 0, skipped: int = 0) -> None:
+    """
+    Увеличивает счётчики отправленных, неотправленных и пропущенных писем (получатель убран из рассылки
+    или отписался после постановки в очередь). Без start_progress ничего не делает.
+    """
+    for field, delta in (("sent", sent), ("failed", failed), ("skipped", skipped)):
+        if not delta:
+            continue
+        try:
+            cache.incr(_key(mailing_id, field), delta)
+        except ValueError:
+            # Счётчики не заведены (рассылка запущена в обход start_progress) или уже истекли.
+            pass
+
+
+def get_progress(mailing_id: int) -> dict:
+    """Возвращает прогресс отправки: total, sent, failed, skipped, done, eta (секунд до завершения или None)."""
+    fields = ("total", "sent", "failed", "skipped", "started_at")
+    values = cache.get_many([_key(mailing_id, field) for field in fields])
+    total, sent, failed, skipped, started_at = (values.get(_key(mailing_id, field)) for field in fields)
+
+    if total is None:
+        return {"active": False, "total": 0, "sent": 0, "failed": 0, "skipped": 0, "done": True, "eta": None}
+
+    sent = sent or 0
+    failed = failed or 0
+    skipped = skipped or 0
+    processed = sent + failed + skipped
+    done = processed >= total
+
+    eta = None
+    if not done and processed and started_at:
+        rate = processed / max(time.time() - started_at, 1e-6)
+        eta = round((total - processed) / rate)
+
+    return {
+        "active": True,
+        "total": total,
+        "sent": sent,
+        "failed": failed,
+        "skipped": skipped,
+        "done": done,
+        "eta": eta,
+    }
@@ -0,0 +1,70 @@
+from collections.abc import AsyncIterator, Iterator
+
+from django.conf import settings
+
+from .models import Mailing
+
+Recipient = tuple[int, str, str]
+
+
+def _recipients_qs(mailing_id: int, client_range: tuple[int | None, int | None] | None = None):
+    qs = Mailing.clients.through.objects.filter(mailing_id=mailing_id, client__unsubscribed_at__isnull=True)
+
+    if client_range is not None:
+        first_client_id, last_client_id = client_range
+        if first_client_id is not None:
+            qs = qs.filter(client_id__gte=first_client_id)
+        if last_client_id is not None:
+            qs = qs.filter(client_id__lte=last_client_id)
+
+    return qs
+
+
+def count_recipients(mailing_id: int, client_range: tuple[int | None, int | None] | None = None) -> int:
+    return _recipients_qs(mailing_id, client_range).count()
+
+
+def _chunk_qs(mailing_id, client_range, last_client_id: int, chunk_size: int):
+    return (
+        _recipients_qs(mailing_id, client_range)
+        .filter(client_id__gt=last_client_id)
+        .order_by("client_id")
+        .values_list("client_id", "client__email", "client__name")[:chunk_size]
+    )
+
+
+def iter_recipient_chunks(
+    mailing_id: int,
+    client_range: tuple[int | None, int | None] | None = None,
+    chunk_size: int | None = None,
+) -> Iterator[list[Recipient]]:
+    """
+    Потоково отдаёт получателей рассылки пачками кортежей (client_id, email, name).
+
+    Пагинация идёт по ключу client_id в промежуточной таблице Mailing.clients, поэтому каждый запрос
+    читает не больше chunk_size строк, а в памяти одновременно находится только одна пачка.
+    """
+    chunk_size = chunk_size or settings.MAILING_SEND_BATCH_SIZE
+    last_client_id = 0
+
+    while chunk := list(_chunk_qs(mailing_id, client_range, last_client_id, chunk_size)):
+        yield chunk
+        if len(chunk) < chunk_size:
+            break
+        last_client_id = chunk[-1][0]
+
+
+async def aiter_recipient_chunks(
+    mailing_id: int,
+    client_range: tuple[int | None, int | None] | None = None,
+    chunk_size: int | None = None,
+) -> AsyncIterator[list[Recipient]]:
+    """Асинхронный вариант iter_recipient_chunks на асинхронном ORM."""
+    chunk_size = chunk_size or settings.MAILING_SEND_BATCH_SIZE
+    last_client_id = 0
+
+    while chunk := [row async for row in _chunk_qs(mailing_id, client_range, last_client_id, chunk_size)]:
+        yield chunk
+        if len(chunk) < chunk_size:
+            break
+        last_client_id = chunk[-1][0]
@@ -0,0 +1,162 @@
+from collections import Counter
+from datetime import date, datetime, time, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Q, Sum
+from django.db.models.functions import Trunc
+from django.utils import timezone
+
+from .cache_versions import bump
+from .models import DeliveryRollup, MailingLog, RollupWatermark
+
+WATERMARK = "mailing_logs"
+PERIODS = ("hour", "day")
+
+
+def rollup_logs(settle: int = 60, chunk_size: int = 10000) -> int:
+    """
+    Добавляет в DeliveryRollup строки MailingLog, появившиеся после отметки, и возвращает их количество.
+
+    Обрабатываются id до максимального, замеченного предыдущим запуском не менее settle секунд назад:
+    id выдаются при вставке, а фиксируются транзакции в другом порядке, поэтому свежий хвост таблицы
+    может ещё получить строки с меньшими id. settle=0 - обработать всё до текущего максимума (заполнение
+    после миграции, отправка остановлена). Каждая порция по chunk_size id учитывается в своей транзакции
+    вместе со сдвигом отметки, так что прерванный запуск продолжается с места остановки без повторов.
+    """
+    now = timezone.now()
+
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK)
+        max_id = MailingLog.objects.aggregate(max_id=Max("id"))["max_id"] or 0
+
+        if not settle:
+            upto = max_id
+        elif watermark.seen_at is not None and watermark.seen_at <= now - timedelta(seconds=settle):
+            upto = watermark.seen_id
+        else:
+            upto = watermark.last_id
+
+        # Новый замер ставится, только когда предыдущий уже учтён, иначе при запусках чаще settle
+        # отметка отодвигалась бы каждый раз и логи не обрабатывались бы никогда.
+        if watermark.seen_id <= upto:
+            watermark.seen_id = max_id
+            watermark.seen_at = now
+            watermark.save(update_fields=["seen_id", "seen_at"])
+
+        start = watermark.last_id
+
+    processed = 0
+    while start < upto:
+        end = min(start + chunk_size, upto)
+
+        with transaction.atomic():
+            watermark = RollupWatermark.objects.select_for_update().get(name=WATERMARK)
+            if watermark.last_id != start:
+                # Порцию уже учёл параллельный запуск.
+                break
+
+            logs = MailingLog.objects.filter(id__gt=start, id__lte=end)
+            for period in PERIODS:
+                _merge(period, logs)
+
+            # Попытки порции по владельцам: для счётчика обработанных и сброса кеша их статистики.
+            owners = Counter(dict(logs.values_list("mailing__owner_id").annotate(count=Count("id")).order_by()))
+            processed += owners.total()
+            if owners:
+                bump(owners)
+
+            watermark.last_id = end
+            watermark.save(update_fields=["last_id"])
+
+        start = end
+
+    return processed
+
+
+def _merge(period: str, logs) -> None:
+    # Попытки порции группируются в SQL, затем прибавляются к существующим строкам сводки.
+    grouped = (
+        logs.values("mailing_id", "status", owner_id=F("mailing__owner_id"), bucket=Trunc("attempt_time", period))
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    counts = {(row["owner_id"], row["mailing_id"], row["bucket"], row["status"]): row["count"] for row in grouped}
+    if not counts:
+        return
+
+    existing = DeliveryRollup.objects.filter(
+        period=period,
+        mailing_id__in={key[1] for key in counts},
+        bucket__in={key[2] for key in counts},
+    )
+    to_update = []
+    for rollup in existing:
+        count = counts.pop((rollup.owner_id, rollup.mailing_id, rollup.bucket, rollup.status), None)
+        if count is not None:
+            rollup.count += count
+            to_update.append(rollup)
+
+    DeliveryRollup.objects.bulk_update(to_update, ["count"])
+    DeliveryRollup.objects.bulk_create(
+        DeliveryRollup(
+            period=period,
+            owner_id=owner_id,
+            mailing_id=mailing_id,
+            bucket=bucket,
+            status=status,
+            count=count,
+        )
+        for (owner_id, mailing_id, bucket, status), count in counts.items()
+    )
+
+
+def rebuild_rollups(chunk_size: int = 10000) -> int:
+    """Удаляет сводки, сбрасывает отметку и заново учитывает все логи. Отправку на это время лучше остановить."""
+    with transaction.atomic():
+        DeliveryRollup.objects.all().delete()
+        RollupWatermark.objects.filter(name=WATERMARK).delete()
+
+    return rollup_logs(settle=0, chunk_size=chunk_size)
+
+
+def daily_history(owner=None, days: int = 30) -> list[dict]:
+    """
+    Попытки по дням за последние days дней (включая сегодня) из суточных сводок: список словарей
+    day, success, failed, total, success_rate и width (доля от максимального дня, для столбиков).
+    Дни без попыток заполняются нулями; owner=None - по всем пользователям.
+    """
+    today = timezone.localdate()
+    first_day = today - timedelta(days=days - 1)
+    since = timezone.make_aware(datetime.combine(first_day, time.min))
+
+    rollups = DeliveryRollup.objects.filter(period="day", bucket__gte=since)
+    if owner is not None:
+        rollups = rollups.filter(owner=owner)
+
+    totals: dict[date, tuple[int, int]] = {}
+    for row in rollups.values("bucket").annotate(
+        success=Sum("count", filter=Q(status="success")),
+        failed=Sum("count", filter=Q(status="failed")),
+    ):
+        totals[timezone.localtime(row["bucket"]).date()] = (row["success"] or 0, row["failed"] or 0)
+
+    history = []
+    for offset in range(days):
+        day = first_day + timedelta(days=offset)
+        success, failed = totals.get(day, (0, 0))
+        total = success + failed
+        history.append(
+            {
+                "day": day,
+                "success": success,
+                "failed": failed,
+                "total": total,
+                "success_rate": round(success / total * 100) if total else 0,
+            }
+        )
+
+    peak = max(item["total"] for item in history) or 1
+    for item in history:
+        item["width"] = round(item["total"] / peak * 100)
+
+    return history
@@ -0,0 +1,298 @@
+import math
+import random
+import time
+from array import array
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from itertools import accumulate
+from typing import NamedTuple
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.db import connection
+from django.utils import timezone
+
+from users.models import User
+
+from .delivery_stats import rebuild_stats
+from .models import Client, Mailing, MailingLog, Message
+from .rollups import rollup_logs
+
+# fmt: off
+FIRST_NAMES = (
+    "Александр", "Алексей", "Анна", "Дарья", "Дмитрий", "Екатерина", "Елена", "Иван", "Ирина", "Мария",
+    "Михаил", "Наталья", "Никита", "Ольга", "Павел", "Сергей", "Светлана", "Татьяна", "Юлия", "Андрей",
+)
+LAST_NAMES = (
+    "Иванов", "Смирнов", "Кузнецов", "Попов", "Васильев", "Петров", "Соколов", "Михайлов", "Новиков", "Фёдоров",
+    "Морозов", "Волков", "Алексеев", "Лебедев", "Семёнов", "Егоров", "Павлов", "Козлов", "Степанов", "Николаев",
+)
+# fmt: on
+SUBJECTS = (
+    "Новости месяца",
+    "Специальное предложение для {{ client.name }}",
+    "Скидки до конца недели",
+    "Приглашение на вебинар",
+    "Итоги года",
+    "Напоминание о заказе",
+)
+SERVER_ERRORS = (
+    "(550, b'5.1.1 Mailbox does not exist')",
+    "(552, b'5.2.2 Mailbox full')",
+    "(421, b'4.7.0 Try again later')",
+    "(554, b'5.7.1 Message rejected as spam')",
+)
+
+# Доля пользователей-менеджеров и доля неуспешных попыток отправки.
+MANAGER_SHARE = 0.01
+FAILED_SHARE = 0.05
+
+
+class MailingSpec(NamedTuple):
+    owner_id: int
+    message_id: int
+    start_time: datetime
+    end_time: datetime
+    recipients: int
+
+
+class ScaleDataGenerator:
+    """
+    Генератор объёмных тестовых данных: пользователи, клиенты, сообщения, рассылки с получателями и логи.
+
+    Всё создаётся через bulk_create пачками по batch_size строк, случайные значения берутся
+    из random.Random(seed), поэтому одинаковые параметры дают одинаковые данные.
+    Распределения приближены к реальным: число клиентов и рассылок у пользователей
+    подчиняется распределению Парето, размер рассылки — логнормальному.
+    """
+
+    def __init__(self, seed: int, batch_size: int, log: Callable[[str], None]):
+        self.seed = seed
+        self.batch_size = batch_size
+        self.log = log
+        self.rng = random.Random(seed)
+        self.now = timezone.now()
+        self.domain = f"seed{seed}.scale.test"
+
+    def generate(self, users: int, clients: int, messages: int, mailings: int, recipients: int, logs: int) -> dict:
+        owner_ids = self.create_users(users)
+        clients_by_owner = self.create_clients(owner_ids, clients)
+        owner_ids = [owner_id for owner_id in owner_ids if clients_by_owner.get(owner_id)]
+        messages_by_owner = self.create_messages(owner_ids, messages)
+        specs = self.plan_mailings(owner_ids, messages_by_owner, clients_by_owner, mailings, recipients)
+        links, attempts = self.create_mailings(specs, clients_by_owner, logs)
+
+        return {
+            "users": users,
+            "clients": clients,
+            "messages": sum(len(ids) for ids in messages_by_owner.values()),
+            "mailings": len(specs),
+            "recipients": links,
+            "logs": attempts,
+        }
+
+    def already_generated(self) -> bool:
+        return User.objects.filter(email__endswith=f"@{self.domain}").exists()
+
+    def _weights(self, count: int) -> list[float]:
+        return list(accumulate(self.rng.paretovariate(1.2) for _ in range(count)))
+
+    def _timed(self, label: str, started: float, count: int) -> None:
+        self.log(f"{label}: {count} ({time.monotonic() - started:.1f} с)")
+
+    def create_users(self, count: int) -> list[int]:
+        """Создаёт пользователей (1% — менеджеры) и возвращает id обычных пользователей — владельцев данных."""
+        started = time.monotonic()
+        password = make_password("scale-password")
+        managers = max(1, round(count * MANAGER_SHARE)) if count > 1 else 0
+        owner_ids = []
+        manager_ids = []
+
+        for offset in range(0, count, self.batch_size):
+            batch = [
+                User(
+                    email=f"user{index}@{self.domain}",
+                    password=password,
+                    first_name=self.rng.choice(FIRST_NAMES),
+                    last_name=self.rng.choice(LAST_NAMES),
+                    is_manager=index < managers,
+                )
+                for index in range(offset, min(offset + self.batch_size, count))
+            ]
+            for user in User.objects.bulk_create(batch):
+                (manager_ids if user.is_manager else owner_ids).append(user.pk)
+
+        group = Group.objects.filter(name="Managers").first()
+        if group is not None and manager_ids:
+            group.user_set.add(*manager_ids)
+
+        self._timed("Пользователи", started, count)
+        return owner_ids
+
+    def create_clients(self, owner_ids: list[int], count: int) -> dict[int, array]:
+        """Распределяет клиентов по владельцам и возвращает id клиентов каждого владельца."""
+        started = time.monotonic()
+        weights = self._weights(len(owner_ids))
+        clients_by_owner: dict[int, array] = {}
+
+        for offset in range(0, count, self.batch_size):
+            size = min(self.batch_size, count - offset)
+            owners = self.rng.choices(owner_ids, cum_weights=weights, k=size)
+            batch = [
+                Client(
+                    email=f"client{offset + index}@{self.domain}",
+                    name=f"{self.rng.choice(FIRST_NAMES)} {self.rng.choice(LAST_NAMES)}",
+                    comment="",
+                    owner_id=owner_id,
+                )
+                for index, owner_id in enumerate(owners)
+            ]
+            for client in Client.objects.bulk_create(batch):
+                clients_by_owner.setdefault(client.owner_id, array("q")).append(client.pk)
+
+        self._timed("Клиенты", started, count)
+        return clients_by_owner
+
+    def create_messages(self, owner_ids: list[int], count: int) -> dict[int, list[int]]:
+        """Создаёт сообщения: по одному каждому владельцу клиентов, остальные — случайным владельцам."""
+        started = time.monotonic()
+        count = max(count, len(owner_ids))
+        weights = self._weights(len(owner_ids))
+        owners = owner_ids + self.rng.choices(owner_ids, cum_weights=weights, k=count - len(owner_ids))
+        messages_by_owner: dict[int, list[int]] = {}
+
+        for offset in range(0, count, self.batch_size):
+            batch = [
+                Message(
+                    subject=self.rng.choice(SUBJECTS),
+                    body="Здравствуйте, {{ client.name }}!\n\n" + "Текст рассылки. " * self.rng.randint(20, 200),
+                    owner_id=owner_id,
+                )
+                for owner_id in owners[offset : offset + self.batch_size]
+            ]
+            for message in Message.objects.bulk_create(batch):
+                messages_by_owner.setdefault(message.owner_id, []).append(message.pk)
+
+        self._timed("Сообщения", started, count)
+        return messages_by_owner
+
+    def plan_mailings(
+        self,
+        owner_ids: list[int],
+        messages_by_owner: dict[int, list[int]],
+        clients_by_owner: dict[int, array],
+        count: int,
+        recipients: int,
+    ) -> list[MailingSpec]:
+        """
+        Заранее выбирает владельца, сообщение, интервал и число получателей каждой рассылки:
+        начало — от года назад до месяца вперёд, длительность — от часа до двух недель.
+        """
+        weights = self._weights(len(owner_ids))
+        # Логнормальное распределение с sigma=1 и средним recipients.
+        mu = math.log(max(recipients, 1)) - 0.5
+        specs = []
+
+        for owner_id in self.rng.choices(owner_ids, cum_weights=weights, k=count):
+            start_time = self.now + timedelta(seconds=self.rng.uniform(-365 * 86400, 30 * 86400))
+            end_time = start_time + timedelta(seconds=self.rng.uniform(3600, 14 * 86400))
+            size = min(len(clients_by_owner[owner_id]), max(1, round(self.rng.lognormvariate(mu, 1))))
+            specs.append(
+                MailingSpec(owner_id, self.rng.choice(messages_by_owner[owner_id]), start_time, end_time, size)
+            )
+
+        return specs
+
+    def _status(self, spec: MailingSpec) -> str:
+        if self.now < spec.start_time:
+            return "created"
+        if spec.start_time <= self.now <= spec.end_time:
+            return "started"
+        return "finished"
+
+    def create_mailings(
+        self, specs: list[MailingSpec], clients_by_owner: dict[int, array], logs: int
+    ) -> tuple[int, int]:
+        """
+        Создаёт рассылки, их получателей и логи попыток. Логи распределяются по начавшимся рассылкам
+        пропорционально числу получателей. Возвращает (связей рассылка-клиент, логов).
+        """
+        started = time.monotonic()
+        through = Mailing.clients.through
+        sent_recipients = sum(spec.recipients for spec in specs if spec.start_time <= self.now)
+        logs_per_recipient = logs / sent_recipients if sent_recipients else 0
+        pending_links = []
+        pending_logs = []
+        links = 0
+        attempts = 0
+        carry = 0.0
+
+        for offset in range(0, len(specs), self.batch_size):
+            batch_specs = specs[offset : offset + self.batch_size]
+            batch = Mailing.objects.bulk_create(
+                [
+                    Mailing(
+                        owner_id=spec.owner_id,
+                        message_id=spec.message_id,
+                        start_time=spec.start_time,
+                        end_time=spec.end_time,
+                        status=self._status(spec),
+                    )
+                    for spec in batch_specs
+                ]
+            )
+
+            for mailing, spec in zip(batch, batch_specs):
+                client_ids = self.rng.sample(clients_by_owner[spec.owner_id], spec.recipients)
+                pending_links += [through(mailing_id=mailing.pk, client_id=client_id) for client_id in client_ids]
+
+                if spec.start_time <= self.now:
+                    carry += spec.recipients * logs_per_recipient
+                    quota = min(int(carry + 1e-6), logs - attempts - len(pending_logs))
+                    carry -= quota
+                    pending_logs += self._logs(mailing.pk, spec, client_ids, quota)
+
+                if len(pending_links) >= self.batch_size:
+                    links += len(through.objects.bulk_create(pending_links, batch_size=self.batch_size))
+                    pending_links = []
+                if len(pending_logs) >= self.batch_size:
+                    attempts += len(MailingLog.objects.bulk_create(pending_logs, batch_size=self.batch_size))
+                    pending_logs = []
+
+            self.log(f"Рассылки: {offset + len(batch_specs)} из {len(specs)}, логов {attempts + len(pending_logs)}")
+
+        links += len(through.objects.bulk_create(pending_links, batch_size=self.batch_size))
+        attempts += len(MailingLog.objects.bulk_create(pending_logs, batch_size=self.batch_size))
+
+        self._timed("Связи рассылка-клиент", started, links)
+        self._timed("Логи", started, attempts)
+
+        started = time.monotonic()
+        self._timed("Статистика рассылок", started, rebuild_stats(self.batch_size))
+
+        started = time.monotonic()
+        self._timed("Сводки по дням и часам", started, rollup_logs(settle=0, chunk_size=self.batch_size * 10))
+        return links, attempts
+
+    def _logs(self, mailing_id: int, spec: MailingSpec, client_ids: list[int], quota: int) -> list[MailingLog]:
+        window = (min(spec.end_time, self.now) - spec.start_time).total_seconds()
+        rows = []
+
+        for _ in range(quota):
+            failed = self.rng.random() < FAILED_SHARE
+            rows.append(
+                MailingLog(
+                    mailing_id=mailing_id,
+                    client_id=self.rng.choice(client_ids),
+                    attempt_time=spec.start_time + timedelta(seconds=self.rng.uniform(0, window)),
+                    status="failed" if failed else "success",
+                    server_response=self.rng.choice(SERVER_ERRORS) if failed else "OK (send_messages returned 1)",
+                )
+            )
+
+        return rows
+
+
+def supports_bulk_ids() -> bool:
+    """Генератору нужны id строк, созданных bulk_create (PostgreSQL, SQLite 3.35+, MariaDB)."""
+    return connection.features.can_return_rows_from_bulk_insert
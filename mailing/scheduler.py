@@ -0,0 +1,157 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections.abc import Callable
+from datetime import datetime, timedelta
+
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import Mailing
+
+logger = logging.getLogger("mailing")
+
+
+class MailingScheduler:
+    """
+    Планировщик рассылок для долгоживущего процесса (send_mailings --daemon).
+
+    Держит в памяти min-кучу событий (время, тип, id рассылки): «start» в момент start_time и «finish»
+    в момент end_time. Между событиями процесс спит ровно до ближайшего из них, а раз в poll_interval
+    секунд подтягивает из БД только рассылки, изменённые после предыдущего опроса (по updated_at,
+    с перекрытием на poll_interval).
+    Устаревшие события (рассылку перенесли или удалили) отбрасываются при извлечении из кучи.
+    При каждом опросе вызывается on_poll (send_mailings передаёт массовое обновление статусов).
+    """
+
+    def __init__(
+        self,
+        on_start: Callable[[Mailing], None],
+        on_finish: Callable[[Mailing], None],
+        poll_interval: float = 30,
+        on_poll: Callable[[], object] | None = None,
+    ):
+        self.on_start = on_start
+        self.on_finish = on_finish
+        self.on_poll = on_poll
+        self.poll_interval = poll_interval
+        self.stop_event = threading.Event()
+        self._heap: list[tuple[datetime, int, str, int, int]] = []
+        self._counter = itertools.count()
+        self._versions = itertools.count()
+        # id рассылки -> (start_time, end_time, версия); события с другой версией считаются устаревшими
+        self._schedule: dict[int, tuple[datetime, datetime, int]] = {}
+        self._watermark: datetime | None = None
+
+    def stop(self) -> None:
+        self.stop_event.set()
+
+    def _push(self, when: datetime, kind: str, mailing_id: int, version: int) -> None:
+        heapq.heappush(self._heap, (when, next(self._counter), kind, mailing_id, version))
+
+    def refresh(self) -> int:
+        """Подтягивает новые и изменённые рассылки. Возвращает количество прочитанных строк."""
+        now = timezone.now()
+        qs = Mailing.objects.values_list("id", "start_time", "end_time", "status", "updated_at")
+
+        if self._watermark is None:
+            qs = qs.filter(end_time__gte=now).exclude(status="finished")
+        else:
+            # updated_at ставится в Python при сохранении, а транзакция может зафиксироваться уже после
+            # опроса: строка с более ранним updated_at появилась бы за отметкой и не была бы прочитана.
+            # Поэтому опрос перекрывает предыдущий на poll_interval; прочитанные повторно строки с теми же
+            # интервалами пропускаются проверкой ниже.
+            qs = qs.filter(updated_at__gte=self._watermark - timedelta(seconds=self.poll_interval))
+
+        rows = 0
+        for mailing_id, start_time, end_time, status, updated_at in qs.order_by("updated_at").iterator():
+            rows += 1
+            self._watermark = max(self._watermark or updated_at, updated_at)
+
+            # Завершённая рассылка снимается с расписания, даже если её интервал не менялся.
+            if status == "finished" or end_time <= now or start_time >= end_time:
+                self._schedule.pop(mailing_id, None)
+                continue
+
+            if self._schedule.get(mailing_id, (None, None))[:2] == (start_time, end_time):
+                continue
+
+            version = next(self._versions)
+            self._schedule[mailing_id] = (start_time, end_time, version)
+            self._push(max(start_time, now), "start", mailing_id, version)
+            self._push(end_time, "finish", mailing_id, version)
+
+        if self._watermark is None:
+            self._watermark = now
+
+        return rows
+
+    def run_due(self) -> int:
+        """Обрабатывает все наступившие события. Возвращает количество обработанных."""
+        handled = 0
+        now = timezone.now()
+
+        while self._heap and self._heap[0][0] <= now:
+            _when, _seq, kind, mailing_id, version = heapq.heappop(self._heap)
+
+            schedule = self._schedule.get(mailing_id)
+            if schedule is None or schedule[2] != version:
+                continue
+
+            mailing = Mailing.objects.select_related("message").filter(pk=mailing_id).first()
+            if mailing is None:
+                self._schedule.pop(mailing_id, None)
+                continue
+
+            if kind == "finish":
+                self._schedule.pop(mailing_id, None)
+
+            try:
+                if kind == "start":
+                    self.on_start(mailing)
+                else:
+                    self.on_finish(mailing)
+            except Exception as exc:
+                logger.error("Ошибка обработки события %s рассылки id=%s: %s", kind, mailing_id, exc, exc_info=True)
+
+            handled += 1
+
+        return handled
+
+    def _poll_hook(self) -> None:
+        if self.on_poll is None:
+            return
+        try:
+            self.on_poll()
+        except Exception as exc:
+            logger.error("Ошибка периодической задачи планировщика: %s", exc, exc_info=True)
+
+    def seconds_until_next_event(self) -> float | None:
+        if not self._heap:
+            return None
+        return max((self._heap[0][0] - timezone.now()).total_seconds(), 0)
+
+    def run_forever(self) -> None:
+        """Основной цикл: опрос изменений, обработка событий и сон до ближайшего события или опроса."""
+        next_poll = 0.0
+
+        while not self.stop_event.is_set():
+            close_old_connections()
+
+            if time.monotonic() >= next_poll:
+                self.refresh()
+                self._poll_hook()
+                next_poll = time.monotonic() + self.poll_interval
+
+            self.run_due()
+
+            timeout = max(next_poll - time.monotonic(), 0)
+            until_event = self.seconds_until_next_event()
+            if until_event is not None:
+                timeout = min(timeout, until_event)
+
+            self.stop_event.wait(timeout)
+
+        close_old_connections()
@@ -1,110 +1,153 @@
 import logging
+import time
+from collections.abc import Callable
 
+from asgiref.sync import async_to_sync
 from django.conf import settings
-from django.core.mail import send_mail
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail import EmailMessage
 from django.utils import timezone
 
-from .models import Mailing, MailingLog
+from .async_engine import adeliver
+from .log_buffer import MailingLogBuffer
+from .metrics import RUN_SECONDS, RUNS_IN_PROGRESS
+from .mime import Envelope, message_builder, prepare_message
+from .models import Mailing
+from .progress import start_progress
+from .recipients import Recipient, count_recipients, iter_recipient_chunks
+from .transport import ManagedConnection, ThreadedSender
 
 logger = logging.getLogger("mailing")
 
+SEND_ENGINES = ("sync", "async")
 
-def run_mailing(mailing: Mailing) -> dict:
+
+def _error_result(error: str) -> dict:
+    return {
+        "ok": False,
+        "error": error,
+        "total": 0,
+        "success": 0,
+        "failed": 0,
+        "engine": "",
+        "workers": 0,
+        "connections": 0,
+        "messages_per_connection": 0,
+    }
+
+
+def check_mailing_window(mailing: Mailing) -> str:
+    """Проверяет, что рассылку можно отправлять сейчас. Возвращает текст ошибки или пустую строку."""
+    now = timezone.now()
+
+    if mailing.start_time >= mailing.end_time:
+        return (
+            "Интервал рассылки задан некорректно: "
+            "дата окончания должна быть позже даты начала.\n"
+            f"Начало: {mailing.start_time.strftime('%d.%m.%Y %H:%M')}, "
+            f"окончание: {mailing.end_time.strftime('%d.%m.%Y %H:%M')}."
+        )
+
+    if not (mailing.start_time <= now <= mailing.end_time):
+        return (
+            "Текущее время не входит в интервал рассылки.\n"
+            f"Сейчас: {now.strftime('%d.%m.%Y %H:%M')}, "
+            f"интервал: с {mailing.start_time.strftime('%d.%m.%Y %H:%M')} "
+            f"по {mailing.end_time.strftime('%d.%m.%Y %H:%M')}."
+        )
+
+    return ""
+
+
+def record_outcome(
+    log_buffer: MailingLogBuffer,
+    mailing_id: int,
+    client_id: int,
+    sent: int,
+    exc: Exception | None,
+) -> bool:
+    """Записывает результат отправки одного письма в лог. Возвращает True, если письмо отправлено."""
+    if exc is not None:
+        logger.error(
+            "Ошибка при отправке письма: mailing_id=%s, client_id=%s, error=%s",
+            mailing_id,
+            client_id,
+            str(exc),
+            exc_info=exc,
+            extra={"mailing_id": mailing_id, "client_id": client_id, "status": "failed"},
+        )
+        log_buffer.add(mailing_id, client_id, "failed", str(exc))
+        return False
+
+    if sent == 1:
+        log_buffer.add(mailing_id, client_id, "success", "OK (send_messages returned 1)")
+        return True
+
+    log_buffer.add(mailing_id, client_id, "failed", f"send_messages returned {sent}")
+    return False
+
+
+def run_mailing(
+    mailing: Mailing,
+    workers: int | None = None,
+    engine: str | None = None,
+    client_range: tuple[int | None, int | None] | None = None,
+) -> dict:
     """
     Выполняет рассылку сообщения указанным клиентам.
+    client_range ограничивает получателей диапазоном id клиентов (используется при шардировании).
+
+    engine выбирает реализацию отправки (по умолчанию MAILING_SEND_ENGINE):
+    - "sync" — пачки писем через одно SMTP-соединение, при workers > 1 — пулом потоков;
+    - "async" — asyncio и aiosmtplib, до MAILING_ASYNC_CONCURRENCY писем одновременно.
     Возвращает словарь с результатами выполнения рассылки.
     """
-    logger.info("Запуск рассылки id=%s", mailing.id)
-    now = timezone.now()
+    logger.info("Запуск рассылки id=%s", mailing.id, extra={"mailing_id": mailing.id})
 
-    if mailing.start_time >= mailing.end_time:
-        return {
-            "ok": False,
-            "error": (
-                "Интервал рассылки задан некорректно: "
-                "дата окончания должна быть позже даты начала.\n"
-                f"Начало: {mailing.start_time.strftime('%d.%m.%Y %H:%M')}, "
-                f"окончание: {mailing.end_time.strftime('%d.%m.%Y %H:%M')}."
-            ),
-            "total": 0,
-            "success": 0,
-            "failed": 0,
-        }
+    error = check_mailing_window(mailing)
+    if error:
+        return _error_result(error)
 
-    if not (mailing.start_time <= now <= mailing.end_time):
-        return {
-            "ok": False,
-            "error": (
-                "Текущее время не входит в интервал рассылки.\n"
-                f"Сейчас: {now.strftime('%d.%m.%Y %H:%M')}, "
-                f"интервал: с {mailing.start_time.strftime('%d.%m.%Y %H:%M')} "
-                f"по {mailing.end_time.strftime('%d.%m.%Y %H:%M')}."
-            ),
-            "total": 0,
-            "success": 0,
-            "failed": 0,
-        }
+    engine = engine or settings.MAILING_SEND_ENGINE
+    if engine not in SEND_ENGINES:
+        raise ImproperlyConfigured(f"Неизвестный движок отправки: {engine!r}. Допустимые значения: {SEND_ENGINES}.")
 
     mailing.update_status()
 
-    clients = mailing.clients.all()
-    total = clients.count()
-    logger.info("Рассылка id=%s: найдено %s получателей", mailing.id, total)
-    success_count = 0
-    failed_count = 0
+    total = count_recipients(mailing.id, client_range)
+    logger.info("Рассылка id=%s: найдено %s получателей", mailing.id, total, extra={"mailing_id": mailing.id})
+    if client_range is None:
+        start_progress(mailing.id, total)
 
-    subject = mailing.message.subject
-    body = mailing.message.body
     from_email = getattr(settings, "DEFAULT_FROM_EMAIL", None)
+    started = time.monotonic()
+    RUNS_IN_PROGRESS.inc()
 
-    for client in clients:
-        try:
-            sent = send_mail(
-                subject=subject,
-                message=body,
-                from_email=from_email,
-                recipient_list=[client.email],
-                fail_silently=False,
-            )
-        except Exception as exc:
-            failed_count += 1
-            logger.error(
-                "Ошибка при отправке письма: mailing_id=%s, client_id=%s, error=%s",
-                mailing.id,
-                client.id,
-                str(exc),
-                exc_info=True,
-            )
-            MailingLog.objects.create(
-                mailing=mailing,
-                client=client,
-                status="failed",
-                server_response=str(exc),
-            )
-        else:
-            if sent == 1:
-                success_count += 1
-                logger.info(
-                    "Письмо успешно отправлено: mailing_id=%s, client_id=%s",
-                    mailing.id,
-                    client.id,
-                )
-                MailingLog.objects.create(
-                    mailing=mailing,
-                    client=client,
-                    status="success",
-                    server_response="OK (send_mail returned 1)",
+    try:
+        with MailingLogBuffer() as log_buffer:
+            if engine == "async":
+                workers = settings.MAILING_ASYNC_CONCURRENCY
+                success_count, failed_count, connection_stats = async_to_sync(adeliver)(
+                    mailing, prepare_message(mailing.message, from_email), log_buffer, client_range
                 )
             else:
-                failed_count += 1
-                MailingLog.objects.create(
-                    mailing=mailing,
-                    client=client,
-                    status="failed",
-                    server_response=f"send_mail returned {sent}",
+                workers = workers or settings.MAILING_WORKERS
+                success_count, failed_count, connection_stats = _deliver(
+                    mailing, message_builder(mailing.message, from_email), log_buffer, client_range, workers
                 )
+    finally:
+        RUNS_IN_PROGRESS.dec()
+        RUN_SECONDS.observe(time.monotonic() - started, engine=engine)
 
-    mailing.update_status()
+    logger.info(
+        "Рассылка id=%s: движок %s, параллельно %s, SMTP-соединений %s, писем на соединение %s",
+        mailing.id,
+        engine,
+        workers,
+        connection_stats["connections"],
+        connection_stats["messages_per_connection"],
+        extra={"mailing_id": mailing.id, "engine": engine},
+    )
 
     return {
         "ok": True,
@@ -112,4 +155,35 @@ def run_mailing(mailing: Mailing) -> dict:
         "total": total,
         "success": success_count,
         "failed": failed_count,
+        "engine": engine,
+        "workers": workers,
+        **connection_stats,
     }
+
+
+def _deliver(
+    mailing: Mailing,
+    build: Callable[[Recipient], EmailMessage | Envelope],
+    log_buffer: MailingLogBuffer,
+    client_range: tuple[int | None, int | None] | None,
+    workers: int,
+) -> tuple[int, int, dict]:
+    """
+    Синхронная отправка рассылки пачками через одно SMTP-соединение или пул потоков.
+    Возвращает (успешно, ошибок, статистика соединений).
+    """
+    success_count = 0
+    failed_count = 0
+    transport = ThreadedSender(workers) if workers > 1 else ManagedConnection()
+
+    with transport:
+        for batch in iter_recipient_chunks(mailing.id, client_range):
+            emails = [build(recipient) for recipient in batch]
+
+            for (client_id, *_), (sent, exc) in zip(batch, transport.send_batch(emails)):
+                if record_outcome(log_buffer, mailing.id, client_id, sent, exc):
+                    success_count += 1
+                else:
+                    failed_count += 1
+
+    return success_count, failed_count, transport.stats()
@@ -0,0 +1,126 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import NamedTuple
+
+import django
+from django.conf import settings
+from django.db import connections
+
+from .models import Mailing
+from .progress import start_progress
+from .recipients import count_recipients
+from .services import run_mailing
+
+logger = logging.getLogger("mailing")
+
+
+class Shard(NamedTuple):
+    """
+    Часть рассылки: клиенты с id из диапазона [first_client_id, last_client_id].
+    Граница None означает отсутствие ограничения с этой стороны.
+    """
+
+    mailing_id: int
+    first_client_id: int | None = None
+    last_client_id: int | None = None
+
+    @property
+    def client_range(self) -> tuple[int | None, int | None] | None:
+        if self.first_client_id is None and self.last_client_id is None:
+            return None
+        return self.first_client_id, self.last_client_id
+
+
+def plan_shards(mailing_ids: list[int], shard_size: int | None = None) -> list[Shard]:
+    """
+    Делит рассылки на шарды по диапазонам id клиентов, не больше shard_size клиентов в шарде.
+    Рассылка, в которой не больше shard_size клиентов, остаётся одним шардом.
+    """
+    shard_size = shard_size or settings.MAILING_SHARD_SIZE
+    through = Mailing.clients.through
+    shards = []
+
+    for mailing_id in mailing_ids:
+        client_ids = (
+            through.objects.filter(mailing_id=mailing_id).order_by("client_id").values_list("client_id", flat=True)
+        )
+
+        if count_recipients(mailing_id) <= shard_size:
+            shards.append(Shard(mailing_id))
+            continue
+
+        last_id = 0
+        while True:
+            boundary = list(client_ids.filter(client_id__gt=last_id)[shard_size - 1 : shard_size])
+            if not boundary:
+                shards.append(Shard(mailing_id, last_id + 1, None))
+                break
+            shards.append(Shard(mailing_id, last_id + 1, boundary[0]))
+            last_id = boundary[0]
+
+    return shards
+
+
+def run_shard(shard: Shard, workers: int | None = None) -> dict:
+    """Выполняет один шард рассылки. Вызывается в дочернем процессе."""
+    mailing = Mailing.objects.select_related("message").get(pk=shard.mailing_id)
+    return run_mailing(mailing, workers=workers, client_range=shard.client_range)
+
+
+def merge_results(results: list[dict]) -> dict:
+    """Сводит результаты шардов одной рассылки в итог в формате run_mailing."""
+    errors = [result["error"] for result in results if not result["ok"]]
+    connections_opened = sum(result["connections"] for result in results)
+    sent = sum(result["messages_per_connection"] * result["connections"] for result in results)
+
+    return {
+        "ok": not errors,
+        "error": "\n".join(errors),
+        "total": sum(result["total"] for result in results),
+        "success": sum(result["success"] for result in results),
+        "failed": sum(result["failed"] for result in results),
+        "engine": next((result["engine"] for result in results if result["engine"]), ""),
+        "workers": max((result["workers"] for result in results), default=0),
+        "shards": len(results),
+        "connections": connections_opened,
+        "messages_per_connection": round(sent / connections_opened, 1) if connections_opened else 0,
+    }
+
+
+def run_sharded(mailing_ids: list[int], processes: int, workers: int | None = None) -> dict[int, dict | Exception]:
+    """
+    Выполняет рассылки в пуле из processes процессов. Крупные рассылки делятся на шарды (plan_shards).
+
+    Каждый процесс сам настраивает Django и открывает собственные соединения с БД и SMTP.
+    Возвращает для каждой рассылки сводный результат или исключение, прервавшее один из её шардов.
+    """
+    shards = plan_shards(mailing_ids)
+    for mailing_id in mailing_ids:
+        start_progress(mailing_id, count_recipients(mailing_id))
+    logger.info("Рассылок %s разбито на шардов: %s, процессов: %s", len(mailing_ids), len(shards), processes)
+
+    # Дочерние процессы не должны наследовать открытое соединение с БД родителя.
+    connections.close_all()
+
+    shard_results: dict[int, list[dict]] = {mailing_id: [] for mailing_id in mailing_ids}
+    failures: dict[int, Exception] = {}
+
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=django.setup,
+    ) as executor:
+        futures = {executor.submit(run_shard, shard, workers): shard for shard in shards}
+
+        for future in as_completed(futures):
+            shard = futures[future]
+            try:
+                shard_results[shard.mailing_id].append(future.result())
+            except Exception as exc:
+                logger.error("Шард %s завершился с ошибкой: %s", shard, exc, exc_info=exc)
+                failures[shard.mailing_id] = exc
+
+    return {
+        mailing_id: failures.get(mailing_id) or merge_results(results) for mailing_id, results in shard_results.items()
+    }
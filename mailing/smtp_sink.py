@@ -0,0 +1,126 @@
+import asyncio
+import logging
+import random
+import threading
+
+logger = logging.getLogger("mailing")
+
+
+class SmtpSink:
+    """
+    Локальный SMTP-сервер на asyncio, который принимает и отбрасывает письма.
+
+    Нужен для проверки и нагрузочного тестирования отправки без реального почтового сервера.
+    Сервер работает в отдельном потоке со своим event loop, поэтому подходит и для синхронного,
+    и для асинхронного движка отправки:
+
+        with SmtpSink() as sink:
+            ...  # EMAIL_HOST=sink.host, EMAIL_PORT=sink.port, EMAIL_USE_TLS=False
+
+    latency задаёт задержку ответа на каждое письмо в секундах, failure_rate — долю писем,
+    которые отклоняются ответом 554 после DATA (для воспроизводимости можно передать seed).
+    """
+
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: int | None = None,
+    ):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.connections = 0
+        self.messages_received = 0
+        self.messages_rejected = 0
+        self._random = random.Random(seed)
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._server: asyncio.Server | None = None
+        self._thread: threading.Thread | None = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        in_data = False
+
+        writer.write(b"220 sink ESMTP\r\n")
+        try:
+            while line := await reader.readline():
+                if in_data:
+                    if line.rstrip(b"\r\n") == b".":
+                        in_data = False
+                        if self.latency:
+                            await asyncio.sleep(self.latency)
+                        if self.failure_rate and self._random.random() < self.failure_rate:
+                            self.messages_rejected += 1
+                            writer.write(b"554 Transaction failed\r\n")
+                        else:
+                            self.messages_received += 1
+                            writer.write(b"250 OK: queued\r\n")
+                        await writer.drain()
+                    continue
+
+                command = line[:4].upper()
+
+                if command == b"EHLO":
+                    writer.write(b"250-sink\r\n250-PIPELINING\r\n250 8BITMIME\r\n")
+                elif command == b"HELO":
+                    writer.write(b"250 sink\r\n")
+                elif command in (b"MAIL", b"RCPT", b"RSET", b"NOOP"):
+                    writer.write(b"250 OK\r\n")
+                elif command == b"DATA":
+                    in_data = True
+                    writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                elif command == b"QUIT":
+                    writer.write(b"221 Bye\r\n")
+                    await writer.drain()
+                    break
+                else:
+                    writer.write(b"502 Command not implemented\r\n")
+
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def start(self) -> "SmtpSink":
+        """Запускает сервер в фоновом потоке и ждёт, пока он начнёт принимать соединения."""
+        ready = threading.Event()
+        self._loop = asyncio.new_event_loop()
+
+        def run() -> None:
+            asyncio.set_event_loop(self._loop)
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port, limit=2**20)
+            )
+            self.port = self._server.sockets[0].getsockname()[1]
+            ready.set()
+            self._loop.run_forever()
+
+            self._server.close()
+            self._loop.run_until_complete(self._server.wait_closed())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name="smtp-sink", daemon=True)
+        self._thread.start()
+        ready.wait()
+        logger.info("SMTP-заглушка запущена на %s:%s", self.host, self.port)
+        return self
+
+    def stop(self) -> None:
+        if self._loop is None:
+            return
+
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+        logger.info("SMTP-заглушка остановлена: принято писем %s", self.messages_received)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
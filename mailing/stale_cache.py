@@ -0,0 +1,86 @@
+import math
+import random
+import time
+from collections.abc import Callable
+from typing import Any, NamedTuple
+
+from django.core.cache import cache
+
+from .metrics import CACHE_REQUESTS
+
+# Сколько после срока запись ещё хранится в кеше, чтобы её можно было отдать, пока значение пересчитывается.
+STALE_GRACE = 600
+# Блокировка пересчёта: если вычисливший процесс упал, через столько секунд пересчитать сможет другой.
+LOCK_TIMEOUT = 30
+# Сколько ждёт запрос без устаревшего значения, пока другой процесс пересчитывает, и как часто проверяет кеш.
+WAIT_TIMEOUT = 2.0
+WAIT_STEP = 0.05
+# Коэффициент досрочного пересчёта: больше - пересчёт начинается раньше срока.
+EARLY_BETA = 1.0
+
+
+class _Entry(NamedTuple):
+    value: Any
+    version: Any
+    expires_at: float
+    # Сколько секунд заняло вычисление: чем дороже значение, тем раньше срока его начинают пересчитывать.
+    cost: float
+
+
+class Cached(NamedTuple):
+    value: Any
+    # False, если отдано предыдущее значение, пока другой процесс пересчитывает: такой результат
+    # не стоит кешировать дальше (например, во фрагментах шаблона под новым поколением).
+    fresh: bool
+
+
+def _is_fresh(entry: _Entry | None, version, now: float) -> bool:
+    # Вероятностный досрочный пересчёт (XFetch): с приближением срока растёт вероятность, что запрос
+    # сочтёт значение устаревшим, поэтому пересчёт обычно начинает один запрос, а не все в момент истечения.
+    if entry is None or entry.version != version:
+        return False
+    return now - entry.cost * EARLY_BETA * math.log(1 - random.random()) < entry.expires_at
+
+
+def cached_value(name: str, key: str, compute: Callable[[], Any], timeout: int, version=None) -> Cached:
+    """
+    Значение из кеша по key или результат compute(), сохранённый на timeout секунд для поколения version.
+
+    Пересчитывает только процесс, взявший блокировку (cache.add): остальные в это время получают
+    предыдущее значение, даже если у него другое поколение version или истёк срок, а без него ждут
+    до WAIT_TIMEOUT секунд и вычисляют сами. Незадолго до срока пересчёт начинается досрочно
+    с вероятностью, растущей к концу срока. Обращения учитываются в
+    mailing_cache_requests_total{cache=name, result=hit|stale|miss}.
+    """
+    entry = cache.get(key)
+    if _is_fresh(entry, version, time.time()):
+        CACHE_REQUESTS.inc(cache=name, result="hit")
+        return Cached(entry.value, True)
+
+    lock_key = f"{key}:lock"
+    if not cache.add(lock_key, 1, LOCK_TIMEOUT):
+        if entry is not None:
+            CACHE_REQUESTS.inc(cache=name, result="stale")
+            return Cached(entry.value, entry.version == version and time.time() < entry.expires_at)
+
+        deadline = time.monotonic() + WAIT_TIMEOUT
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_STEP)
+            entry = cache.get(key)
+            if entry is not None and entry.version == version:
+                CACHE_REQUESTS.inc(cache=name, result="hit")
+                return Cached(entry.value, True)
+
+        CACHE_REQUESTS.inc(cache=name, result="miss")
+        return Cached(compute(), True)
+
+    CACHE_REQUESTS.inc(cache=name, result="miss")
+    try:
+        started = time.monotonic()
+        value = compute()
+        entry = _Entry(value, version, time.time() + timeout, time.monotonic() - started)
+        cache.set(key, entry, timeout + STALE_GRACE)
+    finally:
+        cache.delete(lock_key)
+
+    return Cached(value, True)
@@ -0,0 +1,91 @@
+from typing import TypedDict
+
+from django.db.models import Count, Q, QuerySet, Sum
+from django.db.models.functions import Coalesce
+
+# Итоги для панелей и списков: каждая функция считает свои числа одним запросом с условной агрегацией
+# (Count(..., filter=Q(...))) по одной модели и возвращает словарь целых чисел, который можно
+# положить в кеш и передать в контекст шаблона как есть.
+
+
+class MailingCounts(TypedDict):
+    total_mailings: int
+    created_mailings: int
+    started_mailings: int
+    finished_mailings: int
+    # Запущенная по effective_status рассылка всегда находится внутри своего интервала.
+    active_mailings: int
+    disabled_mailings: int
+
+
+class UserCounts(TypedDict):
+    total_users: int
+    active_users: int
+    blocked_users: int
+
+
+class DeliveryCounts(TypedDict):
+    total_mailings: int
+    successful_attempts: int
+    failed_attempts: int
+    total_messages: int
+    success_rate: int
+    failed_rate: int
+
+
+class DashboardCounts(TypedDict):
+    total_mailings: int
+    active_mailings: int
+    unique_clients: int
+
+
+def count_mailings(mailings: QuerySet, now=None) -> MailingCounts:
+    """Рассылки по статусу effective_status, вычисленному в SQL на момент now: один запрос."""
+    counts = mailings.with_effective_status(now).aggregate(
+        total_mailings=Count("id"),
+        created_mailings=Count("id", filter=Q(effective_status="created")),
+        started_mailings=Count("id", filter=Q(effective_status="started")),
+        finished_mailings=Count("id", filter=Q(effective_status="finished")),
+    )
+    counts["active_mailings"] = counts["started_mailings"]
+    counts["disabled_mailings"] = counts["total_mailings"] - counts["started_mailings"]
+    return counts
+
+
+def count_users(users: QuerySet) -> UserCounts:
+    """Пользователи всего, активные и заблокированные: один запрос."""
+    return users.aggregate(
+        total_users=Count("id"),
+        active_users=Count("id", filter=Q(is_active=True)),
+        blocked_users=Count("id", filter=Q(is_active=False)),
+    )
+
+
+def count_deliveries(mailings: QuerySet) -> DeliveryCounts:
+    """
+    Рассылки и попытки их отправки по счётчикам MailingStats (строка на рассылку, а не все логи):
+    один запрос. success_rate и failed_rate - проценты, в сумме 100 или оба 0 без попыток.
+    """
+    counts = mailings.aggregate(
+        total_mailings=Count("id"),
+        successful_attempts=Coalesce(Sum("delivery_stats__success"), 0),
+        failed_attempts=Coalesce(Sum("delivery_stats__failed"), 0),
+    )
+    success = counts["successful_attempts"]
+    attempts = success + counts["failed_attempts"]
+    success_rate = round(success / attempts * 100) if attempts else 0
+
+    counts["total_messages"] = success
+    counts["success_rate"] = success_rate
+    counts["failed_rate"] = 100 - success_rate if attempts else 0
+    return counts
+
+
+def dashboard_counts(mailings: QuerySet, clients: QuerySet, now=None) -> DashboardCounts:
+    """Главная страница: рассылки всего и запущенные, клиенты - по запросу на модель."""
+    counts = mailings.with_effective_status(now).aggregate(
+        total_mailings=Count("id"),
+        active_mailings=Count("id", filter=Q(effective_status="started")),
+    )
+    counts["unique_clients"] = clients.count()
+    return counts
@@ -0,0 +1,35 @@
+import logging
+
+from django.utils import timezone
+
+from .cache_versions import bump
+from .metrics import STATUS_TRANSITIONS
+from .models import Mailing
+
+logger = logging.getLogger("mailing")
+
+
+def sweep_statuses() -> dict[str, int]:
+    """
+    Один проход перевода статусов всех рассылок (Mailing.objects.sweep_statuses) с записью
+    в лог и метрику mailing_status_transitions_total. Вызывается командой sweep_mailing_statuses,
+    send_mailings и циклом send_mailings --daemon, поэтому страницам не нужно сохранять статус при чтении.
+    """
+    now = timezone.now()
+    transitions = Mailing.objects.sweep_statuses(now)
+
+    for status, count in transitions.items():
+        if count:
+            STATUS_TRANSITIONS.inc(count, status=status)
+
+    if any(transitions.values()):
+        # Переведённые рассылки получили updated_at=now: по нему находятся владельцы, чей кеш устарел.
+        bump(Mailing.objects.filter(updated_at=now).values_list("owner_id", flat=True).distinct())
+        logger.info(
+            "Обновление статусов рассылок: запущено %s, завершено %s",
+            transitions["started"],
+            transitions["finished"],
+            extra=transitions,
+        )
+
+    return transitions
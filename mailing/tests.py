@@ -1 +1,918 @@
-# Create your tests here.
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth.tokens import default_token_generator
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count, Q, Sum
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse, reverse_lazy
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+
+from mailing import urls as mailing_urls
+from mailing.cache_versions import bump, current
+from mailing.log_buffer import MailingLogBuffer
+from mailing.models import Client, DeliveryRollup, Mailing, MailingLog, MailingStats, Message, RollupWatermark
+from mailing.outbox import claim_batch, enqueue_mailing, process_batch
+from mailing.personalization import CompiledTemplate, client_id_from_token, message_plan, unsubscribe_token
+from mailing.progress import get_progress
+from mailing.recipients import iter_recipient_chunks
+from mailing.scale_data import ScaleDataGenerator
+from mailing.scheduler import MailingScheduler
+from mailing.services import run_mailing
+from mailing.smtp_sink import SmtpSink
+from mailing.stale_cache import Cached, _Entry, cached_value
+from mailing.stats import count_deliveries, count_mailings, count_users, dashboard_counts
+from mailing.status_sweeper import sweep_statuses
+from mailing.transport import ManagedConnection
+from users import urls as users_urls
+from users.models import User
+
+# Бюджеты представлений: имя URL -> (максимум SQL-запросов, максимум секунд).
+# Бюджет общий для обычного пользователя и менеджера и проверяется на холодном кеше.
+VIEW_BUDGETS = {
+    "mailing:index": (4, 1.0),
+    "mailing:client_list": (4, 1.0),
+    "mailing:client_detail": (6, 1.0),
+    "mailing:client_update": (5, 1.0),
+    "mailing:client_delete": (5, 1.0),
+    "mailing:client_create": (2, 1.0),
+    "mailing:unsubscribe": (3, 1.0),
+    "mailing:message_list": (6, 1.0),
+    "mailing:message_detail": (4, 1.0),
+    "mailing:message_update": (5, 1.0),
+    "mailing:message_delete": (5, 1.0),
+    "mailing:message_create": (2, 1.0),
+    "mailing:mailing_list": (5, 1.0),
+    "mailing:mailing_detail": (6, 1.0),
+    "mailing:mailing_update": (8, 1.0),
+    "mailing:mailing_delete": (6, 1.0),
+    "mailing:mailing_create": (4, 1.0),
+    "mailing:mailing_run": (2, 1.0),
+    "mailing:mailing_progress": (5, 1.0),
+    "mailing:metrics": (2, 1.0),
+    "mailing:mailing_log": (9, 1.0),
+    "users:login": (2, 1.0),
+    "users:logout": (2, 1.0),
+    "users:registration": (2, 1.0),
+    "users:registration_done": (2, 1.0),
+    "users:confirm_email": (2, 1.0),
+    "users:profile_detail": (2, 1.0),
+    "users:profile_edit": (2, 1.0),
+    "users:profile_delete": (2, 1.0),
+    "users:manager_dashboard": (4, 1.0),
+    "users:manager_clients_list": (6, 1.0),
+    "users:manager_client_detail": (6, 1.0),
+    "users:manager_users_list": (6, 1.0),
+    "users:manager_mailings_list": (7, 1.0),
+    "users:manager_mailing_detail": (7, 1.0),
+    "users:manager_mailing_disable": (4, 1.0),
+    "users:manager_user_detail": (7, 1.0),
+    "users:manager_toggle_block": (6, 1.0),
+    "users:password_reset": (2, 1.0),
+    "users:password_reset_done": (2, 1.0),
+    "users:password_reset_confirm": (3, 1.0),
+    "users:password_reset_complete": (2, 1.0),
+}
+
+
+class ViewBudgetTests(TestCase):
+    """
+    Открывает каждый URL из mailing/urls.py и users/urls.py на объёмных данных от имени
+    обычного пользователя и менеджера и проверяет число SQL-запросов и время ответа.
+    При превышении бюджета тест падает со списком выполненных запросов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command("create_managers_group", stdout=StringIO())
+        ScaleDataGenerator(seed=1, batch_size=2000, log=lambda line: None).generate(
+            users=30, clients=5000, messages=150, mailings=600, recipients=50, logs=20000
+        )
+
+        cls.manager = User.objects.filter(is_manager=True).first()
+        owners = User.objects.filter(is_manager=False).annotate(total=Count("mailings")).order_by("-total")
+        cls.user, cls.other_user = owners[:2]
+        cls.client_obj = Client.objects.filter(owner=cls.user).first()
+        cls.message = Message.objects.filter(owner=cls.user).first()
+        cls.mailing = Mailing.objects.filter(owner=cls.user, status="started").first() or (
+            Mailing.objects.filter(owner=cls.user).first()
+        )
+
+    def url_kwargs(self, name: str) -> dict:
+        uid = urlsafe_base64_encode(force_bytes(self.user.pk))
+        kwargs = {
+            "mailing:client_detail": {"pk": self.client_obj.pk},
+            "mailing:client_update": {"pk": self.client_obj.pk},
+            "mailing:client_delete": {"pk": self.client_obj.pk},
+            "mailing:unsubscribe": {"token": unsubscribe_token(self.client_obj.pk)},
+            "mailing:message_detail": {"pk": self.message.pk},
+            "mailing:message_update": {"pk": self.message.pk},
+            "mailing:message_delete": {"pk": self.message.pk},
+            "mailing:mailing_detail": {"pk": self.mailing.pk},
+            "mailing:mailing_update": {"pk": self.mailing.pk},
+            "mailing:mailing_delete": {"pk": self.mailing.pk},
+            "mailing:mailing_run": {"pk": self.mailing.pk},
+            "mailing:mailing_progress": {"pk": self.mailing.pk},
+            "users:confirm_email": {"uidb64": uid, "token": default_token_generator.make_token(self.user)},
+            "users:manager_client_detail": {"pk": self.client_obj.pk},
+            "users:manager_mailing_detail": {"pk": self.mailing.pk},
+            "users:manager_mailing_disable": {"pk": self.mailing.pk},
+            "users:manager_user_detail": {"pk": self.user.pk},
+            # GET переключает блокировку, поэтому используется не тот пользователь, от имени которого идут запросы.
+            "users:manager_toggle_block": {"pk": self.other_user.pk},
+            "users:password_reset_confirm": {"uidb64": uid, "token": "invalid-token"},
+        }
+        return kwargs.get(name, {})
+
+    @staticmethod
+    def url_names() -> list[str]:
+        return [
+            f"{module.app_name}:{pattern.name}"
+            for module in (mailing_urls, users_urls)
+            for pattern in module.urlpatterns
+            if isinstance(pattern, URLPattern)
+        ]
+
+    def test_every_url_has_budget(self):
+        self.assertEqual(sorted(set(self.url_names()) - set(VIEW_BUDGETS)), [])
+
+    def test_view_budgets(self):
+        for role in ("user", "manager"):
+            for name in self.url_names():
+                with self.subTest(role=role, view=name):
+                    self.assert_within_budget(getattr(self, role), name)
+
+    def assert_within_budget(self, user: User, name: str) -> None:
+        max_queries, max_seconds = VIEW_BUDGETS[name]
+        url = reverse(name, kwargs=self.url_kwargs(name))
+        self.client.force_login(user)
+        cache.clear()
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            response = self.client.get(url)
+            elapsed = time.perf_counter() - started
+
+        self.assertLess(response.status_code, 500, f"{name} ({url}) ответил {response.status_code}")
+
+        sql = "\n".join(f"  {index}. {query['sql']}" for index, query in enumerate(queries.captured_queries, 1))
+        self.assertLessEqual(
+            len(queries),
+            max_queries,
+            f"{name} ({url}) от {user.email}: {len(queries)} SQL-запросов при бюджете {max_queries}:\n{sql}",
+        )
+        self.assertLessEqual(
+            elapsed,
+            max_seconds,
+            f"{name} ({url}) от {user.email}: {elapsed:.3f} с при бюджете {max_seconds} с; запросы:\n{sql}",
+        )
+
+
+class StatsServiceTests(TestCase):
+    """
+    mailing.stats: каждая функция укладывается в один запрос на модель и даёт те же числа,
+    что и отдельные COUNT по каждому условию.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        hour = timezone.timedelta(hours=1)
+
+        cls.owner = User.objects.create(email="owner@stats.test")
+        cls.other = User.objects.create(email="other@stats.test", is_active=False)
+        message = Message.objects.create(subject="Тема", body="Текст", owner=cls.owner)
+        Client.objects.bulk_create(Client(email=f"c{index}@stats.test", owner=cls.owner) for index in range(3))
+
+        intervals = {
+            "created": (cls.now + hour, cls.now + 2 * hour),
+            "started": (cls.now - hour, cls.now + hour),
+            "finished": (cls.now - 2 * hour, cls.now - hour),
+        }
+        for status, count in (("created", 2), ("started", 3), ("finished", 1)):
+            start_time, end_time = intervals[status]
+            for _ in range(count):
+                Mailing.objects.create(owner=cls.owner, message=message, start_time=start_time, end_time=end_time)
+        Mailing.objects.create(owner=cls.other, message=message, start_time=cls.now - hour, end_time=cls.now + hour)
+
+        first, second = Mailing.objects.filter(owner=cls.owner)[:2]
+        MailingStats.objects.create(mailing=first, attempts=4, success=3, failed=1)
+        MailingStats.objects.create(mailing=second, attempts=4, success=3, failed=1)
+
+    def test_count_mailings(self):
+        mailings = Mailing.objects.filter(owner=self.owner)
+
+        with self.assertNumQueries(1):
+            counts = count_mailings(mailings, self.now)
+
+        self.assertEqual(
+            counts,
+            {
+                "total_mailings": 6,
+                "created_mailings": 2,
+                "started_mailings": 3,
+                "finished_mailings": 1,
+                "active_mailings": 3,
+                "disabled_mailings": 3,
+            },
+        )
+
+    def test_count_users(self):
+        with self.assertNumQueries(1):
+            counts = count_users(User.objects.filter(email__endswith="@stats.test"))
+
+        self.assertEqual(counts, {"total_users": 2, "active_users": 1, "blocked_users": 1})
+
+    def test_count_deliveries(self):
+        with self.assertNumQueries(1):
+            counts = count_deliveries(Mailing.objects.filter(owner=self.owner))
+
+        self.assertEqual(
+            counts,
+            {
+                "total_mailings": 6,
+                "successful_attempts": 6,
+                "failed_attempts": 2,
+                "total_messages": 6,
+                "success_rate": 75,
+                "failed_rate": 25,
+            },
+        )
+
+    def test_count_deliveries_without_attempts(self):
+        counts = count_deliveries(Mailing.objects.filter(owner=self.other))
+
+        self.assertEqual((counts["successful_attempts"], counts["success_rate"], counts["failed_rate"]), (0, 0, 0))
+
+    def test_dashboard_counts(self):
+        with self.assertNumQueries(2):
+            counts = dashboard_counts(
+                Mailing.objects.filter(owner=self.owner), Client.objects.filter(owner=self.owner), self.now
+            )
+
+        self.assertEqual(counts, {"total_mailings": 6, "active_mailings": 3, "unique_clients": 3})
+
+    def test_manager_dashboard_queries(self):
+        # Сессия, пользователь, затем по одному агрегату на пользователей и на рассылки.
+        manager = User.objects.create(email="manager@stats.test", is_manager=True)
+        self.client.force_login(manager)
+
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse("users:manager_dashboard"))
+
+        self.assertEqual(response.context["total_mailings"], 7)
+        self.assertEqual(response.context["active_mailings"], 4)
+
+
+class StatusSweepTests(TestCase):
+    """
+    Перевод статусов двумя UPDATE: created -> started в start_time, started -> finished после end_time.
+    После прохода сохранённый статус совпадает с effective_status, вычисленным в SQL, и с calculate_status.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        cls.owner = User.objects.create(email="owner@sweep.test")
+        message = Message.objects.create(subject="Тема", body="Текст", owner=cls.owner)
+        windows = {
+            "future": (cls.now + timedelta(hours=1), cls.now + timedelta(hours=2)),
+            "current": (cls.now - timedelta(hours=1), cls.now + timedelta(hours=1)),
+            "past": (cls.now - timedelta(hours=2), cls.now - timedelta(hours=1)),
+        }
+        cls.mailings = {
+            name: Mailing.objects.create(owner=cls.owner, message=message, start_time=start, end_time=end)
+            for name, (start, end) in windows.items()
+        }
+
+    def statuses(self) -> dict[str, str]:
+        by_id = dict(Mailing.objects.values_list("id", "status"))
+        return {name: by_id[mailing.id] for name, mailing in self.mailings.items()}
+
+    def assert_matches_effective_status(self, now) -> None:
+        for mailing in Mailing.objects.with_effective_status(now):
+            self.assertEqual(mailing.status, mailing.effective_status, mailing)
+            self.assertEqual(mailing.status, mailing.calculate_status(now), mailing)
+
+    def test_window_boundaries(self):
+        future = self.mailings["future"]
+
+        self.assertEqual(Mailing.objects.sweep_statuses(self.now), {"started": 1, "finished": 1})
+        self.assertEqual(self.statuses(), {"future": "created", "current": "started", "past": "finished"})
+        self.assert_matches_effective_status(self.now)
+
+        moments = [
+            (future.start_time - timedelta(microseconds=1), "created", {"started": 0, "finished": 0}),
+            # Конец интервала current совпадает с началом future и ещё входит в интервал.
+            (future.start_time, "started", {"started": 1, "finished": 0}),
+            (future.end_time, "started", {"started": 0, "finished": 1}),
+            (future.end_time + timedelta(microseconds=1), "finished", {"started": 0, "finished": 1}),
+        ]
+        for moment, status, transitions in moments:
+            with self.subTest(moment=moment):
+                self.assertEqual(Mailing.objects.sweep_statuses(moment), transitions)
+                self.assertEqual(self.statuses()["future"], status)
+                self.assert_matches_effective_status(moment)
+
+    def test_created_past_window_goes_straight_to_finished(self):
+        self.assertEqual(Mailing.objects.sweep_statuses(self.now + timedelta(hours=3)), {"started": 0, "finished": 3})
+        self.assertEqual(set(self.statuses().values()), {"finished"})
+
+    def test_sweep_bumps_owner_generation(self):
+        version = current(self.owner.pk)
+
+        with self.captureOnCommitCallbacks(execute=True), self.assertLogs("mailing", level="INFO"):
+            transitions = sweep_statuses()
+
+        self.assertEqual(transitions, {"started": 1, "finished": 1})
+        self.assertGreater(current(self.owner.pk), version)
+        self.assertEqual(sweep_statuses(), {"started": 0, "finished": 0})
+
+
+class StaleCacheTests(TestCase):
+    """stale_cache.cached_value: один пересчёт под блокировкой, устаревшее значение на время пересчёта, XFetch."""
+
+    key = "test:stale"
+
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self) -> int:
+        self.calls += 1
+        return self.calls
+
+    def test_miss_then_hit(self):
+        self.assertEqual(cached_value("test", self.key, self.compute, 60, version=1), Cached(1, True))
+        self.assertEqual(cached_value("test", self.key, self.compute, 60, version=1), Cached(1, True))
+        self.assertEqual(self.calls, 1)
+
+    def test_new_version_recomputes(self):
+        cached_value("test", self.key, self.compute, 60, version=1)
+
+        self.assertEqual(cached_value("test", self.key, self.compute, 60, version=2), Cached(2, True))
+        self.assertEqual(cache.get(f"{self.key}:lock"), None)
+
+    def test_stale_value_while_locked(self):
+        cached_value("test", self.key, self.compute, 60, version=1)
+        # Другой процесс взял блокировку и пересчитывает значение нового поколения.
+        cache.add(f"{self.key}:lock", 1, 30)
+
+        self.assertEqual(cached_value("test", self.key, self.compute, 60, version=2), Cached(1, False))
+        self.assertEqual(self.calls, 1)
+
+    def test_waits_for_other_process_without_stale_value(self):
+        cache.add(f"{self.key}:lock", 1, 30)
+
+        with mock.patch("mailing.stale_cache.WAIT_TIMEOUT", 0.1):
+            self.assertEqual(cached_value("test", self.key, self.compute, 60, version=1), Cached(1, True))
+
+    def test_early_recompute_near_expiry(self):
+        cache.set(self.key, _Entry("old", 1, time.time() + 5, 1.0), 60)
+
+        # Вероятность досрочного пересчёта растёт к сроку: при random() близком к 0 значение свежее,
+        # при близком к 1 стоимость вычисления (1 с) «переносит» срок раньше текущего момента.
+        with mock.patch("mailing.stale_cache.random.random", return_value=0.0):
+            self.assertEqual(cached_value("test", self.key, self.compute, 60, version=1), Cached("old", True))
+        with mock.patch("mailing.stale_cache.random.random", return_value=0.999999):
+            self.assertEqual(cached_value("test", self.key, self.compute, 60, version=1), Cached(1, True))
+
+
+class CacheVersionTests(TestCase):
+    """
+    cache_versions: изменения рассылок, клиентов и логов начинают новое поколение владельца и общее,
+    поэтому кешированная статистика страниц обновляется сразу после фиксации.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.owner = User.objects.create(email="owner@versions.test")
+        cls.message = Message.objects.create(subject="Тема", body="Текст", owner=cls.owner)
+        cls.mailing = Mailing.objects.create(
+            owner=cls.owner,
+            message=cls.message,
+            start_time=now - timedelta(hours=1),
+            end_time=now + timedelta(hours=1),
+        )
+        cls.client_obj = Client.objects.create(email="c@versions.test", owner=cls.owner)
+
+    def setUp(self):
+        cache.clear()
+
+    def assert_bumps(self, change) -> None:
+        owner_version, global_version = current(self.owner.pk), current()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+        self.assertGreater(current(self.owner.pk), owner_version)
+        self.assertGreater(current(), global_version)
+
+    def test_bumps_on_changes(self):
+        changes = {
+            "mailing save": lambda: self.mailing.save(),
+            "client save": lambda: Client.objects.create(email="new@versions.test", owner=self.owner),
+            "clients add": lambda: self.mailing.clients.add(self.client_obj),
+            "clients remove": lambda: self.client_obj.mailing_set.remove(self.mailing),
+            "log flush": self.flush_log,
+            "client delete": lambda: Client.objects.filter(email="new@versions.test").get().delete(),
+        }
+        for name, change in changes.items():
+            with self.subTest(name):
+                self.assert_bumps(change)
+
+    def flush_log(self) -> None:
+        with self.assertLogs("mailing", level="INFO"), MailingLogBuffer() as log_buffer:
+            log_buffer.add(self.mailing.id, self.client_obj.id, "success", "OK")
+
+    def test_bump_applies_after_commit_only(self):
+        version = current(self.owner.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            bump([self.owner.pk])
+            self.assertEqual(current(self.owner.pk), version)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(current(self.owner.pk), version)
+
+    def test_owner_bump_refreshes_mailing_list_stats(self):
+        self.client.force_login(self.owner)
+        url = reverse("mailing:mailing_list")
+        self.assertEqual(self.client.get(url).context["total_mailings"], 1)
+
+        # bulk_create не вызывает сигналов: статистика остаётся в кеше до явного bump().
+        Mailing.objects.bulk_create([Mailing(owner=self.owner, message=self.message, **self.window())])
+        self.assertEqual(self.client.get(url).context["total_mailings"], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bump([self.owner.pk])
+        self.assertEqual(self.client.get(url).context["total_mailings"], 2)
+
+    def test_global_bump_refreshes_main_page(self):
+        url = reverse("mailing:index")
+        self.assertEqual(self.client.get(url).context["total_mailings"], 1)
+
+        other = User.objects.create(email="other@versions.test")
+        Mailing.objects.bulk_create([Mailing(owner=other, message=self.message, **self.window())])
+        self.assertEqual(self.client.get(url).context["total_mailings"], 1)
+
+        # Рассылка другого пользователя меняет общее поколение, от которого зависит страница гостя.
+        with self.captureOnCommitCallbacks(execute=True):
+            bump([other.pk])
+        self.assertEqual(self.client.get(url).context["total_mailings"], 2)
+
+    def window(self) -> dict:
+        now = timezone.now()
+        return {"start_time": now - timedelta(hours=1), "end_time": now + timedelta(hours=1)}
+
+
+class RollupTests(TestCase):
+    """
+    rollup_mailing_logs: каждая строка MailingLog учитывается в почасовой и посуточной сводке ровно один раз,
+    свежие логи ждут settle секунд, --rebuild даёт те же сводки.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        owner = User.objects.create(email="owner@rollup.test")
+        message = Message.objects.create(subject="Тема", body="Текст", owner=owner)
+        cls.mailing = Mailing.objects.create(
+            owner=owner, message=message, start_time=now - timedelta(days=3), end_time=now + timedelta(hours=1)
+        )
+        cls.clients = Client.objects.bulk_create(
+            Client(email=f"c{index}@rollup.test", owner=owner) for index in range(5)
+        )
+        # Попытки за последние трое суток с шагом 5 часов: несколько часов и суток, оба статуса.
+        cls.add_logs(30, now - timedelta(days=3))
+
+    @classmethod
+    def add_logs(cls, count: int, since) -> None:
+        MailingLog.objects.bulk_create(
+            MailingLog(
+                mailing=cls.mailing,
+                client=cls.clients[index % len(cls.clients)],
+                status="failed" if index % 4 == 0 else "success",
+                server_response="",
+                attempt_time=since + timedelta(hours=index * 2.5),
+            )
+            for index in range(count)
+        )
+
+    def rollup(self, *args) -> int:
+        out = StringIO()
+        call_command("rollup_mailing_logs", *args, stdout=out)
+        return int(out.getvalue().strip().rstrip(".").rsplit(" ", 1)[-1])
+
+    def totals(self) -> dict:
+        return dict(DeliveryRollup.objects.values_list("period").annotate(total=Sum("count")).order_by())
+
+    def rows(self) -> set:
+        return set(DeliveryRollup.objects.values_list("period", "mailing_id", "bucket", "status", "count"))
+
+    def test_totals_match_logs(self):
+        total = MailingLog.objects.count()
+
+        self.assertEqual(self.rollup("--settle", "0", "--chunk-size", "7"), total)
+        self.assertEqual(self.rollup("--settle", "0"), 0)
+        self.assertEqual(self.totals(), {"hour": total, "day": total})
+
+    def test_settle_defers_fresh_logs(self):
+        total = MailingLog.objects.count()
+
+        # Первый запуск только запоминает текущий максимум id, повторный до истечения settle ничего не берёт.
+        self.assertEqual(self.rollup("--settle", "60"), 0)
+        self.assertEqual(self.rollup("--settle", "60"), 0)
+
+        RollupWatermark.objects.update(seen_at=timezone.now() - timedelta(seconds=61))
+        self.add_logs(3, timezone.now() - timedelta(minutes=5))
+
+        # Учитываются логи до замеченного максимума, новые ждут следующего замера.
+        self.assertEqual(self.rollup("--settle", "60"), total)
+        self.assertEqual(self.rollup("--settle", "60"), 0)
+
+        RollupWatermark.objects.update(seen_at=timezone.now() - timedelta(seconds=61))
+        self.assertEqual(self.rollup("--settle", "60"), 3)
+        self.assertEqual(self.totals(), {"hour": total + 3, "day": total + 3})
+
+    def test_rebuild_gives_same_rollups(self):
+        self.rollup("--settle", "0", "--chunk-size", "4")
+        rows = self.rows()
+
+        self.assertEqual(self.rollup("--rebuild"), MailingLog.objects.count())
+        self.assertEqual(self.rows(), rows)
+
+
+class SchedulerTests(TestCase):
+    """
+    MailingScheduler: событие start срабатывает один раз в start_time, изменение интервала переносит события,
+    в том числе если строка зафиксирована после опроса, удалённые и завершённые рассылки из кучи выпадают.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        cls.owner = User.objects.create(email="owner@scheduler.test")
+        cls.message = Message.objects.create(subject="Тема", body="Текст", owner=cls.owner)
+
+    def setUp(self):
+        self.started: list[int] = []
+        self.finished: list[int] = []
+        self.scheduler = MailingScheduler(
+            on_start=lambda mailing: self.started.append(mailing.id),
+            on_finish=lambda mailing: self.finished.append(mailing.id),
+            poll_interval=30,
+        )
+
+    def create_mailing(self, start_in: timedelta, duration: timedelta = timedelta(hours=1)) -> Mailing:
+        return Mailing.objects.create(
+            owner=self.owner,
+            message=self.message,
+            start_time=self.now + start_in,
+            end_time=self.now + start_in + duration,
+        )
+
+    def run_due_at(self, moment) -> int:
+        with mock.patch("django.utils.timezone.now", return_value=moment):
+            return self.scheduler.run_due()
+
+    def test_start_fires_once_at_start_time(self):
+        mailing = self.create_mailing(timedelta(hours=1))
+        self.scheduler.refresh()
+
+        self.assertEqual(self.run_due_at(mailing.start_time - timedelta(seconds=1)), 0)
+        self.assertEqual(self.run_due_at(mailing.start_time), 1)
+        self.assertEqual(self.run_due_at(mailing.start_time + timedelta(seconds=1)), 0)
+
+        # Повторный опрос перечитывает строку из перекрытия, но не планирует её заново.
+        self.scheduler.refresh()
+        self.assertEqual(self.run_due_at(mailing.start_time + timedelta(minutes=1)), 0)
+        self.assertEqual(self.started, [mailing.id])
+
+        self.assertEqual(self.run_due_at(mailing.end_time), 1)
+        self.assertEqual(self.finished, [mailing.id])
+        self.assertEqual(self.scheduler._heap, [])
+
+    def test_edited_window_reschedules(self):
+        mailing = self.create_mailing(timedelta(hours=1))
+        old_start = mailing.start_time
+        self.scheduler.refresh()
+
+        mailing.start_time = self.now + timedelta(hours=2)
+        mailing.end_time = self.now + timedelta(hours=3)
+        mailing.save()
+        self.scheduler.refresh()
+
+        self.assertEqual(self.run_due_at(old_start), 0)
+        self.assertEqual(self.run_due_at(mailing.start_time), 1)
+        self.assertEqual(self.started, [mailing.id])
+
+    def test_late_committed_edit_is_seen_by_overlapping_poll(self):
+        mailing = self.create_mailing(timedelta(hours=1))
+        self.scheduler.refresh()
+
+        # Транзакция зафиксировалась после опроса, но updated_at у строки раньше отметки опроса.
+        new_start = self.now + timedelta(hours=2)
+        Mailing.objects.filter(pk=mailing.pk).update(
+            start_time=new_start,
+            end_time=new_start + timedelta(hours=1),
+            updated_at=self.scheduler._watermark - timedelta(seconds=10),
+        )
+        self.scheduler.refresh()
+
+        self.assertEqual(self.run_due_at(mailing.start_time), 0)
+        self.assertEqual(self.run_due_at(new_start), 1)
+        self.assertEqual(self.started, [mailing.id])
+
+    def test_deleted_and_finished_mailings_are_dropped(self):
+        deleted = self.create_mailing(timedelta(hours=1))
+        finished = self.create_mailing(timedelta(hours=1))
+        self.scheduler.refresh()
+        self.assertEqual(set(self.scheduler._schedule), {deleted.id, finished.id})
+
+        Mailing.objects.filter(pk=finished.pk).update(status="finished", updated_at=timezone.now())
+        deleted.delete()
+        self.scheduler.refresh()
+        self.assertNotIn(finished.id, self.scheduler._schedule)
+
+        self.assertEqual(self.run_due_at(self.now + timedelta(hours=3)), 0)
+        self.assertEqual((self.started, self.finished), ([], []))
+        self.assertEqual(self.scheduler._schedule, {})
+
+
+class MetricsAccessTests(TestCase):
+    """/metrics: с токеном - только по Bearer-токену, без токена - только с localhost или при DEBUG."""
+
+    url = reverse_lazy("mailing:metrics")
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_token_required(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(self.url, headers={"Authorization": "Bearer wrong"}).status_code, 403)
+        self.assertEqual(self.client.get(self.url, headers={"Authorization": "Bearer secret"}).status_code, 200)
+
+    @override_settings(METRICS_TOKEN="", DEBUG=False)
+    def test_without_token_only_local(self):
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR="127.0.0.1").status_code, 200)
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR="203.0.113.5").status_code, 403)
+
+    @override_settings(METRICS_TOKEN="", DEBUG=True)
+    def test_without_token_in_debug(self):
+        self.assertEqual(self.client.get(self.url, REMOTE_ADDR="203.0.113.5").status_code, 200)
+
+
+class SendPathTests(TestCase):
+    """
+    Отправка рассылки через локальный SmtpSink: синхронный движок с одним соединением и пулом потоков,
+    асинхронный движок, буфер логов и очередь отправки. Итоги run_mailing сверяются с тем,
+    что принял и отклонил сервер, и со строками MailingLog и MailingStats.
+    """
+
+    recipients = 30
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.owner = User.objects.create(email="owner@send.test")
+        message = Message.objects.create(subject="Новости", body="Здравствуйте, {{ client.name }}!", owner=cls.owner)
+        cls.mailing = Mailing.objects.create(
+            owner=cls.owner, message=message, start_time=now - timedelta(minutes=1), end_time=now + timedelta(hours=1)
+        )
+        clients = Client.objects.bulk_create(
+            Client(email=f"c{index}@send.test", name=f"Клиент {index}", owner=cls.owner)
+            for index in range(cls.recipients)
+        )
+        cls.mailing.clients.set(clients)
+
+    def setUp(self):
+        cache.clear()
+
+    @staticmethod
+    def smtp_settings(sink: SmtpSink) -> override_settings:
+        return override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST=sink.host,
+            EMAIL_PORT=sink.port,
+            EMAIL_HOST_USER="",
+            EMAIL_HOST_PASSWORD="",
+            EMAIL_USE_TLS=False,
+            EMAIL_USE_SSL=False,
+        )
+
+    def send(self, failure_rate: float = 0.0, **options) -> tuple[dict, SmtpSink]:
+        with SmtpSink(failure_rate=failure_rate, seed=0) as sink, self.smtp_settings(sink):
+            # Ошибки отправки пишутся в лог с трассировкой: перехватываем, чтобы не засорять вывод тестов.
+            with self.assertLogs("mailing", level="INFO"):
+                result = run_mailing(self.mailing, **options)
+        return result, sink
+
+    def assert_recorded(self, result: dict, sink: SmtpSink) -> None:
+        self.assertTrue(result["ok"], result["error"])
+        self.assertEqual(result["total"], self.recipients)
+        self.assertEqual((result["success"], result["failed"]), (sink.messages_received, sink.messages_rejected))
+
+        logs = MailingLog.objects.filter(mailing=self.mailing).aggregate(
+            success=Count("id", filter=Q(status="success")),
+            failed=Count("id", filter=Q(status="failed")),
+        )
+        self.assertEqual(logs, {"success": result["success"], "failed": result["failed"]})
+
+        stats = MailingStats.objects.get(mailing=self.mailing)
+        self.assertEqual(
+            (stats.attempts, stats.success, stats.failed),
+            (self.recipients, result["success"], result["failed"]),
+        )
+
+    @override_settings(MAILING_MESSAGES_PER_CONNECTION=500)
+    def test_sync_reuses_connection(self):
+        result, sink = self.send(engine="sync", workers=1)
+
+        self.assert_recorded(result, sink)
+        self.assertEqual(result["success"], self.recipients)
+        self.assertEqual((result["engine"], result["workers"]), ("sync", 1))
+        self.assertEqual(result["connections"], 1)
+        self.assertEqual(result["messages_per_connection"], self.recipients)
+        self.assertEqual(sink.connections, 1)
+
+    @override_settings(MAILING_MESSAGES_PER_CONNECTION=10)
+    def test_sync_reopens_connection_after_limit(self):
+        result, sink = self.send(engine="sync", workers=1)
+
+        self.assert_recorded(result, sink)
+        self.assertEqual(result["connections"], 3)
+        self.assertEqual(sink.connections, 3)
+
+    def test_sync_workers(self):
+        result, sink = self.send(failure_rate=0.3, engine="sync", workers=3)
+
+        self.assert_recorded(result, sink)
+        self.assertGreater(result["failed"], 0)
+        self.assertEqual((result["engine"], result["workers"]), ("sync", 3))
+        # Соединение на поток, а не на письмо; отказ сервера после DATA не рвёт соединение.
+        self.assertLessEqual(result["connections"], 3)
+        self.assertEqual(sink.connections, result["connections"])
+
+    @override_settings(MAILING_ASYNC_CONCURRENCY=4, MAILING_LOG_FLUSH_SIZE=7)
+    def test_async_engine(self):
+        result, sink = self.send(failure_rate=0.3, engine="async")
+
+        self.assert_recorded(result, sink)
+        self.assertGreater(result["failed"], 0)
+        self.assertEqual((result["engine"], result["workers"]), ("async", 4))
+        self.assertLessEqual(result["connections"], 4)
+        self.assertEqual(sink.connections, result["connections"])
+
+    def test_log_buffer_flushes_by_size_and_on_exit(self):
+        client_ids = list(self.mailing.clients.values_list("id", flat=True)[:4])
+
+        with MailingLogBuffer(flush_size=3, flush_interval=float("inf")) as log_buffer:
+            log_buffer.add(self.mailing.id, client_ids[0], "success", "OK")
+            log_buffer.add(self.mailing.id, client_ids[1], "failed", "554")
+            self.assertFalse(MailingLog.objects.exists())
+
+            log_buffer.add(self.mailing.id, client_ids[2], "success", "OK")
+            self.assertEqual(MailingLog.objects.count(), 3)
+
+            log_buffer.add(self.mailing.id, client_ids[3], "success", "OK")
+            self.assertEqual(MailingLog.objects.count(), 3)
+
+        self.assertEqual(MailingLog.objects.count(), 4)
+        self.assertEqual(log_buffer.written, 4)
+        stats = MailingStats.objects.get(mailing=self.mailing)
+        self.assertEqual((stats.attempts, stats.success, stats.failed), (4, 3, 1))
+
+    def test_log_buffer_flushes_by_interval(self):
+        client_id = self.mailing.clients.values_list("id", flat=True).first()
+
+        with MailingLogBuffer(flush_size=100, flush_interval=0) as log_buffer:
+            log_buffer.add(self.mailing.id, client_id, "success", "OK")
+            self.assertEqual(MailingLog.objects.count(), 1)
+
+    def test_enqueue_twice_does_not_duplicate(self):
+        self.assertEqual(enqueue_mailing(self.mailing)["total"], self.recipients)
+        self.assertEqual(enqueue_mailing(self.mailing)["total"], self.recipients)
+
+        self.assertEqual(self.mailing.outbox.filter(status="pending").count(), self.recipients)
+
+    @override_settings(MAILING_OUTBOX_LEASE=300)
+    def test_claim_batch_reclaims_after_lease(self):
+        enqueue_mailing(self.mailing)
+
+        claimed = claim_batch("worker-a", batch_size=self.recipients)
+        self.assertEqual(len(claimed), self.recipients)
+        self.assertEqual(claim_batch("worker-b"), [])
+
+        # Воркер worker-a «упал»: срок аренды его строк истёк.
+        self.mailing.outbox.filter(locked_by="worker-a").update(locked_at=timezone.now() - timedelta(seconds=301))
+
+        reclaimed = claim_batch("worker-b", batch_size=self.recipients)
+        self.assertEqual([row.id for row in reclaimed], [row.id for row in claimed])
+        self.assertTrue(all(row.locked_by == "worker-b" and row.attempts == 2 for row in reclaimed))
+
+    def test_outbox_skips_removed_recipient_and_finishes_progress(self):
+        enqueue_mailing(self.mailing)
+        removed = self.mailing.clients.first()
+        self.mailing.clients.remove(removed)
+
+        with SmtpSink() as sink, self.smtp_settings(sink), ManagedConnection() as transport:
+            with self.assertLogs("mailing", level="INFO"):
+                result = process_batch(claim_batch("worker-a", batch_size=self.recipients), transport)
+
+        self.assertEqual((result["success"], result["skipped"]), (self.recipients - 1, 1))
+        self.assertEqual(sink.messages_received, self.recipients - 1)
+        self.assertEqual(self.mailing.outbox.get(client=removed).status, "skipped")
+
+        progress = get_progress(self.mailing.id)
+        self.assertEqual((progress["sent"], progress["skipped"]), (self.recipients - 1, 1))
+        self.assertTrue(progress["done"])
+
+
+class PersonalizationTests(TestCase):
+    """
+    Подстановки полей клиента в CompiledTemplate, подписанный токен отписки и отписка по нему:
+    клиент пропадает из получателей и из очереди отправки, в том числе после повторного добавления в рассылку.
+    """
+
+    recipient = (7, "anna@personal.test", "Анна")
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        owner = User.objects.create(email="owner@personal.test")
+        cls.message = Message.objects.create(subject="Для {{ client.name }}", body="Текст", owner=owner)
+        cls.mailing = Mailing.objects.create(
+            owner=owner, message=cls.message, start_time=now - timedelta(minutes=1), end_time=now + timedelta(hours=1)
+        )
+        cls.clients = Client.objects.bulk_create(
+            Client(email=f"c{index}@personal.test", name=f"Клиент {index}", owner=owner) for index in range(3)
+        )
+        cls.mailing.clients.set(cls.clients)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_compiled_template_fields(self):
+        template = CompiledTemplate("{{ client.name }} <{{client.email}}>, id {{  client.id  }}")
+
+        self.assertFalse(template.static)
+        self.assertEqual(template.render(self.recipient), "Анна <anna@personal.test>, id 7")
+
+    def test_unsubscribe_url_field(self):
+        url = CompiledTemplate("{{ unsubscribe_url }}").render(self.recipient)
+
+        self.assertTrue(url.endswith(reverse("mailing:unsubscribe", args=[unsubscribe_token(7)])))
+
+    def test_unknown_and_malformed_placeholders_stay_as_is(self):
+        text = "{{ client.phone }} {{ client.name {{ }} {client.name} {{ client.name }}"
+        template = CompiledTemplate(text)
+
+        self.assertEqual(template.render(self.recipient), "{{ client.phone }} {{ client.name {{ }} {client.name} Анна")
+        self.assertTrue(CompiledTemplate("{{ client.phone }}").static)
+
+    def test_message_plan_recompiles_edited_message(self):
+        plan = message_plan(self.message)
+        self.assertIs(message_plan(self.message), plan)
+
+        self.message.subject = "Новая тема"
+        self.assertEqual(message_plan(self.message).render(self.recipient), ("Новая тема", "Текст"))
+
+    def test_token_round_trip(self):
+        self.assertEqual(client_id_from_token(unsubscribe_token(42)), 42)
+
+    def test_tampered_token_is_404(self):
+        token = unsubscribe_token(self.clients[0].pk)
+        forged = f"{self.clients[1].pk}:{token.split(':', 1)[1]}"
+
+        for bad in (forged, token[:-1] + ("a" if token[-1] != "a" else "b"), "garbage"):
+            with self.subTest(token=bad), self.assertLogs("django.request", level="WARNING"):
+                self.assertEqual(self.client.get(reverse("mailing:unsubscribe", args=[bad])).status_code, 404)
+                self.assertEqual(self.client.post(reverse("mailing:unsubscribe", args=[bad])).status_code, 404)
+
+        self.assertIsNone(Client.objects.get(pk=self.clients[1].pk).unsubscribed_at)
+
+    def test_unsubscribe_excludes_client(self):
+        client = self.clients[0]
+
+        with self.assertLogs("mailing", level="INFO"):
+            enqueue_mailing(self.mailing)
+            response = self.client.post(reverse("mailing:unsubscribe", args=[unsubscribe_token(client.pk)]))
+        self.assertEqual(response.status_code, 200)
+
+        client.refresh_from_db()
+        self.assertIsNotNone(client.unsubscribed_at)
+        self.assertEqual(self.mailing.outbox.get(client=client).status, "skipped")
+        self.assertEqual(get_progress(self.mailing.id)["skipped"], 1)
+
+        # Отписка сохраняется и после повторного добавления клиента в рассылку.
+        self.mailing.clients.add(client)
+        recipients = [row[0] for chunk in iter_recipient_chunks(self.mailing.id) for row in chunk]
+        self.assertEqual(recipients, [other.pk for other in self.clients[1:]])
+
+        with self.assertLogs("mailing", level="INFO"):
+            enqueue_mailing(self.mailing)
+        self.assertFalse(self.mailing.outbox.filter(client=client, status="pending").exists())
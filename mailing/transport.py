@@ -0,0 +1,193 @@
+import logging
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from smtplib import SMTPServerDisconnected
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+
+from .mime import Envelope
+
+logger = logging.getLogger("mailing")
+
+# Наблюдатели отправки: вызываются с длительностью SMTP-отправки одного письма в секундах
+# (включая переподключения), в том числе для неудачных попыток.
+_send_observers: list[Callable[[float], None]] = []
+
+
+def add_send_observer(observer: Callable[[float], None]) -> None:
+    _send_observers.append(observer)
+
+
+def remove_send_observer(observer: Callable[[float], None]) -> None:
+    _send_observers.remove(observer)
+
+
+def observe_send(duration: float) -> None:
+    for observer in _send_observers:
+        observer(duration)
+
+
+def _connections_stats(connections: list["ManagedConnection"]) -> dict:
+    opened = sum(connection.connections_opened for connection in connections)
+    sent = sum(connection.messages_sent for connection in connections)
+
+    return {
+        "connections": opened,
+        "messages_per_connection": round(sent / opened, 1) if opened else 0,
+    }
+
+
+class ManagedConnection:
+    """
+    Одно SMTP-соединение на серию писем.
+
+    Соединение открывается при первой отправке и переиспользуется, пока через него не пройдёт
+    max_messages писем; после этого оно переоткрывается. При обрыве соединения выполняется
+    переподключение и повторная попытка отправки того же письма.
+    """
+
+    def __init__(self, max_messages: int | None = None, max_reconnects: int = 1):
+        self.max_messages = max_messages or settings.MAILING_MESSAGES_PER_CONNECTION
+        self.max_reconnects = max_reconnects
+        self.backend = None
+        self.connections_opened = 0
+        self.messages_sent = 0
+        self._messages_on_connection = 0
+
+    def open(self) -> None:
+        if self.backend is not None:
+            return
+
+        # Бэкенд сохраняется только после успешного подключения: при ошибке (DNS, отказ, авторизация)
+        # следующая отправка снова попытается подключиться, а не пойдёт в полуоткрытое соединение.
+        backend = get_connection(fail_silently=False)
+        backend.open()
+        self.backend = backend
+        self.connections_opened += 1
+        self._messages_on_connection = 0
+
+    def close(self) -> None:
+        if self.backend is None:
+            return
+
+        try:
+            self.backend.close()
+        except Exception as exc:
+            logger.warning("Ошибка при закрытии SMTP-соединения: %s", exc)
+        finally:
+            self.backend = None
+
+    def send(self, message: EmailMessage | Envelope) -> int:
+        """
+        Отправляет одно письмо через текущее соединение. Возвращает число отправленных писем (0 или 1).
+        Envelope с готовыми байтами отправляется напрямую через smtplib, минуя сборку MIME в бэкенде.
+        """
+        if self.backend is not None and self._messages_on_connection >= self.max_messages:
+            self.close()
+
+        attempt = 0
+        started = time.perf_counter()
+        try:
+            while True:
+                try:
+                    self.open()
+                    sent = self._send(message)
+                except (SMTPServerDisconnected, ConnectionError) as exc:
+                    self.close()
+                    if attempt >= self.max_reconnects:
+                        raise
+                    attempt += 1
+                    logger.warning("SMTP-соединение разорвано (%s), переподключение", exc)
+                    continue
+
+                self._messages_on_connection += 1
+                self.messages_sent += 1
+                return sent
+        finally:
+            observe_send(time.perf_counter() - started)
+
+    def _send(self, message: EmailMessage | Envelope) -> int:
+        if isinstance(message, Envelope):
+            self.backend.connection.sendmail(message.from_email, message.recipients, message.payload)
+            return 1
+
+        return self.backend.send_messages([message])
+
+    def send_batch(self, messages: list[EmailMessage | Envelope]) -> list[tuple[int, Exception | None]]:
+        """
+        Отправляет пачку писем через одно соединение.
+        Для каждого письма возвращает пару (число отправленных, исключение или None).
+        """
+        results = []
+        for message in messages:
+            try:
+                results.append((self.send(message), None))
+            except Exception as exc:
+                results.append((0, exc))
+        return results
+
+    def stats(self) -> dict:
+        return _connections_stats([self])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ThreadedSender:
+    """
+    Параллельная отправка пачек писем в пуле потоков.
+
+    У каждого потока пула своё ManagedConnection, поэтому SMTP-сессии не разделяются между потоками.
+    Интерфейс совпадает с ManagedConnection: send_batch, stats, close.
+    """
+
+    def __init__(self, workers: int, max_messages: int | None = None):
+        self.workers = workers
+        self.max_messages = max_messages
+        self._local = threading.local()
+        self._connections: list[ManagedConnection] = []
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mailing-send")
+
+    def _connection(self) -> ManagedConnection:
+        connection = getattr(self._local, "connection", None)
+
+        if connection is None:
+            connection = self._local.connection = ManagedConnection(max_messages=self.max_messages)
+            with self._lock:
+                self._connections.append(connection)
+
+        return connection
+
+    def _send(self, message: EmailMessage | Envelope) -> tuple[int, Exception | None]:
+        try:
+            return self._connection().send(message), None
+        except Exception as exc:
+            return 0, exc
+
+    def send_batch(self, messages: list[EmailMessage | Envelope]) -> list[tuple[int, Exception | None]]:
+        """Отправляет пачку писем параллельно; порядок результатов совпадает с порядком писем."""
+        return list(self._executor.map(self._send, messages))
+
+    def stats(self) -> dict:
+        with self._lock:
+            return _connections_stats(list(self._connections))
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,13 +1,14 @@
 from django.urls import path
 
 from mailing.views.clients import (ClientCreateView, ClientDeleteView, ClientDetailView, ClientListView,
-                                   ClientUpdateView)
+                                   ClientUnsubscribeView, ClientUpdateView)
 from mailing.views.mailing_logs import MailingLogListView
 from mailing.views.mailings import (MailingCreateView, MailingDeleteView, MailingDetailView, MailingListView,
-                                    MailingRunView, MailingUpdateView)
+                                    MailingProgressView, MailingRunView, MailingUpdateView)
 from mailing.views.main import MailingTemplateView
 from mailing.views.messages import (MessageCreateView, MessageDeleteView, MessageDetailView, MessageListView,
                                     MessageUpdateView)
+from mailing.views.metrics import MetricsView
 
 app_name = "mailing"
 
@@ -18,6 +19,7 @@ urlpatterns = [
     path("client/<int:pk>/update/", ClientUpdateView.as_view(), name="client_update"),
     path("client/<int:pk>/delete/", ClientDeleteView.as_view(), name="client_delete"),
     path("client/create/", ClientCreateView.as_view(), name="client_create"),
+    path("unsubscribe/<str:token>/", ClientUnsubscribeView.as_view(), name="unsubscribe"),
     path("message/", MessageListView.as_view(), name="message_list"),
     path("message/<int:pk>/", MessageDetailView.as_view(), name="message_detail"),
     path("message/<int:pk>/update/", MessageUpdateView.as_view(), name="message_update"),
@@ -29,5 +31,7 @@ urlpatterns = [
     path("mailing/<int:pk>/delete/", MailingDeleteView.as_view(), name="mailing_delete"),
     path("mailing/create/", MailingCreateView.as_view(), name="mailing_create"),
     path("mailing/<int:pk>/run/", MailingRunView.as_view(), name="mailing_run"),
+    path("mailing/<int:pk>/progress/", MailingProgressView.as_view(), name="mailing_progress"),
     path("mailing/log/", MailingLogListView.as_view(), name="mailing_log"),
+    path("metrics", MetricsView.as_view(), name="metrics"),
 ]
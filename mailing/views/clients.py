@@ -1,10 +1,24 @@
+import logging
+from collections import Counter
+
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core import signing
+from django.db import transaction
+from django.http import Http404
+from django.shortcuts import get_object_or_404, render
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.views import View
 from django.views.generic import CreateView, DeleteView, DetailView, ListView, UpdateView
 
+from mailing.cache_versions import bump
 from mailing.forms import ClientForm
 from mailing.mixins import OwnerAccessMixin, OwnerQuerysetMixin
-from mailing.models import Client
+from mailing.models import Client, Mailing, OutboxMessage
+from mailing.personalization import client_id_from_token
+from mailing.progress import record_progress
+
+logger = logging.getLogger("mailing")
 
 
 class ClientListView(LoginRequiredMixin, OwnerQuerysetMixin, ListView):
@@ -46,3 +60,52 @@ class ClientDeleteView(LoginRequiredMixin, OwnerAccessMixin, DeleteView):
     model = Client
     template_name = "mailing/client_confirm_delete.html"
     success_url = reverse_lazy("mailing:client_list")
+
+
+class ClientUnsubscribeView(View):
+    """
+    Отписка клиента по ссылке {{ unsubscribe_url }} из письма: GET показывает подтверждение,
+    POST исключает клиента из всех рассылок. Вход не требуется, клиент определяется по подписанному токену.
+    """
+
+    template_name = "mailing/client_unsubscribe.html"
+
+    def get_client(self, token: str) -> Client:
+        try:
+            client_id = client_id_from_token(token)
+        except signing.BadSignature:
+            raise Http404("Ссылка отписки недействительна")
+        return get_object_or_404(Client, pk=client_id)
+
+    def get(self, request, token):
+        return render(request, self.template_name, {"client": self.get_client(token), "unsubscribed": False})
+
+    def post(self, request, token):
+        client = self.get_client(token)
+
+        with transaction.atomic():
+            # Отписка сохраняется у клиента: рассылки и очередь отправки пропускают его и после
+            # повторного добавления в рассылку. Массовые DELETE и UPDATE не вызывают сигналов,
+            # поэтому кеш статистики владельца сбрасывается явно.
+            Client.objects.filter(pk=client.pk, unsubscribed_at__isnull=True).update(unsubscribed_at=timezone.now())
+            removed, _ = Mailing.clients.through.objects.filter(client_id=client.pk).delete()
+            pending = dict(
+                OutboxMessage.objects.select_for_update()
+                .filter(client_id=client.pk, status="pending")
+                .values_list("id", "mailing_id")
+            )
+            cancelled = OutboxMessage.objects.filter(id__in=pending).update(status="skipped")
+            cancelled_per_mailing = Counter(pending.values())
+            bump([client.owner_id])
+
+        # Отменённые письма засчитываются в прогресс как пропущенные, иначе он не дойдёт до total.
+        for mailing_id, count in cancelled_per_mailing.items():
+            record_progress(mailing_id, skipped=count)
+
+        logger.info(
+            "Клиент id=%s отписался от рассылок (удалено связей: %s, отменено писем в очереди: %s)",
+            client.pk,
+            removed,
+            cancelled,
+        )
+        return render(request, self.template_name, {"client": client, "unsubscribed": True})
@@ -1,9 +1,13 @@
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.cache import cache
-from django.db.models import Count, Max, Q
+from django.db.models import F
 from django.views.generic import ListView
 
+from mailing.cache_versions import current
 from mailing.models import Mailing, MailingLog
+from mailing.rollups import daily_history
+from mailing.stale_cache import cached_value
+from mailing.stats import count_deliveries
 
 
 class MailingLogListView(LoginRequiredMixin, ListView):
@@ -12,7 +16,7 @@ class MailingLogListView(LoginRequiredMixin, ListView):
     context_object_name = "mailing_log"
     paginate_by = 6
 
-    cache_timeout = 120
+    history_days = 30
 
     def get_queryset(self):
         """
@@ -31,87 +35,70 @@ class MailingLogListView(LoginRequiredMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        qs = getattr(self, "object_list", None) or self.get_queryset()
         user = self.request.user
+        view_all = user.has_perm("mailing.can_view_all_mailings")
+        cache_version = current(None if view_all else user.pk)
         cache_prefix = self._get_cache_prefix(user)
 
-        counters = cache.get(f"{cache_prefix}:counters")
-
-        if counters is None:
-            total_attempts = qs.count()
-            success_count = qs.filter(status="success").count()
-            failed_count = qs.filter(status="failed").count()
-
-            if total_attempts:
-                success_rate = round(success_count / total_attempts * 100)
-                failed_rate = 100 - success_rate
-            else:
-                success_rate = 0
-                failed_rate = 0
-
-            if user.has_perm("mailing.can_view_all_mailings"):
-                total_mailings = Mailing.objects.count()
-            else:
-                total_mailings = Mailing.objects.filter(owner=user).count()
-
-            counters = {
-                "total_mailings": total_mailings,
-                "total_messages": success_count,
-                "successful_attempts": success_count,
-                "failed_attempts": failed_count,
-                "success_rate": success_rate,
-                "failed_rate": failed_rate,
-            }
-
-            cache.set(f"{cache_prefix}:counters", counters, self.cache_timeout)
-
-        mailings_stats = cache.get(f"{cache_prefix}:mailings_stats")
-
-        if mailings_stats is None:
-            mailings_stats_qs = (
-                Mailing.objects.filter(mailinglog__in=qs)
-                .distinct()
-                .annotate(
-                    total_attempts=Count("mailinglog"),
-                    success_count=Count(
-                        "mailinglog",
-                        filter=Q(mailinglog__status="success"),
-                    ),
-                    failed_count=Count(
-                        "mailinglog",
-                        filter=Q(mailinglog__status="failed"),
-                    ),
-                    last_attempt_time=Max("mailinglog__attempt_time"),
-                )
-                .select_related("message")
+        sections = {
+            "counters": lambda: count_deliveries(self._get_mailings(user)),
+            "mailings_stats": lambda: self._get_mailings_stats(user),
+            "last_attempts": lambda: list(self.object_list.order_by("-attempt_time")[:10]),
+            # История по дням читается из суточных сводок: не больше строки на день и статус на рассылку.
+            "history": lambda: daily_history(None if view_all else user, days=self.history_days),
+        }
+        values = {
+            section: cached_value(
+                f"mailing_logs_{section}",
+                f"{cache_prefix}:{section}",
+                compute,
+                settings.STATS_CACHE_TIMEOUT,
+                version=cache_version,
             )
+            for section, compute in sections.items()
+        }
 
-            mailings_stats = list(mailings_stats_qs)
-
-            for mailing in mailings_stats:
-                if mailing.total_attempts:
-                    mailing.success_rate = round(mailing.success_count / mailing.total_attempts * 100)
-                else:
-                    mailing.success_rate = 0
-
-            cache.set(f"{cache_prefix}:mailings_stats", mailings_stats, self.cache_timeout)
-
-        last_attempts = cache.get(f"{cache_prefix}:last_attempts")
-
-        if last_attempts is None:
-            last_attempts = list(qs.order_by("-attempt_time")[:10])
-            cache.set(f"{cache_prefix}:last_attempts", last_attempts, self.cache_timeout)
+        # Устаревшие значения, отданные на время пересчёта, во фрагменты шаблона не кешируются.
+        fresh = all(cached.fresh for cached in values.values())
 
+        context.update(values.pop("counters").value)
+        context.update({section: cached.value for section, cached in values.items()})
         context.update(
             {
-                **counters,
-                "mailings_stats": mailings_stats,
-                "last_attempts": last_attempts,
+                "history_days": self.history_days,
+                "cache_version": cache_version,
+                "cache_timeout": settings.STATS_CACHE_TIMEOUT if fresh else 0,
             }
         )
 
         return context
 
+    def _get_mailings_stats(self, user) -> list[Mailing]:
+        # Итоги по каждой рассылке берутся из MailingStats: одна строка на рассылку вместо подсчёта логов.
+        mailings_stats = list(
+            self._get_mailings(user)
+            .filter(delivery_stats__attempts__gt=0)
+            .annotate(
+                total_attempts=F("delivery_stats__attempts"),
+                success_count=F("delivery_stats__success"),
+                failed_count=F("delivery_stats__failed"),
+                last_attempt_time=F("delivery_stats__last_attempt_time"),
+            )
+            .select_related("message")
+        )
+
+        for mailing in mailings_stats:
+            mailing.success_rate = round(mailing.success_count / mailing.total_attempts * 100)
+
+        return mailings_stats
+
+    @staticmethod
+    def _get_mailings(user):
+        if user.has_perm("mailing.can_view_all_mailings"):
+            return Mailing.objects.all()
+
+        return Mailing.objects.filter(owner=user)
+
     @staticmethod
     def _get_cache_prefix(user) -> str:
         if user.has_perm("mailing.can_view_all_mailings"):
@@ -1,19 +1,26 @@
 import logging
 
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.cache import cache
-from django.db.models import Count, Q
+from django.core.exceptions import PermissionDenied
+from django.db.models import Count
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.urls import reverse_lazy
 from django.utils import timezone
 from django.views import View
 from django.views.generic import CreateView, DeleteView, DetailView, ListView, UpdateView
 
+from mailing.cache_versions import current
+from mailing.delivery_stats import mailing_counts
 from mailing.forms import MailingForm
 from mailing.mixins import OwnerAccessMixin, OwnerQuerysetMixin
 from mailing.models import Mailing, MailingLog
-from mailing.services import run_mailing
+from mailing.outbox import enqueue_mailing
+from mailing.progress import get_progress
+from mailing.stale_cache import cached_value
+from mailing.stats import count_mailings
 
 logger = logging.getLogger("mailing")
 
@@ -24,56 +31,37 @@ class MailingListView(LoginRequiredMixin, OwnerQuerysetMixin, ListView):
     context_object_name = "mailings"
     paginate_by = 6
 
-    cache_timeout = 60
-
     def get_queryset(self):
         """
-        Возвращаем рассылки текущего пользователя (или все для менеджера)
-        и обновляем статус КАЖДОГО объекта только в памяти (save=False),
-        чтобы не делать лишние UPDATE-запросы к БД при открытии списка.
-
-        Фактическое сохранение статуса в БД происходит:
-        - в детальном представлении (MailingDetailView),
-        - при запуске рассылки (run_mailing).
+        Рассылки текущего пользователя (или все для менеджера) со статусом effective_status,
+        вычисленным в SQL по интервалу отправки: список фильтруется, считается и разбивается
+        на страницы в БД, в Python загружается только текущая страница.
         """
-        qs = (
-            super()
-            .get_queryset()
+        self.mailings = super().get_queryset()
+        return (
+            self.mailings.with_effective_status()
             .select_related("message")
-            .prefetch_related("clients")
             .annotate(clients_count=Count("clients", distinct=True))
         )
 
-        for mailing in qs:
-            mailing.update_status(save=False)
-
-        return qs
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        qs = self.object_list
         now = timezone.now()
         user = self.request.user
 
-        cache_key = self._get_cache_key(user)
-
-        stats = cache.get(cache_key)
-
-        if stats is None:
-            stats = {
-                "total_mailings": qs.count(),
-                "created_mailings": qs.filter(status="created").count(),
-                "started_mailings": qs.filter(status="started").count(),
-                "finished_mailings": qs.filter(status="finished").count(),
-                "active_mailings": qs.filter(
-                    status="started",
-                    start_time__lte=now,
-                    end_time__gte=now,
-                ).count(),
-            }
-            cache.set(cache_key, stats, self.cache_timeout)
+        cache_version = current(user.pk)
+        stats = cached_value(
+            "mailing_list",
+            self._get_cache_key(user),
+            lambda: count_mailings(self.mailings, now),
+            settings.STATS_CACHE_TIMEOUT,
+            version=cache_version,
+        )
 
-        context.update(stats)
+        context.update(stats.value)
+        context["cache_version"] = cache_version
+        # Устаревшее значение, отданное на время пересчёта, во фрагмент шаблона не кешируется.
+        context["cache_timeout"] = settings.STATS_CACHE_TIMEOUT if stats.fresh else 0
 
         context["now"] = now
         return context
@@ -140,7 +128,7 @@ class MailingRunView(LoginRequiredMixin, View):
             mailing.id,
             request.user.id,
         )
-        result = run_mailing(mailing)
+        result = enqueue_mailing(mailing)
 
         if not result["ok"]:
             logger.warning(
@@ -150,16 +138,33 @@ class MailingRunView(LoginRequiredMixin, View):
                 result.get("error", ""),
             )
             messages.error(request, result["error"])
-        else:
-            messages.success(
-                request,
-                (
-                    f"Рассылка запущена. Всего клиентов: {result['total']}, "
-                    f"успешно: {result['success']}, с ошибками: {result['failed']}."
-                ),
-            )
+            return redirect("mailing:mailing_list")
+
+        messages.success(
+            request,
+            (
+                f"Рассылка поставлена в очередь. Всего клиентов: {result['total']}. "
+                "Ход отправки отображается на странице рассылки."
+            ),
+        )
+
+        return redirect("mailing:mailing_detail", pk=pk)
 
-        return redirect("mailing:mailing_list")
+
+class MailingProgressView(LoginRequiredMixin, View):
+    """Прогресс отправки рассылки в JSON по счётчикам в кеше; страница рассылки опрашивает его периодически."""
+
+    def get(self, request, pk):
+        owner_id = Mailing.objects.filter(pk=pk).values_list("owner_id", flat=True).first()
+
+        if owner_id is None:
+            raise Http404
+
+        user = request.user
+        if owner_id != user.pk and not user.is_superuser and not user.has_perm("mailing.can_view_all_mailings"):
+            raise PermissionDenied
+
+        return JsonResponse(get_progress(pk))
 
 
 class MailingDetailView(LoginRequiredMixin, OwnerQuerysetMixin, DetailView):
@@ -167,10 +172,8 @@ class MailingDetailView(LoginRequiredMixin, OwnerQuerysetMixin, DetailView):
     template_name = "mailing/mailing_detail.html"
     context_object_name = "mailing"
 
-    def get_object(self, queryset=None):
-        obj = super().get_object()
-        obj.update_status()
-        return obj
+    def get_queryset(self):
+        return super().get_queryset().with_effective_status().select_related("message", "delivery_stats")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -181,22 +184,19 @@ class MailingDetailView(LoginRequiredMixin, OwnerQuerysetMixin, DetailView):
         before_window = mailing.start_time > now
         after_window = mailing.end_time < now
 
-        can_run = not interval_invalid and not before_window and not after_window and mailing.status != "finished"
+        can_run = (
+            not interval_invalid and not before_window and not after_window and mailing.effective_status != "finished"
+        )
 
         logs_qs = MailingLog.objects.filter(mailing=mailing).select_related("client").order_by("-attempt_time")
 
-        stats = logs_qs.aggregate(
-            total=Count("id"),
-            success=Count("id", filter=Q(status="success")),
-            failed=Count("id", filter=Q(status="failed")),
-        )
-
         context["logs"] = logs_qs
-        context["stats"] = stats
+        context["stats"] = mailing_counts(mailing)
         context["interval_invalid"] = interval_invalid
         context["before_window"] = before_window
         context["after_window"] = after_window
         context["can_run"] = can_run
+        context["progress"] = get_progress(mailing.pk)
         context["now"] = now
 
         return context
@@ -1,46 +1,38 @@
-from django.core.cache import cache
-from django.utils import timezone
+from django.conf import settings
 from django.views.generic import TemplateView
 
+from mailing.cache_versions import current
 from mailing.models import Client, Mailing
+from mailing.stale_cache import cached_value
+from mailing.stats import dashboard_counts
 
 
 class MailingTemplateView(TemplateView):
     template_name = "mailing/index.html"
 
-    cache_timeout = 120
-
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.request.user
 
-        cache_key = self._get_cache_key(user)
-
-        stats = cache.get(cache_key)
-
-        if stats is None:
-            now = timezone.now()
-
-            if not user.is_authenticated or getattr(user, "is_manager", False):
-                mailings_qs = Mailing.objects.filter(owner__is_manager=False)
-                clients_qs = Client.objects.filter(owner__is_manager=False)
-            else:
-                mailings_qs = Mailing.objects.filter(owner=user)
-                clients_qs = Client.objects.filter(owner=user)
-
-            stats = {
-                "total_mailings": mailings_qs.count(),
-                "active_mailings": mailings_qs.filter(
-                    status="started",
-                    start_time__lte=now,
-                    end_time__gte=now,
-                ).count(),
-                "unique_clients": clients_qs.count(),
-            }
-
-            cache.set(cache_key, stats, self.cache_timeout)
-
-        context.update(stats)
+        is_global = not user.is_authenticated or getattr(user, "is_manager", False)
+        # Менеджер и гость видят данные всех пользователей и зависят от общего поколения.
+        cache_version = current(None if is_global else user.pk)
+
+        def compute():
+            if is_global:
+                return dashboard_counts(
+                    Mailing.objects.filter(owner__is_manager=False), Client.objects.filter(owner__is_manager=False)
+                )
+            return dashboard_counts(Mailing.objects.filter(owner=user), Client.objects.filter(owner=user))
+
+        stats = cached_value(
+            "dashboard", self._get_cache_key(user), compute, settings.STATS_CACHE_TIMEOUT, version=cache_version
+        )
+
+        context.update(stats.value)
+        context["cache_version"] = cache_version
+        # Устаревшее значение, отданное на время пересчёта, во фрагмент шаблона не кешируется.
+        context["cache_timeout"] = settings.STATS_CACHE_TIMEOUT if stats.fresh else 0
 
         return context
 
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.views import View
+
+from mailing.metrics import registry
+
+LOCAL_ADDRESSES = ("127.0.0.1", "::1")
+
+
+class MetricsView(View):
+    """
+    Метрики в текстовом формате Prometheus. При заданном METRICS_TOKEN требуется Bearer-токен,
+    без токена метрики отдаются только с локального адреса или при DEBUG.
+    """
+
+    def get(self, request):
+        token = settings.METRICS_TOKEN
+        if token:
+            allowed = constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}")
+        else:
+            allowed = settings.DEBUG or request.META.get("REMOTE_ADDR") in LOCAL_ADDRESSES
+        if not allowed:
+            return HttpResponseForbidden()
+
+        return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,13 +1,15 @@
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, permission_required, user_passes_test
 from django.contrib.auth.mixins import LoginRequiredMixin, PermissionRequiredMixin
-from django.db.models import Count, Q
+from django.db.models import Count
 from django.shortcuts import get_object_or_404, redirect
 from django.utils import timezone
 from django.views import View
 from django.views.generic import DetailView, ListView, TemplateView
 
+from mailing.delivery_stats import mailing_counts
 from mailing.models import Client, Mailing, MailingLog
+from mailing.stats import count_mailings, count_users
 from users.mixins import ManagerRequiredMixin
 from users.models import User
 
@@ -22,15 +24,8 @@ class ManagerDashboardView(ManagerRequiredMixin, TemplateView):
 
         users_qs = User.objects.filter(is_manager=False).exclude(is_staff=True, is_superuser=True)
 
-        context["total_users"] = users_qs.count()
-        context["blocked_users"] = users_qs.filter(is_active=False).count()
-        context["active_users"] = users_qs.filter(is_active=True).count()
-
-        mailings_qs = Mailing.objects.filter(owner__is_manager=False)
-        context["total_mailings"] = mailings_qs.count()
-
-        context["active_mailings"] = mailings_qs.filter(status="started").count()
-        context["disabled_mailings"] = mailings_qs.exclude(status="started").count()
+        context.update(count_users(users_qs))
+        context.update(count_mailings(Mailing.objects.filter(owner__is_manager=False)))
 
         return context
 
@@ -100,7 +95,9 @@ class ManagerUserDetailView(PermissionRequiredMixin, ManagerRequiredMixin, Detai
         user = self.object
 
         context["last_clients"] = Client.objects.filter(owner=user).order_by("-id")[:5]
-        context["last_mailings"] = Mailing.objects.filter(owner=user).order_by("-id")[:5]
+        context["last_mailings"] = (
+            Mailing.objects.filter(owner=user).with_effective_status().select_related("message").order_by("-id")[:5]
+        )
 
         return context
 
@@ -134,16 +131,15 @@ class ManagerMailingsListView(PermissionRequiredMixin, ManagerRequiredMixin, Lis
     permission_required = "mailing.can_view_all_mailings"
 
     def get_queryset(self):
-        return Mailing.objects.all().prefetch_related("clients").select_related("message")
+        return (
+            Mailing.objects.with_effective_status()
+            .select_related("message")
+            .annotate(clients_count=Count("clients", distinct=True))
+        )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        mailings_qs = self.get_queryset()
-
-        context["total_mailings"] = mailings_qs.count()
-        context["started_mailings"] = mailings_qs.filter(status="started").count()
-        context["finished_mailings"] = mailings_qs.filter(status="finished").count()
-
+        context.update(count_mailings(Mailing.objects.all()))
         return context
 
 
@@ -155,11 +151,8 @@ class ManagerMailingDetailView(PermissionRequiredMixin, ManagerRequiredMixin, De
     context_object_name = "mailing"
     permission_required = ("mailing.can_view_all_mailings", "mailing.can_disable_mailings")
 
-    def get_object(self, queryset=None):
-        obj = super().get_object(queryset)
-        # как и у обычного пользователя — динамически обновляем статус
-        obj.update_status()
-        return obj
+    def get_queryset(self):
+        return Mailing.objects.with_effective_status().select_related("message", "delivery_stats")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -173,14 +166,8 @@ class ManagerMailingDetailView(PermissionRequiredMixin, ManagerRequiredMixin, De
 
         logs_qs = MailingLog.objects.filter(mailing=mailing).select_related("client").order_by("-attempt_time")
 
-        stats = logs_qs.aggregate(
-            total=Count("id"),
-            success=Count("id", filter=Q(status="success")),
-            failed=Count("id", filter=Q(status="failed")),
-        )
-
         context["logs"] = logs_qs
-        context["stats"] = stats
+        context["stats"] = mailing_counts(mailing)
         context["interval_invalid"] = interval_invalid
         context["before_window"] = before_window
         context["after_window"] = after_window
@@ -198,7 +185,7 @@ class ManagerMailingDisableView(LoginRequiredMixin, PermissionRequiredMixin, Vie
         mailing = get_object_or_404(Mailing, pk=pk)
 
         mailing.end_time = timezone.now()
-        mailing.save(update_fields=["end_time"])
+        mailing.save(update_fields=["end_time", "updated_at"])
         mailing.update_status()
         messages.success(request, "Рассылка была отключена менеджером.")
 